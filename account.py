@@ -38,17 +38,13 @@ def logout_callback():
 
 def get_user_favorites_count(user_id):
     """Count the number of favorite recipes for a user from reviews_df"""
-    if 'reviews_df' not in st.session_state:
+    if st.session_state.get('rating_index') is None:
         return 0
     
     try:
-        # Assuming reviews_df has columns: 'user_id' and 'rating'
-        # Count recipes with rating >= 4 as favorites
-        user_reviews = st.session_state.reviews_df[
-            (st.session_state.reviews_df['user_id'] == user_id) & 
-            (st.session_state.reviews_df['rating'] >= 4)
-        ]
-        return len(user_reviews)
+        # Count recipes with rating >= 4 as favorites, only the user's row of the rating index is read
+        _, ratings = st.session_state.rating_index.user_ratings(user_id)
+        return int((ratings >= 4).sum())
     except Exception as e:
         st.error(f"Error counting favorites: {e}")
         return 0
@@ -13,6 +13,12 @@ from firebase_admin import credentials, firestore, auth
 from datetime import datetime, timezone
 import json
 from dotenv import load_dotenv
+from prediction_store import save_predictions, save_top_k, quantization_report, PRECISIONS
+from neighbor_index import save_neighbors
+from ann_index import build_ann_index
+from factorization import train_als, predict_pairs, save_factors, FACTORS, REGULARIZATION, ITERATIONS
+from data_loader import get_registry, get_page_cache, publish_reviews, publish_artifacts
+from data_schema import apply_schema, REVIEWS_SCHEMA, SchemaError
 
 # Load environment variables from .env (for local use)
 load_dotenv()
@@ -136,43 +142,78 @@ def RMSE(prediction, ground_truth, test_data):
 
     return rmse
 
-def user_basedCF():
+def baseline_split(reviews_df):
+    """
+    Baseline center the ratings, rating - (user mean + recipe mean - global mean), and split
+    them into a stratified train and test set, users with fewer than 20 ratings only in train.
+    Returns (reviews_df, train_data, test_data, mu), the frames with an 'adjusted_rating' column.
+    """
+    # work on a copy, the shared reviews_df must not be modified in place
+    reviews_df = reviews_df[['user_id', 'recipe_id', 'rating']].copy()
+    # Compute adjusted rating (modifies the copy in-place)
+    mu = reviews_df['rating'].mean()
+    reviews_df['user_mean'] = reviews_df['user_id'].map(reviews_df.groupby('user_id')['rating'].mean())
+    reviews_df['recipe_mean'] = reviews_df['recipe_id'].map(reviews_df.groupby('recipe_id')['rating'].mean())
+    reviews_df['adjusted_rating'] = reviews_df['rating'] - (reviews_df['user_mean'] + reviews_df['recipe_mean'] - mu)
+    # Cleanup (in-place)
+    reviews_df.drop(columns=['user_mean', 'recipe_mean'], inplace=True)
+    #st.write(reviews_df.head(3))
+
+    # Split dataset into training and test dataset
+    #start_time = time.time()  # Start timer
+    # Ensure minimum 20 interactions before splitting
+    reviews_filtered = reviews_df.groupby('user_id').filter(lambda x: len(x) >= 20)
+
+    # Create stratified split
+    splitter = StratifiedShuffleSplit(n_splits=1, test_size=0.2)
+
+    # Assign stratified train-test indices
+    train_indices, test_indices = next(splitter.split(reviews_filtered, reviews_filtered['user_id']))
+
+    # Create train and test sets
+    train_data = reviews_filtered.iloc[train_indices]
+    test_data = reviews_filtered.iloc[test_indices]
+
+    # Append users with < 20 interactions entirely to train_data
+    train_data = pd.concat([train_data, reviews_df[~reviews_df['user_id'].isin(reviews_filtered['user_id'])]])
+    #st.write(train_data.head(5))
+    #end_time = time.time()  # End timer
+    #print(f"Train-test split took {end_time - start_time:.4f} seconds")
+    # Display results
+    #print(f"Train size: {train_data.shape[0]}, Test size: {test_data.shape[0]}")
+    return reviews_df, train_data, test_data, mu
+
+def train_matrix_factorization(factors=FACTORS, reg=REGULARIZATION, iterations=ITERATIONS):
     try:
         with st.spinner("training model..."):
             start_time = time.time()
-            reviews_df = st.session_state.reviews_df
-            # Compute adjusted rating (modifies DataFrame in-place)
-            mu = reviews_df['rating'].mean()
-            reviews_df['user_mean'] = reviews_df['user_id'].map(reviews_df.groupby('user_id')['rating'].mean())
-            reviews_df['recipe_mean'] = reviews_df['recipe_id'].map(reviews_df.groupby('recipe_id')['rating'].mean())
-            reviews_df['adjusted_rating'] = reviews_df['rating'] - (reviews_df['user_mean'] + reviews_df['recipe_mean'] - mu)
-            # Cleanup (in-place)
-            reviews_df.drop(columns=['user_mean', 'recipe_mean'], inplace=True)
-            #st.write(reviews_df.head(3))
-
-            # Split dataset into training and test dataset
-            #start_time = time.time()  # Start timer
-            # Ensure minimum 20 interactions before splitting
-            reviews_filtered = reviews_df.groupby('user_id').filter(lambda x: len(x) >= 20)
-
-            # Create stratified split
-            splitter = StratifiedShuffleSplit(n_splits=1, test_size=0.2)
-
-            # Assign stratified train-test indices
-            train_indices, test_indices = next(splitter.split(reviews_filtered, reviews_filtered['user_id']))
-
-            # Create train and test sets
-            train_data = reviews_filtered.iloc[train_indices]
-            test_data = reviews_filtered.iloc[test_indices]
-
-            # Append users with < 20 interactions entirely to train_data
-            train_data = pd.concat([train_data, reviews_df[~reviews_df['user_id'].isin(reviews_filtered['user_id'])]])
-            #st.write(train_data.head(5))
-            #end_time = time.time()  # End timer
-            #print(f"Train-test split took {end_time - start_time:.4f} seconds")
-            # Display results
-            #print(f"Train size: {train_data.shape[0]}, Test size: {test_data.shape[0]}")
+            reviews_df, train_data, test_data, mu = baseline_split(st.session_state.reviews_df)
+            n_users = reviews_df['user_id'].nunique()
+            n_items = reviews_df['recipe_id'].nunique()
+            # factorize the baseline adjusted ratings, scores are comparable to the CF predictions
+            user_factors, item_factors = train_als(train_data['user_id'].to_numpy(), train_data['recipe_id'].to_numpy(),
+                                                   train_data['adjusted_rating'].to_numpy(), n_users, n_items,
+                                                   factors, reg, iterations)
+            test_pred = predict_pairs(user_factors, item_factors, test_data['user_id'].to_numpy(), test_data['recipe_id'].to_numpy())
+            mf_RMSE = sqrt(mean_squared_error(test_pred, test_data['adjusted_rating'].to_numpy()))
+            # the rating baseline, to fold in ratings submitted after training
+            recipe_means = reviews_df.groupby('recipe_id')['rating'].mean().reindex(range(n_items), fill_value=mu).to_numpy()
+            publish_artifacts({
+                "mf_model": lambda path: save_factors(path, user_factors, item_factors, range(n_users), range(n_items),
+                                                      recipe_means, mu, reg),
+            })
+        st.write("Model Retrained Successfully")
+        st.write("matrix factorization (ALS) on baseline centered ratings: ", mf_RMSE)
+        st.write(f"Embedding size: {(user_factors.nbytes + item_factors.nbytes) / 1e6:.2f} MB")
+        st.write(f"Training time: {time.time() - start_time:.2f} seconds")
+    except Exception as e:
+        st.error("Model did not train successfully. Something went wrong.")
 
+def user_basedCF(precision="float64"):
+    try:
+        with st.spinner("training model..."):
+            start_time = time.time()
+            reviews_df, train_data, test_data, mu = baseline_split(st.session_state.reviews_df)
             # fill the user-item interaction with the baseline adjusted rating
             n_users = reviews_df['user_id'].nunique()
             n_items = reviews_df['recipe_id'].nunique()
@@ -206,23 +247,34 @@ def user_basedCF():
             user_RMSE_baseline_centered = RMSE(baseline_centered_user_pred, test_data_matrix, test_data)
             item_RMSE_baseline_centered = RMSE(baseline_centered_item_pred, test_data_matrix, test_data)
 
-            # change it to dataframe for saving to external file
-            user_pred_df = pd.DataFrame(baseline_centered_user_pred, columns = list(range(n_items)))
-            user_pred_df.insert(0, 'user_id', list(range(n_users)))
-            item_pred_df = pd.DataFrame(baseline_centered_item_pred, columns = list(range(n_items)))
-            item_pred_df.insert(0, 'user_id', list(range(n_users)))
-
-            # Create the folder if it doesn't exist
-            folder_path = "Data"
-            os.makedirs(folder_path, exist_ok=True)
-
-            # save as feather file type for faster reloading
-            user_pred_df.to_feather(os.path.join(folder_path, "user_pred.feather"))
-            item_pred_df.to_feather(os.path.join(folder_path, "item_pred.feather"))
+            # publish the memory-mappable prediction stores used for per-user lookups and the
+            # compact top-K recommendations served to users (rated recipes excluded) as one
+            # new version, running sessions switch to it on their next rerun
+            rated_users = reviews_df['user_id'].to_numpy()
+            rated_recipes = reviews_df['recipe_id'].to_numpy()
+            # the pruned top-k similarity graphs and the rating baseline, for scoring users at request time
+            recipe_means = reviews_df.groupby('recipe_id')['rating'].mean().reindex(range(n_items), fill_value=mu).to_numpy()
+            publish_artifacts({
+                "user_pred": lambda path: save_predictions(path, baseline_centered_user_pred, range(n_users), range(n_items), precision),
+                "item_pred": lambda path: save_predictions(path, baseline_centered_item_pred, range(n_users), range(n_items), precision),
+                "user_pred_topk": lambda path: save_top_k(path, baseline_centered_user_pred, range(n_users), range(n_items), rated_users, rated_recipes),
+                "item_pred_topk": lambda path: save_top_k(path, baseline_centered_item_pred, range(n_users), range(n_items), rated_users, rated_recipes),
+                "user_neighbors": lambda path: save_neighbors(path, user_similarity, range(n_users), range(n_items), recipe_means, mu),
+                "item_neighbors": lambda path: save_neighbors(path, item_similarity, range(n_items), range(n_items), recipe_means, mu),
+                # LSH index over the same centered rating columns the item similarity is computed from
+                "item_ann": lambda path: build_ann_index(path, train_data_matrix.T, range(n_items), recipe_means=recipe_means, global_mean=mu),
+            })
         st.write("Model Retrained Successfully")
         st.write("user-based collaborative filtering using baseline-centering method: ", user_RMSE_baseline_centered)
         st.write("item-based collaborative filtering using baseline centering method", item_RMSE_baseline_centered)
         st.write(f"Time taken show selected recipe: {time.time() - start_time:.2f} seconds")
+        if precision != "float64":
+            # check that the lower precision keeps the same top recommendations
+            st.write(f"Prediction storage precision: {precision}")
+            st.write("User-based predictions compared to full precision")
+            st.dataframe(quantization_report(baseline_centered_user_pred, ["float64", precision]), hide_index=True)
+            st.write("Item-based predictions compared to full precision")
+            st.dataframe(quantization_report(baseline_centered_item_pred, ["float64", precision]), hide_index=True)
     except Exception as e:
         st.error("Mode didnot train sucessfully. Something went wrong.")
 
@@ -250,16 +302,25 @@ def app():
             )
             df = None # initialize df
 
+            # memory used by the datasets shared between all sessions
+            with st.expander("Dataset Memory Usage"):
+                st.dataframe(get_registry().memory_report(), hide_index=True)
+            # Home recommendation pages cached per user, type and trained version
+            with st.expander("Recommendation Page Cache"):
+                st.dataframe(get_page_cache().stats(), hide_index=True)
+                if st.button("Clear Page Cache", help="e.g. after editing reviews, pages of other users are not invalidated by it"):
+                    get_page_cache().clear()
+
             # Load corresponding dataframe
             if dataset == "Recipes":
-                df = st.session_state.recipes_df
+                df = st.session_state.recipe_catalog.to_frame()
             elif dataset == "Reviews":
                 df = st.session_state.reviews_df.copy()
             elif dataset == "User Predictions":
-                df = st.session_state.user_pred_df
+                df = st.session_state.user_pred_store.to_frame()
                 df.columns = df.columns.astype(str)  # Convert integer columns to strings
             elif dataset == "Item Predictions":
-                df = st.session_state.item_pred_df
+                df = st.session_state.item_pred_store.to_frame()
                 df.columns = df.columns.astype(str)  # Convert integer columns to strings
 
             # Only show the grid if a valid dataset was selected (not the placeholder)
@@ -312,8 +373,14 @@ def app():
                         st.success("Changes detected!")
     
                         if st.button("Save Changes"):
-                            st.session_state.reviews_df = updated_df
-                            st.success("Changes saved successfully!")
+                            try:
+                                # edited cells come back from the grid untyped, restore the reviews schema
+                                updated_df = apply_schema(updated_df, REVIEWS_SCHEMA)
+                                st.session_state.reviews_df = updated_df
+                                publish_reviews(updated_df)
+                                st.success("Changes saved successfully!")
+                            except SchemaError as e:
+                                st.error(f"Invalid value: {e}")
     
                 # Add row functionality for Recipes and Reviews
                 if dataset == "Reviews":
@@ -327,19 +394,33 @@ def app():
     
                     if st.button("Add Record"):
                         if all(new_record.values()):  # Check all fields are filled
-                            updated_df = pd.concat([updated_df, pd.DataFrame([new_record])], ignore_index=True)
-                            if dataset == "Reviews":
-                                st.session_state.reviews_df = updated_df
-                            st.success("Record added successfully!")
-                            st.experimental_rerun()
+                            try:
+                                new_record_df = apply_schema(pd.DataFrame([new_record]), REVIEWS_SCHEMA)
+                                updated_df = pd.concat([apply_schema(updated_df, REVIEWS_SCHEMA), new_record_df], ignore_index=True)
+                                if dataset == "Reviews":
+                                    st.session_state.reviews_df = updated_df
+                                    publish_reviews(updated_df)
+                                st.success("Record added successfully!")
+                                st.experimental_rerun()
+                            except SchemaError as e:
+                                st.error(f"Invalid value: {e}")
                         else:
                             st.error("Please fill all fields")
 
         with tab2:
             st.subheader("Model Operations")
+            precision = st.selectbox("Prediction Storage Precision", PRECISIONS, index=0,
+                                     help="Lower precisions shrink the prediction files 2-8x, the overlap report shows if the rankings are kept")
             retrain = st.button("Model Retrain")
             if retrain:
-                user_basedCF()
+                user_basedCF(precision)
+
+            st.subheader("Matrix Factorization")
+            factors = st.number_input("Embedding Size", min_value=4, max_value=256, value=FACTORS, step=4)
+            reg = st.number_input("Regularization", min_value=0.0, max_value=10.0, value=REGULARIZATION, step=0.05)
+            iterations = st.number_input("ALS Iterations", min_value=1, max_value=100, value=ITERATIONS, step=1)
+            if st.button("Train Matrix Factorization"):
+                train_matrix_factorization(int(factors), reg, int(iterations))
 
         with tab3:
             st.subheader("Registered Users")
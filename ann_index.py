@@ -0,0 +1,229 @@
+import os
+import numpy as np
+from id_map import IdMap
+from neighbor_index import centered_ratings, NEIGHBORS, EXPLANATIONS, RECIPE_MEANS_FILE, GLOBAL_MEAN_FILE
+
+# files of an ANN index folder
+ITEM_IDS_FILE = "item_ids.npy"
+VECTORS_FILE = "vectors.npy"
+PLANES_FILE = "planes.npy"
+CODES_FILE = "codes.npy"
+BUCKET_ITEMS_FILE = "bucket_items.npy"
+NORMS_FILE = "norms.npy"
+
+# hash tables of the index, more tables find more true neighbors and cost more candidates
+LSH_TABLES = 8
+# items hashed to one bucket on average when the number of bits is picked automatically
+BUCKET_SIZE = 8
+# items queried at once by query_rows
+QUERY_BLOCK_SIZE = 256
+
+
+def normalize_rows(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return np.divide(vectors, norms, out=np.zeros_like(vectors), where=norms > 0)
+
+
+def hash_codes(vectors, planes):
+    """(tables, n) integer codes: bit b of table t is the side of hyperplane planes[t, :, b] a vector is on."""
+    bits = np.einsum('nd,tdb->tnb', vectors, planes) > 0
+    return (bits.astype(np.int64) << np.arange(planes.shape[2])).sum(axis=2)
+
+
+def build_ann_index(folder, vectors, item_ids, n_tables=LSH_TABLES, n_bits=None, recipe_means=None,
+                    global_mean=None, k=NEIGHBORS, seed=0):
+    """
+    Save a random hyperplane LSH index for cosine similarity over item vectors (one row
+    per item_ids entry, e.g. the rating matrix columns or embeddings). Items with the
+    same sign pattern against n_bits random hyperplanes share a bucket in each of the
+    n_tables tables. The normalized vectors are kept to rerank candidates exactly.
+    recipe_means and global_mean, the rating baseline, are needed for ann_item_scores,
+    which also normalizes every recipe's score by the sum of |similarity| over its own
+    approximate k nearest recipes, queried here once per item.
+    """
+    vectors = normalize_rows(vectors)
+    if n_bits is None:
+        n_bits = int(np.clip(np.round(np.log2(max(len(vectors), 1) / BUCKET_SIZE)), 1, 30))
+    planes = np.random.default_rng(seed).standard_normal((n_tables, vectors.shape[1], n_bits)).astype(np.float32)
+    # the table number goes above the code bits, so all tables sort into one array in which
+    # every bucket of every table is a contiguous run found by binary search
+    codes = (hash_codes(vectors, planes) + (np.arange(n_tables, dtype=np.int64) << n_bits)[:, None]).ravel()
+    order = np.argsort(codes, kind='stable')
+    os.makedirs(folder, exist_ok=True)
+    np.save(os.path.join(folder, ITEM_IDS_FILE), np.asarray(item_ids, dtype=np.int64))
+    np.save(os.path.join(folder, VECTORS_FILE), vectors)
+    np.save(os.path.join(folder, PLANES_FILE), planes)
+    np.save(os.path.join(folder, CODES_FILE), codes[order])
+    np.save(os.path.join(folder, BUCKET_ITEMS_FILE), (order % len(vectors)).astype(np.int32))
+    if recipe_means is not None:
+        np.save(os.path.join(folder, RECIPE_MEANS_FILE), np.asarray(recipe_means, dtype=np.float32))
+        np.save(os.path.join(folder, GLOBAL_MEAN_FILE), np.float32(global_mean))
+        index = AnnIndex(folder)
+        owners, _, sims = index.query_rows(np.arange(len(index)), k)
+        np.save(os.path.join(folder, NORMS_FILE), np.bincount(owners, weights=np.abs(sims), minlength=len(index)).astype(np.float32))
+
+
+class AnnIndex:
+    """
+    Approximate cosine nearest neighbors of items (see build_ann_index). A query
+    hashes the vector, reads its bucket and the buckets one bit away in every table,
+    and reranks only those candidates by exact cosine. The arrays are memory-mapped.
+    """
+
+    def __init__(self, folder):
+        self.folder = folder
+        self.recipe_ids = np.load(os.path.join(folder, ITEM_IDS_FILE))
+        # recipe_id -> row of the vectors
+        self.recipe_index = IdMap(self.recipe_ids)
+        # plain ndarray views of the maps, np.memmap indexing adds a lot of overhead to small reads
+        self.vectors = np.load(os.path.join(folder, VECTORS_FILE), mmap_mode='r').view(np.ndarray)
+        self.planes = np.load(os.path.join(folder, PLANES_FILE))
+        self.codes = np.load(os.path.join(folder, CODES_FILE), mmap_mode='r').view(np.ndarray)
+        self.bucket_items = np.load(os.path.join(folder, BUCKET_ITEMS_FILE), mmap_mode='r').view(np.ndarray)
+        self.recipe_means = None
+        if os.path.exists(os.path.join(folder, RECIPE_MEANS_FILE)):
+            self.recipe_means = np.load(os.path.join(folder, RECIPE_MEANS_FILE))
+            self.global_mean = float(np.load(os.path.join(folder, GLOBAL_MEAN_FILE)))
+        # sum of |similarity| over the approximate neighbors of every recipe, the normalization of its score
+        self.norms = None
+        if os.path.exists(os.path.join(folder, NORMS_FILE)):
+            self.norms = np.load(os.path.join(folder, NORMS_FILE))
+
+    def __len__(self):
+        return len(self.recipe_ids)
+
+    @property
+    def n_bits(self):
+        return self.planes.shape[2]
+
+    def nbytes(self):
+        """(resident, memory-mapped) bytes of the index."""
+        resident = self.recipe_index.nbytes() + self.planes.nbytes
+        if self.norms is not None:
+            resident += self.norms.nbytes
+        return resident, self.vectors.nbytes + self.codes.nbytes + self.bucket_items.nbytes
+
+    def candidates(self, vector, probe=True):
+        """Rows sharing a bucket with the vector in any table, or one bit away from it if probe."""
+        codes = hash_codes(np.asarray(vector, dtype=np.float32)[None, :], self.planes)[:, 0]
+        flips = np.concatenate([[0], 1 << np.arange(self.n_bits)]) if probe else np.zeros(1, dtype=np.int64)
+        tables = np.arange(len(codes), dtype=np.int64) << self.n_bits
+        probes = ((codes[:, None] ^ flips[None, :]) + tables[:, None]).ravel()
+        starts = np.searchsorted(self.codes, probes, side='left')
+        lengths = np.searchsorted(self.codes, probes, side='right') - starts
+        # positions of all probed buckets at once: every run start plus the offsets inside the run
+        offsets = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+        return np.unique(self.bucket_items[np.repeat(starts, lengths) + offsets])
+
+    def query_rows(self, rows, k, probe=True):
+        """
+        Approximate k nearest other items of many indexed items at once, as flat
+        (query position in rows, item row, cosine similarity) arrays, best first per query.
+        Blocks of queries hash, probe their buckets and rerank in one vectorized pass.
+        """
+        rows = np.asarray(rows, dtype=np.int64)
+        results = [self._query_block(rows[start:start + QUERY_BLOCK_SIZE], k, probe)
+                   for start in range(0, len(rows), QUERY_BLOCK_SIZE)]
+        if not results:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        owners = np.concatenate([owners + start for (owners, _, _), start in zip(results, range(0, len(rows), QUERY_BLOCK_SIZE))])
+        return owners, np.concatenate([r[1] for r in results]), np.concatenate([r[2] for r in results])
+
+    def _query_block(self, rows, k, probe):
+        vectors = np.asarray(self.vectors[rows])
+        codes = hash_codes(vectors, self.planes)
+        flips = np.concatenate([[0], 1 << np.arange(self.n_bits)]) if probe else np.zeros(1, dtype=np.int64)
+        tables = np.arange(len(codes), dtype=np.int64) << self.n_bits
+        # (queries, tables * probes) bucket codes
+        probes = ((codes[:, :, None] ^ flips[None, None, :]) + tables[:, None, None]).transpose(1, 0, 2).reshape(len(rows), -1)
+        starts = np.searchsorted(self.codes, probes.ravel(), side='left')
+        lengths = np.searchsorted(self.codes, probes.ravel(), side='right') - starts
+        offsets = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+        owners = np.repeat(np.repeat(np.arange(len(rows)), probes.shape[1]), lengths)
+        candidates = self.bucket_items[np.repeat(starts, lengths) + offsets].astype(np.int64)
+        # every (query, candidate) pair once, without the query item itself
+        pairs = np.unique(owners * len(self) + candidates)
+        owners, candidates = pairs // len(self), pairs % len(self)
+        keep = candidates != rows[owners]
+        owners, candidates = owners[keep], candidates[keep]
+        # one product with the distinct candidates of the block, instead of a vector per pair
+        distinct, inverse = np.unique(candidates, return_inverse=True)
+        sims = (vectors @ np.asarray(self.vectors[distinct]).T)[owners, inverse]
+        order = np.lexsort((-sims, owners))
+        owners, candidates, sims = owners[order], candidates[order], sims[order]
+        # the first k of every query
+        first = np.searchsorted(owners, np.arange(len(rows)))
+        best = np.arange(len(owners)) - first[owners] < k
+        return owners[best], candidates[best], sims[best]
+
+    def query(self, vector, k, exclude_row=None, probe=True):
+        """(rows, cosine similarities) of the approximate k nearest items of a vector, best first."""
+        vector = normalize_rows(np.asarray(vector)[None, :])[0]
+        rows = self.candidates(vector, probe)
+        if exclude_row is not None:
+            rows = rows[rows != exclude_row]
+        sims = np.asarray(self.vectors[rows]) @ vector
+        k = min(k, len(rows))
+        best = np.argpartition(-sims, k - 1)[:k] if 0 < k < len(rows) else np.arange(k)
+        best = best[np.argsort(-sims[best], kind='stable')]
+        return rows[best], sims[best]
+
+    def similar(self, recipe_id, k):
+        """(recipe_ids, similarities) of the approximate k most similar other recipes."""
+        row = self.recipe_index.index_of(recipe_id)
+        if row is None:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        rows, sims = self.query(self.vectors[row], k, exclude_row=row)
+        return self.recipe_ids[rows], sims
+
+
+def ann_item_scores(index, rating_index, user_id, k=NEIGHBORS):
+    """
+    Item-based predicted (centered) ratings from the ANN index: every recipe the user
+    rated passes its centered rating to its approximate k nearest recipes, weighted by
+    similarity, and each recipe's score is normalized by the sum of |similarity| over
+    its own approximate k nearest recipes, as the neighbor table does. The rated recipes
+    are queried in one batch, work grows with the user's ratings, not the catalog. Returns None if the user rated nothing the
+    index knows.
+    """
+    recipe_ids, ratings = rating_index.user_ratings(user_id)
+    if len(recipe_ids) == 0:
+        return None
+    centered, positions = centered_ratings(index, recipe_ids, ratings)
+    known = positions >= 0
+    if not known.any():
+        return None
+    owners, rows, sims = index.query_rows(positions[known], k)
+    numerator = np.bincount(rows, weights=sims * centered[known][owners], minlength=len(index))
+    return np.divide(numerator, index.norms, out=np.zeros(len(index)), where=index.norms > 0)
+
+
+def ann_item_explanations(index, rating_index, user_id, recipe_ids, n=EXPLANATIONS):
+    """
+    {recipe_id: rated recipe ids} of the n rated recipes that contributed most to the
+    item-based score of each given recipe, largest sim(j, i) * r(u, i) first, positive
+    contributions only, like item_based_explanations. The similarities are the exact
+    cosines of the index vectors, the similarities of the dense item-based predictions,
+    over all rated recipes instead of the pruned neighbor lists. One (given x rated)
+    product of vectors.
+    """
+    explanations = {int(recipe_id): [] for recipe_id in recipe_ids}
+    rated_ids, ratings = rating_index.user_ratings(user_id)
+    if len(rated_ids) == 0 or index.recipe_means is None:
+        return explanations
+    centered, rated_rows = centered_ratings(index, rated_ids, ratings)
+    known = rated_rows >= 0
+    rated_ids, centered, rated_rows = np.asarray(rated_ids)[known], centered[known], rated_rows[known]
+    rows = index.recipe_index.to_index(np.fromiter(explanations, dtype=np.int64, count=len(explanations)))
+    found = np.flatnonzero(rows >= 0)
+    if len(rated_ids) == 0 or len(found) == 0:
+        return explanations
+    contributions = (index.vectors[rows[found]] @ index.vectors[rated_rows].T) * centered
+    n = min(n, len(rated_ids))
+    best = np.argsort(-contributions, axis=1, kind='stable')[:, :n]
+    positive = np.take_along_axis(contributions, best, axis=1) > 0
+    recipe_ids = list(explanations)
+    for i, position in enumerate(found):
+        explanations[recipe_ids[position]] = rated_ids[best[i]][positive[i]].tolist()
+    return explanations
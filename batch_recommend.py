@@ -0,0 +1,106 @@
+"""
+Write the top-N recommendations of every user to a Parquet file, without the
+Streamlit app (e.g. for email digests or to warm downstream caches).
+Run from the project root, e.g.
+
+    python batch_recommend.py recommendations.parquet --dataset user_pred --top-n 20 --workers 4
+"""
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+import pyarrow as pa
+import pyarrow.parquet as pq
+from data_manifest import read_manifest, overlay_entry
+from data_schema import REVIEWS_SCHEMA, apply_schema
+from feather_io import read_feather
+from prediction_store import PredictionStore, TOPK_BLOCK_SIZE
+from rating_index import RatingIndex
+from recommendation_engine import recommend_block
+
+DATA_FOLDER = "Data"
+
+# per worker process state, set once by init_worker
+_store = None
+_rating_index = None
+
+
+def dataset_paths(data_folder, dataset):
+    """
+    (prediction store folder, its overlay of folded in rows or None, reviews file)
+    of the current manifest version.
+    """
+    datasets = read_manifest(data_folder)["datasets"]
+    if dataset not in datasets:
+        raise SystemExit(f"{dataset} is not in {data_folder}/manifest.json, train the model first")
+    overlay = overlay_entry(datasets, dataset)
+    return (os.path.join(data_folder, datasets[dataset]["path"]),
+            os.path.join(data_folder, overlay["path"]) if overlay is not None else None,
+            os.path.join(data_folder, datasets["reviews"]["path"]))
+
+
+def open_store(store_folder, overlay_folder):
+    store = PredictionStore(store_folder)
+    if overlay_folder is not None:
+        store.load_folded(overlay_folder)
+    return store
+
+
+def init_worker(store_folder, overlay_folder, reviews_path):
+    # every worker maps the same score matrix, only the rating index is built per process
+    global _store, _rating_index
+    _store = open_store(store_folder, overlay_folder)
+    _rating_index = RatingIndex.from_reviews(apply_schema(read_feather(reviews_path), REVIEWS_SCHEMA))
+
+
+def recommend_rows(start, stop, n):
+    return pa.Table.from_pandas(recommend_block(_store, _rating_index, slice(start, stop), n), preserve_index=False)
+
+
+def export_recommendations(out_path, store_folder, overlay_folder, reviews_path, n, workers, block_size=TOPK_BLOCK_SIZE):
+    """
+    Score every user block in a process pool and stream the results into one
+    Parquet file (user_id, rank, recipe_id, score), a row group per block.
+    Rows folded in by the app since training replace the trained ones, users
+    without a trained row are exported after the next training.
+    Returns the number of rows written.
+    """
+    n_users = len(PredictionStore(store_folder))
+    blocks = [(start, min(start + block_size, n_users)) for start in range(0, n_users, block_size)]
+    rows = 0
+    writer = None
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker,
+                             initargs=(store_folder, overlay_folder, reviews_path)) as pool:
+        futures = [pool.submit(recommend_rows, start, stop, n) for start, stop in blocks]
+        try:
+            # written in block order, so the file is sorted by store row
+            for future in futures:
+                table = future.result()
+                if writer is None:
+                    writer = pq.ParquetWriter(out_path, table.schema)
+                writer.write_table(table)
+                rows += table.num_rows
+        finally:
+            if writer is not None:
+                writer.close()
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("out", help="output Parquet file")
+    parser.add_argument("--dataset", default="user_pred", choices=["user_pred", "item_pred"])
+    parser.add_argument("--top-n", type=int, default=20)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--block-size", type=int, default=TOPK_BLOCK_SIZE, help="users scored per matrix operation")
+    parser.add_argument("--data-folder", default=DATA_FOLDER)
+    args = parser.parse_args()
+
+    store_folder, overlay_folder, reviews_path = dataset_paths(args.data_folder, args.dataset)
+    start_time = time.perf_counter()
+    rows = export_recommendations(args.out, store_folder, overlay_folder, reviews_path, args.top_n, args.workers, args.block_size)
+    print(f"Wrote {rows} recommendations from {store_folder} to {args.out} in {time.perf_counter() - start_time:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,699 @@
+"""
+Benchmarks for the data and recommendation layers.
+Run from the project root, e.g.
+
+    python benchmark.py prediction-lookup
+"""
+import argparse
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import time
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+from prediction_store import PredictionStore, save_predictions, quantization_report, PRECISIONS
+from data_schema import apply_schema, REVIEWS_SCHEMA, RECIPES_SCHEMA
+from recipe_catalog import RecipeCatalog
+from feather_io import read_feather, write_feather, CODECS
+from recommendation_engine import recommend, exclusion_mask, constraint_mask
+from rating_index import RatingIndex
+from neighbor_index import NeighborTable, save_neighbors, user_based_scores, item_based_scores, item_based_explanations
+from factorization import FactorModel, train_als, predict_pairs, save_factors
+from single_flight import SingleFlight
+from ann_index import AnnIndex, build_ann_index, normalize_rows, ann_item_scores
+from popularity import PopularityIndex
+from content_index import ContentIndex
+from concurrent.futures import ThreadPoolExecutor
+
+
+def time_per_call(func, args_list):
+    """Average wall time in milliseconds of func(*args) over args_list."""
+    start_time = time.perf_counter()
+    for args in args_list:
+        func(*args)
+    return (time.perf_counter() - start_time) * 1000 / len(args_list)
+
+
+def legacy_feather_lookup(path, user_id):
+    # the previous per-user prediction loader: read the user_id column, then the whole file
+    user_ids = pd.read_feather(path, columns=['user_id'])
+    row_index = user_ids[user_ids['user_id'] == user_id].index
+    return pd.read_feather(path).iloc[row_index]
+
+
+def bench_prediction_lookup(user_counts, n_items, n_lookups, seed=0):
+    """Per-user lookup latency of the prediction store as the number of users grows."""
+    rng = np.random.default_rng(seed)
+    print(f"{'users':>8} {'matrix MB':>10} {'store ms':>10} {'feather ms':>11}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for n_users in user_counts:
+            scores = rng.standard_normal((n_users, n_items))
+            folder = os.path.join(tmp, f"pred_{n_users}")
+            save_predictions(folder, scores, range(n_users), range(n_items))
+            feather_path = os.path.join(tmp, f"pred_{n_users}.feather")
+            pred_df = pd.DataFrame(scores, columns=[str(i) for i in range(n_items)])
+            pred_df.insert(0, 'user_id', np.arange(n_users))
+            pred_df.to_feather(feather_path)
+            del pred_df
+
+            store = PredictionStore(folder)
+            users = rng.integers(0, n_users, n_lookups)
+            store_ms = time_per_call(store.get_scores, [(u,) for u in users])
+            # the full read is slow, a few lookups are enough to show the trend
+            feather_ms = time_per_call(legacy_feather_lookup, [(feather_path, u) for u in users[:3]])
+            print(f"{n_users:>8} {scores.nbytes / 1e6:>10.1f} {store_ms:>10.3f} {feather_ms:>11.1f}")
+
+
+def legacy_recommendations(store, user_id, recipes_rated, top_n):
+    # the previous getRecommendations: one row frame, drop the rated columns, sort all columns
+    predicted_rating = pd.DataFrame(store.get_scores(user_id).reshape(1, -1), columns=store.recipe_ids.tolist())
+    predicted_rating.insert(0, 'user_id', [user_id])
+    predicted_rating.drop(columns=recipes_rated, inplace=True)
+    unrated_recipes = predicted_rating.iloc[:, 1:].sort_values(by=predicted_rating.index[0], axis=1, ascending=False)
+    return unrated_recipes.iloc[:, :top_n].to_dict(orient='records')[0]
+
+
+def engine_recommendations(store, user_id, recipes_rated, top_n):
+    return recommend(store.get_scores(user_id), store.recipe_ids, top_n, exclusion_mask(store.recipe_index, recipes_rated))
+
+
+def bench_top_n(item_counts, n_users, n_rated, top_n, n_lookups, seed=0):
+    """Per-request latency of the NumPy top-N engine against the DataFrame drop/sort path."""
+    rng = np.random.default_rng(seed)
+    print(f"{'recipes':>8} {'frame ms':>9} {'engine ms':>10} {'speedup':>8} {'same top-N':>11}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for n_items in item_counts:
+            folder = os.path.join(tmp, f"pred_{n_items}")
+            save_predictions(folder, rng.standard_normal((n_users, n_items)), range(n_users), range(n_items))
+            store = PredictionStore(folder)
+            requests = [(store, int(u), rng.choice(n_items, n_rated, replace=False).tolist(), top_n)
+                        for u in rng.integers(0, n_users, n_lookups)]
+            same = all(list(legacy_recommendations(*r)) == list(engine_recommendations(*r)) for r in requests)
+            frame_ms = time_per_call(legacy_recommendations, requests)
+            engine_ms = time_per_call(engine_recommendations, requests)
+            print(f"{n_items:>8} {frame_ms:>9.3f} {engine_ms:>10.3f} {frame_ms / engine_ms:>7.1f}x {str(same):>11}")
+
+
+def post_filter_recommendations(store, user_id, recipes_rated, allowed, top_n):
+    # over-fetch: rank every unrated recipe, then keep the allowed ones in Python until top_n are found
+    ranked = recommend(store.get_scores(user_id), store.recipe_ids, len(store.recipe_ids), exclusion_mask(store.recipe_index, recipes_rated))
+    allowed = set(allowed.tolist())
+    return dict([item for item in ranked.items() if item[0] in allowed][:top_n])
+
+
+def masked_recommendations(store, user_id, recipes_rated, allowed, top_n):
+    return recommend(store.get_scores(user_id), store.recipe_ids, top_n, constraint_mask(store.recipe_index, recipes_rated, allowed))
+
+
+def bench_constrained(item_counts, selectivities, n_users, n_rated, top_n, n_lookups, seed=0):
+    """Constrained top-N: the search matches as a mask over the score row against ranking everything and post-filtering."""
+    rng = np.random.default_rng(seed)
+    print(f"{'recipes':>8} {'matching':>9} {'post-filter ms':>15} {'mask ms':>8} {'speedup':>8} {'same top-N':>11}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for n_items in item_counts:
+            folder = os.path.join(tmp, f"pred_{n_items}")
+            save_predictions(folder, rng.standard_normal((n_users, n_items)), range(n_users), range(n_items))
+            store = PredictionStore(folder)
+            for selectivity in selectivities:
+                requests = [(store, int(u), rng.choice(n_items, n_rated, replace=False),
+                             np.flatnonzero(rng.random(n_items) < selectivity), top_n)
+                            for u in rng.integers(0, n_users, n_lookups)]
+                same = all(list(post_filter_recommendations(*r)) == list(masked_recommendations(*r)) for r in requests)
+                post_ms = time_per_call(post_filter_recommendations, requests)
+                mask_ms = time_per_call(masked_recommendations, requests)
+                print(f"{n_items:>8} {selectivity:>9.1%} {post_ms:>15.3f} {mask_ms:>8.3f} {post_ms / mask_ms:>7.1f}x {str(same):>11}")
+
+
+def folder_nbytes(folder):
+    return sum(os.path.getsize(os.path.join(folder, name)) for name in os.listdir(folder))
+
+
+def centered_rating_matrix(reviews_df):
+    # the baseline centered user x recipe matrix admin.user_basedCF trains on
+    mu = reviews_df['rating'].mean()
+    user_mean = reviews_df.groupby('user_id')['rating'].transform('mean')
+    recipe_mean = reviews_df.groupby('recipe_id')['rating'].transform('mean')
+    matrix = np.zeros((reviews_df['user_id'].max() + 1, reviews_df['recipe_id'].max() + 1))
+    matrix[reviews_df['user_id'], reviews_df['recipe_id']] = reviews_df['rating'] - (user_mean + recipe_mean - mu)
+    recipe_means = reviews_df.groupby('recipe_id')['rating'].mean().reindex(range(matrix.shape[1]), fill_value=mu)
+    return matrix, recipe_means.to_numpy(), mu
+
+
+def bench_neighbors(reviews_path, neighbor_counts, n_lookups, top_n, seed=0):
+    """Size, per-user latency and top-N agreement of request time neighbor scoring against dense predictions."""
+    from sklearn.metrics.pairwise import cosine_similarity
+    reviews_df = apply_schema(pd.read_feather(reviews_path), REVIEWS_SCHEMA)
+    rating_index = RatingIndex.from_reviews(reviews_df)
+    matrix, recipe_means, mu = centered_rating_matrix(reviews_df)
+    n_users, n_items = matrix.shape
+    similarities = {'user': cosine_similarity(matrix), 'item': cosine_similarity(matrix.T)}
+    dense = {
+        'user': similarities['user'].dot(matrix) / np.abs(similarities['user']).sum(axis=1)[:, None],
+        'item': matrix.dot(similarities['item']) / np.abs(similarities['item']).sum(axis=1)[None, :],
+    }
+    score_user = {'user': user_based_scores, 'item': item_based_scores}
+    users = np.random.default_rng(seed).integers(0, n_users, n_lookups)
+    print(f"{'graph':>6} {'k':>5} {'size MB':>8} {'dense MB':>9} {'ms/user':>8} {f'top{top_n} overlap':>14}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for kind, similarity in similarities.items():
+            dense_folder = os.path.join(tmp, f"{kind}_pred")
+            save_predictions(dense_folder, dense[kind], range(n_users), range(n_items))
+            dense_store = PredictionStore(dense_folder)
+            for k in neighbor_counts:
+                folder = os.path.join(tmp, f"{kind}_{k}")
+                n_rows = n_users if kind == 'user' else n_items
+                save_neighbors(folder, similarity, range(n_rows), range(n_items), recipe_means, mu, k)
+                table = NeighborTable(folder)
+                score_user[kind](table, rating_index, int(users[0]))  # builds the reverse graph once
+                args = [(table, rating_index, int(u)) for u in users]
+                latency_ms = time_per_call(score_user[kind], args)
+                overlap = []
+                for u in users:
+                    exclude = exclusion_mask(table.recipe_index, rating_index.rated_recipes(u))
+                    sparse_top = recommend(score_user[kind](table, rating_index, int(u)), table.recipe_ids, top_n, exclude)
+                    dense_top = recommend(dense_store.get_scores(int(u)), dense_store.recipe_ids, top_n, exclude)
+                    overlap.append(len(set(sparse_top) & set(dense_top)) / top_n)
+                print(f"{kind:>6} {k:>5} {folder_nbytes(folder) / 1e6:>8.2f} {folder_nbytes(dense_folder) / 1e6:>9.2f} "
+                      f"{latency_ms:>8.3f} {np.mean(overlap):>14.3f}")
+
+
+def item_based_top_n(table, rating_index, user_id, top_n):
+    scores = item_based_scores(table, rating_index, user_id)
+    return recommend(scores, table.recipe_ids, top_n, exclusion_mask(table.recipe_index, rating_index.rated_recipes(user_id)))
+
+
+def bench_explanations(reviews_path, top_ns, n_lookups, seed=0):
+    """Cost of the "because you rated" explanations of item-based recommendations against scoring them."""
+    from sklearn.metrics.pairwise import cosine_similarity
+    rng = np.random.default_rng(seed)
+    reviews_df = apply_schema(pd.read_feather(reviews_path), REVIEWS_SCHEMA)
+    rating_index = RatingIndex.from_reviews(reviews_df)
+    matrix, recipe_means, mu = centered_rating_matrix(reviews_df)
+    users = [int(u) for u in rng.integers(0, matrix.shape[0], n_lookups)]
+    print(f"{'top-N':>6} {'score ms':>9} {'explain ms':>11} {'us/item':>8} {'explained':>10}")
+    with tempfile.TemporaryDirectory() as tmp:
+        save_neighbors(tmp, cosine_similarity(matrix.T), range(matrix.shape[1]), range(matrix.shape[1]), recipe_means, mu)
+        table = NeighborTable(tmp)
+        for top_n in top_ns:
+            requests = [(table, rating_index, u, list(item_based_top_n(table, rating_index, u, top_n))) for u in users]
+            score_ms = time_per_call(item_based_top_n, [(table, rating_index, u, top_n) for u in users])
+            explain_ms = time_per_call(item_based_explanations, requests)
+            explained = np.mean([len(reasons) > 0 for r in requests for reasons in item_based_explanations(*r).values()])
+            print(f"{top_n:>6} {score_ms:>9.3f} {explain_ms:>11.3f} {explain_ms * 1000 / top_n:>8.1f} {explained:>10.1%}")
+
+
+def bench_factorization(reviews_path, factor_counts, n_lookups, top_n, seed=0):
+    """Training time, test RMSE, size and per-user serving latency of ALS embeddings against a dense store."""
+    reviews_df = apply_schema(pd.read_feather(reviews_path), REVIEWS_SCHEMA)
+    rating_index = RatingIndex.from_reviews(reviews_df)
+    matrix, recipe_means, mu = centered_rating_matrix(reviews_df)
+    n_users, n_items = matrix.shape
+    users, items = reviews_df['user_id'].to_numpy(), reviews_df['recipe_id'].to_numpy()
+    values = matrix[users, items]
+    rng = np.random.default_rng(seed)
+    test = rng.random(len(values)) < 0.2
+    lookups = rng.integers(0, n_users, n_lookups)
+
+    def serve(model, user_id):
+        exclude = exclusion_mask(model.recipe_index, rating_index.rated_recipes(user_id))
+        return recommend(model.get_scores(user_id), model.recipe_ids, top_n, exclude)
+
+    print(f"zero predictor test RMSE {np.sqrt(np.mean(values[test] ** 2)):.4f}")
+    print(f"{'model':>10} {'train s':>8} {'test RMSE':>10} {'size MB':>8} {'ms/user':>8}")
+    with tempfile.TemporaryDirectory() as tmp:
+        dense_folder = os.path.join(tmp, "dense")
+        save_predictions(dense_folder, np.random.default_rng(seed).random((n_users, n_items)), range(n_users), range(n_items))
+        dense_store = PredictionStore(dense_folder)
+        latency_ms = time_per_call(serve, [(dense_store, int(u)) for u in lookups])
+        print(f"{'dense':>10} {'':>8} {'':>10} {folder_nbytes(dense_folder) / 1e6:>8.2f} {latency_ms:>8.3f}")
+        for factors in factor_counts:
+            start_time = time.perf_counter()
+            user_factors, item_factors = train_als(users[~test], items[~test], values[~test], n_users, n_items, factors)
+            train_s = time.perf_counter() - start_time
+            rmse = np.sqrt(np.mean((predict_pairs(user_factors, item_factors, users[test], items[test]) - values[test]) ** 2))
+            folder = os.path.join(tmp, f"mf_{factors}")
+            save_factors(folder, user_factors, item_factors, range(n_users), range(n_items), recipe_means, mu)
+            model = FactorModel(folder)
+            latency_ms = time_per_call(serve, [(model, int(u)) for u in lookups])
+            print(f"{f'mf {factors}':>10} {train_s:>8.2f} {rmse:>10.4f} {folder_nbytes(folder) / 1e6:>8.2f} {latency_ms:>8.3f}")
+
+
+def bench_coalescing(reviews_path, recipes_path, session_counts):
+    """
+    Wall time and number of computations when N sessions hit the same cold
+    computation at once, each computing it or coalesced by a SingleFlight.
+    """
+    reviews_df = apply_schema(pd.read_feather(reviews_path), REVIEWS_SCHEMA)
+    computations = {
+        'popularity': lambda: PopularityIndex.from_reviews(reviews_df),
+        'catalog load': lambda: RecipeCatalog(recipes_path),
+    }
+    print(f"{'computation':>14} {'sessions':>9} {'mode':>13} {'computed':>9} {'wall ms':>9}")
+    for name, compute in computations.items():
+        for sessions in session_counts:
+            for mode in ("independent", "single-flight"):
+                flight = SingleFlight()
+                calls = []
+                def call():
+                    calls.append(1)
+                    return compute()
+                run = call if mode == "independent" else (lambda: flight.do(name, call))
+                with ThreadPoolExecutor(max_workers=sessions) as pool:
+                    start_time = time.perf_counter()
+                    list(pool.map(lambda _: run(), range(sessions)))
+                    wall_ms = (time.perf_counter() - start_time) * 1000
+                print(f"{name:>14} {sessions:>9} {mode:>13} {len(calls):>9} {wall_ms:>9.1f}")
+
+
+def exact_neighbors(vectors, row, k):
+    sims = vectors @ vectors[row]
+    sims[row] = -np.inf
+    best = np.argpartition(-sims, k - 1)[:k]
+    return best[np.argsort(-sims[best])]
+
+
+def bench_ann(reviews_path, synthetic_sizes, dims, table_counts, n_queries, k, seed=0):
+    """
+    Recall@k and per-query latency of the LSH index against exact cosine over all items,
+    for the rating matrix columns of the bundled reviews and clustered synthetic vectors.
+    """
+    rng = np.random.default_rng(seed)
+    reviews_df = apply_schema(pd.read_feather(reviews_path), REVIEWS_SCHEMA)
+    datasets = [("reviews", centered_rating_matrix(reviews_df)[0].T)]
+    for n_items in synthetic_sizes:
+        centers = rng.standard_normal((max(n_items // 100, 1), dims))
+        datasets.append(("synthetic", centers[rng.integers(0, len(centers), n_items)] + 0.3 * rng.standard_normal((n_items, dims))))
+    print(f"{'vectors':>10} {'items':>8} {'dims':>5} {'tables':>6} {'bits':>4} {'probe':>5} {f'recall@{k}':>9} "
+          f"{'candidates':>10} {'ann ms':>7} {'exact ms':>8} {'index MB':>8}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, vectors in datasets:
+            normalized = normalize_rows(vectors)
+            rows = rng.integers(0, len(vectors), n_queries)
+            exact_ms = time_per_call(exact_neighbors, [(normalized, int(row), k) for row in rows])
+            truth = [set(exact_neighbors(normalized, int(row), k)) for row in rows]
+            for n_tables in table_counts:
+                folder = os.path.join(tmp, f"{name}_{len(vectors)}_{n_tables}")
+                build_ann_index(folder, vectors, range(len(vectors)), n_tables=n_tables, seed=seed)
+                index = AnnIndex(folder)
+                for probe in (False, True):
+                    args = [(index.vectors[row], k, int(row), probe) for row in rows]
+                    index.query(*args[0])  # page in the maps
+                    ann_ms = time_per_call(index.query, args)
+                    recall = np.mean([len(truth[i] & set(index.query(*args[i])[0])) / k for i in range(len(rows))])
+                    n_candidates = np.mean([len(index.candidates(index.vectors[row], probe)) for row in rows])
+                    print(f"{name:>10} {len(vectors):>8} {vectors.shape[1]:>5} {n_tables:>6} {index.n_bits:>4} {str(probe):>5} "
+                          f"{recall:>9.3f} {n_candidates:>10.0f} {ann_ms:>7.3f} {exact_ms:>8.3f} {folder_nbytes(folder) / 1e6:>8.2f}")
+
+    # item-based scoring of users on the reviews, the 'ann' serving mode against 'neighbors'
+    from sklearn.metrics.pairwise import cosine_similarity
+    rating_index = RatingIndex.from_reviews(reviews_df)
+    matrix, recipe_means, mu = centered_rating_matrix(reviews_df)
+    dense = matrix.dot(cosine_similarity(matrix.T)) / np.abs(cosine_similarity(matrix.T)).sum(axis=1)[None, :]
+    users = rng.integers(0, matrix.shape[0], n_queries)
+    print(f"\n{'scoring':>10} {'tables':>6} {'ms/user':>8} {f'top{k} overlap with dense':>24}")
+    with tempfile.TemporaryDirectory() as tmp:
+        save_neighbors(os.path.join(tmp, "neighbors"), cosine_similarity(matrix.T), range(matrix.shape[1]),
+                       range(matrix.shape[1]), recipe_means, mu)
+        scorers = [("neighbors", "-", NeighborTable(os.path.join(tmp, "neighbors")), item_based_scores)]
+        for n_tables in table_counts:
+            folder = os.path.join(tmp, f"ann_{n_tables}")
+            build_ann_index(folder, matrix.T, range(matrix.shape[1]), n_tables=n_tables, recipe_means=recipe_means,
+                            global_mean=mu, seed=seed)
+            scorers.append(("ann", n_tables, AnnIndex(folder), ann_item_scores))
+        for name, n_tables, index, score_user in scorers:
+            score_user(index, rating_index, int(users[0]))  # builds the reverse graph, pages in the maps
+            latency_ms = time_per_call(score_user, [(index, rating_index, int(u)) for u in users])
+            overlap = []
+            for u in users:
+                exclude = exclusion_mask(index.recipe_index, rating_index.rated_recipes(u))
+                top = recommend(score_user(index, rating_index, int(u)), index.recipe_ids, k, exclude)
+                dense_top = recommend(dense[u], index.recipe_ids, k, exclude)
+                overlap.append(len(set(top) & set(dense_top)) / k)
+            print(f"{name:>10} {n_tables:>6} {latency_ms:>8.3f} {np.mean(overlap):>24.3f}")
+
+
+def bench_content(reviews_path, recipes_path, rating_counts, item_counts, n_users, top_n, seed=0):
+    """
+    Cold start: users are given only their first few ratings, and the share of
+    their other rated recipes found in the top N is compared for the content-based
+    profile and the Popular list. Then the per-request latency as the catalog grows.
+    """
+    rng = np.random.default_rng(seed)
+    reviews_df = apply_schema(pd.read_feather(reviews_path), REVIEWS_SCHEMA)
+    catalog = RecipeCatalog(recipes_path)
+    start = time.perf_counter()
+    index = ContentIndex.from_catalog(catalog)
+    print(f"index of {len(index)} recipes x {index.matrix.shape[1]} terms built in {(time.perf_counter() - start) * 1000:.0f} ms, "
+          f"{index.nbytes()[0] / 1e6:.2f} MB")
+    popularity = PopularityIndex.from_reviews(reviews_df)
+    by_user = {user: group for user, group in reviews_df.groupby('user_id', observed=True)}
+    print(f"{'ratings':>8} {'users':>6} {f'content hit@{top_n}':>14} {f'popular hit@{top_n}':>14}")
+    for n_ratings in rating_counts:
+        users = [user for user, group in by_user.items() if len(group) > n_ratings]
+        content_hits = popular_hits = 0
+        for user in rng.choice(users, min(n_users, len(users)), replace=False):
+            group = by_user[user]
+            known, hidden = group.iloc[:n_ratings], set(group['recipe_id'].iloc[n_ratings:].tolist())
+            rated = known['recipe_id'].to_numpy()
+            scores = index.get_scores(rated, known['rating'].to_numpy())
+            if scores is not None:
+                top = recommend(scores, index.recipe_ids, top_n, exclusion_mask(index.recipe_index, rated))
+                content_hits += len(hidden & set(top)) / min(top_n, len(hidden))
+            popular_hits += len(hidden & set(popularity.top(top_n, exclude=rated).tolist())) / min(top_n, len(hidden))
+        n = min(n_users, len(users))
+        print(f"{n_ratings:>8} {n:>6} {content_hits / n:>14.3f} {popular_hits / n:>14.3f}")
+    # synthetic catalogs with the bundled number of terms per recipe
+    terms_per_recipe = int(np.diff(index.matrix.indptr).mean())
+    print(f"{'recipes':>8} {'terms':>7} {'ratings':>8} {'ms':>7} {'MB':>7}")
+    for n_items in item_counts:
+        n_terms = max(index.matrix.shape[1], n_items // 5)
+        terms = rng.integers(0, n_terms, n_items * terms_per_recipe)
+        matrix = sp.csr_matrix((rng.random(len(terms), dtype=np.float32), terms, np.arange(n_items + 1) * terms_per_recipe),
+                               shape=(n_items, n_terms))
+        synthetic = ContentIndex(np.arange(n_items), matrix)
+        for n_ratings in rating_counts:
+            args = [(rng.choice(n_items, n_ratings, replace=False), np.full(n_ratings, 5.0)) for _ in range(50)]
+            ms = time_per_call(synthetic.get_scores, args)
+            print(f"{n_items:>8} {n_terms:>7} {n_ratings:>8} {ms:>7.3f} {synthetic.nbytes()[0] / 1e6:>7.2f}")
+
+
+def legacy_popular_page(reviews_df, recipes_rated, n):
+    # the previous per-miss popularity ranking of home.get_recipes
+    recipe_stats = reviews_df.groupby('recipe_id').agg(
+        num_reviews=('rating', 'count'),
+        avg_rating=('rating', 'mean')
+    ).reset_index()
+    recipe_stats['popularity_score'] = recipe_stats['avg_rating'] * np.log(recipe_stats['num_reviews'])
+    recipe_stats = recipe_stats[~recipe_stats['recipe_id'].isin(recipes_rated)]
+    return recipe_stats.sort_values(by='popularity_score', ascending=False)['recipe_id'].head(n).tolist()
+
+
+def indexed_popular_page(popularity, recipes_rated, n):
+    recipe_ids = popularity.top(n, exclude=recipes_rated)
+    popularity.stats(recipe_ids)
+    return recipe_ids.tolist()
+
+
+def bench_popularity(reviews_path, scales, n_lookups, top_n, seed=0):
+    """Popular page and new rating cost of the per-request groupby against the incremental index."""
+    reviews_df = apply_schema(pd.read_feather(reviews_path), REVIEWS_SCHEMA)[['user_id', 'recipe_id', 'rating']]
+    rng = np.random.default_rng(seed)
+    print(f"{'reviews':>10} {'groupby ms':>11} {'index ms':>9} {'add_rating us':>14} {'same page':>10}")
+    for scale in scales:
+        scaled = pd.concat([reviews_df] * scale, ignore_index=True)
+        rating_index = RatingIndex.from_reviews(reviews_df)
+        users = rng.choice(rating_index.users.sorted_ids, n_lookups)
+        popularity = PopularityIndex.from_reviews(scaled)
+        args = [(rating_index.rated_recipes(u),) for u in users]
+        legacy_ms = time_per_call(lambda rated: legacy_popular_page(scaled, rated, top_n), args[:20])
+        index_ms = time_per_call(lambda rated: indexed_popular_page(popularity, rated, top_n), args)
+        same = all(legacy_popular_page(scaled, rated, top_n) == indexed_popular_page(popularity, rated, top_n)
+                   for rated, in args[:5])
+        ratings = [(int(r), int(v)) for r, v in zip(rng.choice(popularity.recipe_ids, 1000), rng.integers(0, 6, 1000))]
+        add_us = time_per_call(popularity.add_rating, ratings) * 1000
+        print(f"{len(scaled):>10} {legacy_ms:>11.2f} {index_ms:>9.3f} {add_us:>14.1f} {str(same):>10}")
+
+
+def frame_nbytes(df, list_columns=()):
+    """
+    Memory of a DataFrame. Deep memory usage does not look inside list columns,
+    so the arrays and the distinct string objects they hold are counted separately.
+    """
+    total = int(df.drop(columns=list(list_columns)).memory_usage(index=True, deep=True).sum())
+    for column in list_columns:
+        strings = {}
+        for values in df[column]:
+            total += sys.getsizeof(values)
+            for value in values:
+                strings[id(value)] = value
+        total += sum(sys.getsizeof(value) for value in strings.values())
+    return total
+
+
+def popularity_merge(reviews_df, recipes_df):
+    # the aggregation and merge done by home.get_recipes
+    recipe_stats = reviews_df.groupby('recipe_id').agg(
+        num_reviews=('rating', 'count'),
+        avg_rating=('rating', 'mean')
+    ).reset_index()
+    recipe_stats['popularity_score'] = recipe_stats['avg_rating'] * np.log(recipe_stats['num_reviews'])
+    return pd.merge(recipe_stats, recipes_df, on='recipe_id', how='left')
+
+
+def bench_schema(reviews_path, recipes_path, repeat):
+    """
+    Memory and groupby/merge time of the inferred dtypes against the declared schema,
+    with tags and ingredients as object lists against the ListColumns the app reads.
+    """
+    reviews_df = pd.read_feather(reviews_path)
+    recipes_df = pd.read_feather(recipes_path, columns=['recipe_id', 'name', 'minutes', 'n_steps', 'tags', 'ingredients'])
+    list_columns = ['tags', 'ingredients']
+    frames = {
+        'inferred': (reviews_df, recipes_df),
+        'schema': (apply_schema(reviews_df, REVIEWS_SCHEMA), apply_schema(recipes_df, RECIPES_SCHEMA)),
+    }
+    print(f"{'dtypes':>9} {'reviews MB':>11} {'recipes MB':>11} {'groupby+merge ms':>17}")
+    for label, (reviews, recipes) in frames.items():
+        reviews_mb = reviews.memory_usage(deep=True).sum() / 1e6
+        if label == 'inferred':
+            recipes_mb = frame_nbytes(recipes, list_columns=list_columns) / 1e6
+        else:
+            catalog = RecipeCatalog(recipes_path)
+            recipes_mb = (frame_nbytes(recipes.drop(columns=list_columns))
+                          + sum(catalog.list_column(column).nbytes() for column in list_columns)) / 1e6
+        merge_ms = time_per_call(popularity_merge, [(reviews, recipes)] * repeat)
+        print(f"{label:>9} {reviews_mb:>11.2f} {recipes_mb:>11.2f} {merge_ms:>17.2f}")
+
+
+def legacy_list_filter(recipes_df, tags_selected, ing_selected):
+    # the previous recipe_search filters, Python code for every row
+    def all_tags_present(item_tags, selected):
+        return all(string in item_tags for string in selected)
+
+    def check_ingredients(row, selected):
+        ing_str = ' '.join(str(ing).lower() for ing in row)
+        return all(item in ing_str for item in selected)
+
+    match = recipes_df['tags'].apply(all_tags_present, selected=tags_selected)
+    match &= recipes_df['ingredients'].apply(check_ingredients, selected=ing_selected)
+    return match.to_numpy()
+
+
+def flat_list_filter(catalog, tags_selected, ing_selected):
+    return (catalog.list_column('tags').rows_containing_all(tags_selected)
+            & catalog.list_column('ingredients').rows_matching_all(ing_selected))
+
+
+def bench_list_search(recipes_path, queries, repeat):
+    """Tag and ingredient filtering with object list columns against flat ListColumns."""
+    catalog = RecipeCatalog(recipes_path)
+    recipes_df = pd.read_feather(recipes_path, columns=['tags', 'ingredients'])
+    print(f"{'tags':>30} {'ingredients':>20} {'matches':>8} {'rows ms':>8} {'flat ms':>8}")
+    for tags_selected, ing_selected in queries:
+        matches = int(flat_list_filter(catalog, tags_selected, ing_selected).sum())
+        rows_ms = time_per_call(legacy_list_filter, [(recipes_df, tags_selected, ing_selected)] * repeat)
+        flat_ms = time_per_call(flat_list_filter, [(catalog, tags_selected, ing_selected)] * repeat)
+        print(f"{','.join(tags_selected):>30} {','.join(ing_selected):>20} {matches:>8} {rows_ms:>8.2f} {flat_ms:>8.3f}")
+
+
+def evict_from_page_cache(path):
+    # best effort, lets the next read of the file come from disk
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+    finally:
+        os.close(fd)
+
+
+def anonymous_rss_mb():
+    # private (heap) resident memory, memory-mapped file pages are not counted (Linux only)
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("RssAnon:"):
+                return int(line.split()[1]) / 1024
+    return float("nan")
+
+
+def load_in_process(path, queue):
+    # runs in a fresh process: load time, peak RSS of the process and the heap memory the load added
+    heap_mb = anonymous_rss_mb()
+    start_time = time.perf_counter()
+    df = read_feather(path)
+    # touch every value, a memory-mapped column is only read when it is used
+    df.memory_usage(deep=True)
+    for column in df.select_dtypes('number'):
+        df[column].sum()
+    load_ms = (time.perf_counter() - start_time) * 1000
+    peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    queue.put((load_ms, peak_mb, anonymous_rss_mb() - heap_mb))
+
+
+def timed_load(path):
+    context = multiprocessing.get_context("spawn")
+    queue = context.Queue()
+    process = context.Process(target=load_in_process, args=(path, queue))
+    process.start()
+    result = queue.get()
+    process.join()
+    return result
+
+
+def bench_codecs(paths, codecs):
+    """Size on disk, cold and warm load time and peak RSS of the data files for every codec."""
+    print(f"{'file':>24} {'codec':>13} {'size MB':>8} {'cold ms':>8} {'warm ms':>8} {'peak RSS MB':>12} {'heap MB':>8}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for path in paths:
+            df = pd.read_feather(path)
+            for codec in codecs:
+                codec_path = os.path.join(tmp, f"{codec}_{os.path.basename(path)}")
+                write_feather(df, codec_path, codec)
+                size_mb = os.path.getsize(codec_path) / 1e6
+                evict_from_page_cache(codec_path)
+                cold_ms, peak_mb, heap_mb = timed_load(codec_path)
+                warm_ms, _, _ = timed_load(codec_path)
+                print(f"{os.path.basename(path):>24} {codec:>13} {size_mb:>8.2f} {cold_ms:>8.1f} {warm_ms:>8.1f} "
+                      f"{peak_mb:>12.1f} {heap_mb:>8.1f}")
+
+
+def bench_quantization(store_folder, n_users, n_items, top_n, seed=0):
+    """Size and top-N overlap of every storage precision against full precision."""
+    if store_folder:
+        store = PredictionStore(store_folder)
+        scores = store.dequantize(slice(None))
+        print(f"{store_folder} (stored as {store.precision})")
+    else:
+        # low rank scores plus noise, shaped like collaborative filtering predictions
+        rng = np.random.default_rng(seed)
+        scores = rng.standard_normal((n_users, 16)) @ rng.standard_normal((16, n_items)) * 0.1
+        scores += rng.standard_normal((n_users, n_items)) * 0.05
+        print(f"synthetic {n_users} x {n_items} scores")
+    print(quantization_report(scores, PRECISIONS, top_n).to_string(index=False))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+
+    lookup = subparsers.add_parser("prediction-lookup", help="per-user prediction lookup latency")
+    lookup.add_argument("--users", type=int, nargs="+", default=[1000, 5000, 20000])
+    lookup.add_argument("--items", type=int, default=1608)
+    lookup.add_argument("--lookups", type=int, default=200)
+
+    schema = subparsers.add_parser("schema", help="memory and groupby/merge time with the compact dtype schema")
+    schema.add_argument("--reviews", default="Data/reviews_df.feather")
+    schema.add_argument("--recipes", default="Data/recipes_clean.feather")
+    schema.add_argument("--repeat", type=int, default=20)
+
+    quantization = subparsers.add_parser("quantization", help="size and top-N overlap of quantized predictions")
+    quantization.add_argument("--store", default=None, help="prediction store folder, e.g. Data/user_pred (synthetic scores if omitted)")
+    quantization.add_argument("--users", type=int, default=2000)
+    quantization.add_argument("--items", type=int, default=1608)
+    quantization.add_argument("--top-n", type=int, default=20)
+
+    list_search = subparsers.add_parser("list-search", help="tag and ingredient filtering over flat list columns")
+    list_search.add_argument("--recipes", default="Data/recipes_clean.feather")
+    list_search.add_argument("--repeat", type=int, default=20)
+
+    codecs = subparsers.add_parser("codecs", help="size, load time and peak RSS of the data files per compression codec")
+    codecs.add_argument("--files", nargs="+", default=["Data/reviews_df.feather", "Data/recipes_clean.feather"])
+    codecs.add_argument("--codecs", nargs="+", default=CODECS, choices=CODECS)
+
+    top_n = subparsers.add_parser("top-n", help="getRecommendations latency, NumPy engine against the DataFrame path")
+    top_n.add_argument("--items", type=int, nargs="+", default=[1608, 10000, 100000])
+    top_n.add_argument("--users", type=int, default=200)
+    top_n.add_argument("--rated", type=int, default=40)
+    top_n.add_argument("--top-n", type=int, default=10)
+    top_n.add_argument("--lookups", type=int, default=100)
+
+    constrained = subparsers.add_parser("constrained", help="top-N restricted to search matches, mask against post-filter")
+    constrained.add_argument("--items", type=int, nargs="+", default=[1608, 100000])
+    constrained.add_argument("--selectivity", type=float, nargs="+", default=[0.5, 0.05, 0.005],
+                             help="share of the recipes matching the search")
+    constrained.add_argument("--users", type=int, default=200)
+    constrained.add_argument("--rated", type=int, default=40)
+    constrained.add_argument("--top-n", type=int, default=10)
+    constrained.add_argument("--lookups", type=int, default=50)
+
+    neighbors = subparsers.add_parser("neighbors", help="request time neighbor scoring against dense predictions")
+    neighbors.add_argument("--reviews", default="Data/reviews_df.feather")
+    neighbors.add_argument("--k", type=int, nargs="+", default=[20, 50, 100])
+    neighbors.add_argument("--lookups", type=int, default=200)
+    neighbors.add_argument("--top-n", type=int, default=10)
+
+    factorization = subparsers.add_parser("factorization", help="ALS embeddings against a dense prediction store")
+    factorization.add_argument("--reviews", default="Data/reviews_df.feather")
+    factorization.add_argument("--factors", type=int, nargs="+", default=[16, 32, 64])
+    factorization.add_argument("--lookups", type=int, default=200)
+    factorization.add_argument("--top-n", type=int, default=10)
+
+    coalescing = subparsers.add_parser("coalescing", help="concurrent sessions on one cold computation")
+    coalescing.add_argument("--reviews", default="Data/reviews_df.feather")
+    coalescing.add_argument("--recipes", default="Data/recipes_clean.feather")
+    coalescing.add_argument("--sessions", type=int, nargs="+", default=[1, 8, 32])
+
+    popular = subparsers.add_parser("popularity", help="per-request groupby against the incremental popularity index")
+    popular.add_argument("--reviews", default="Data/reviews_df.feather")
+    popular.add_argument("--scales", type=int, nargs="+", default=[1, 10, 50], help="copies of the reviews")
+    popular.add_argument("--lookups", type=int, default=200)
+    popular.add_argument("--top-n", type=int, default=15)
+
+    content = subparsers.add_parser("content", help="content-based cold start quality and latency")
+    content.add_argument("--reviews", default="Data/reviews_df.feather")
+    content.add_argument("--recipes", default="Data/recipes_clean.feather")
+    content.add_argument("--ratings", type=int, nargs="+", default=[1, 3, 10], help="ratings a cold start user has")
+    content.add_argument("--items", type=int, nargs="+", default=[10000, 100000], help="synthetic catalog sizes")
+    content.add_argument("--users", type=int, default=300)
+    content.add_argument("--top-n", type=int, default=20)
+
+    explanations = subparsers.add_parser("explanations", help="cost of item-based recommendation explanations")
+    explanations.add_argument("--reviews", default="Data/reviews_df.feather")
+    explanations.add_argument("--top-n", type=int, nargs="+", default=[5, 20, 100])
+    explanations.add_argument("--lookups", type=int, default=200)
+
+    ann = subparsers.add_parser("ann", help="recall and latency of the LSH index against exact cosine")
+    ann.add_argument("--reviews", default="Data/reviews_df.feather")
+    ann.add_argument("--items", type=int, nargs="+", default=[50000, 200000], help="synthetic catalog sizes")
+    ann.add_argument("--dims", type=int, default=32, help="synthetic vector size (e.g. embeddings)")
+    ann.add_argument("--tables", type=int, nargs="+", default=[4, 8, 16])
+    ann.add_argument("--queries", type=int, default=200)
+    ann.add_argument("--k", type=int, default=10)
+
+    args = parser.parse_args()
+    if args.benchmark == "prediction-lookup":
+        bench_prediction_lookup(args.users, args.items, args.lookups)
+    elif args.benchmark == "schema":
+        bench_schema(args.reviews, args.recipes, args.repeat)
+    elif args.benchmark == "quantization":
+        bench_quantization(args.store, args.users, args.items, args.top_n)
+    elif args.benchmark == "list-search":
+        queries = [(['easy'], ['chicken']), (['healthy', 'low-fat'], ['garlic', 'onion']),
+                   (['30-minutes-or-less', 'vegetables'], ['tomatoes'])]
+        bench_list_search(args.recipes, queries, args.repeat)
+    elif args.benchmark == "top-n":
+        bench_top_n(args.items, args.users, args.rated, args.top_n, args.lookups)
+    elif args.benchmark == "constrained":
+        bench_constrained(args.items, args.selectivity, args.users, args.rated, args.top_n, args.lookups)
+    elif args.benchmark == "content":
+        bench_content(args.reviews, args.recipes, args.ratings, args.items, args.users, args.top_n)
+    elif args.benchmark == "explanations":
+        bench_explanations(args.reviews, args.top_n, args.lookups)
+    elif args.benchmark == "ann":
+        bench_ann(args.reviews, args.items, args.dims, args.tables, args.queries, args.k)
+    elif args.benchmark == "popularity":
+        bench_popularity(args.reviews, args.scales, args.lookups, args.top_n)
+    elif args.benchmark == "coalescing":
+        bench_coalescing(args.reviews, args.recipes, args.sessions)
+    elif args.benchmark == "factorization":
+        bench_factorization(args.reviews, args.factors, args.lookups, args.top_n)
+    elif args.benchmark == "neighbors":
+        bench_neighbors(args.reviews, args.k, args.lookups, args.top_n)
+    elif args.benchmark == "codecs":
+        bench_codecs(args.files, args.codecs)
+
+
+if __name__ == "__main__":
+    main()
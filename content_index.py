@@ -0,0 +1,70 @@
+import numpy as np
+import scipy.sparse as sp
+from id_map import IdMap
+
+# list columns of the catalog the recipe vectors are built from, each weighted equally
+CONTENT_COLUMNS = ("tags", "ingredients")
+# ratings above it pull a profile towards the tags and ingredients of a recipe, ratings below push it away;
+# most ratings are 4 or 5, centering on their mean would turn a 4 star rating into a dislike
+NEUTRAL_RATING = 3.0
+
+
+def tf_idf(column):
+    """
+    (rows, values) sparse TF-IDF matrix of a ListColumn with L2-normalized rows.
+    A value counts once per row and is weighted by its smoothed inverse row frequency.
+    """
+    n_rows = len(column)
+    matrix = sp.csr_matrix((np.ones(len(column.codes), dtype=np.float32), column.codes, column.offsets),
+                           shape=(n_rows, len(column.vocabulary)))
+    matrix.sum_duplicates()
+    matrix.data[:] = 1
+    row_counts = np.bincount(matrix.indices, minlength=matrix.shape[1])
+    idf = (np.log((1 + n_rows) / (1 + row_counts)) + 1).astype(np.float32)
+    matrix = matrix @ sp.diags(idf)
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+    return sp.diags(np.divide(1, norms, out=np.zeros_like(norms), where=norms > 0)) @ matrix
+
+
+class ContentIndex:
+    """
+    Sparse TF-IDF vectors of the recipes over their tags and ingredients (one
+    normalized block per column, side by side). A user's profile is the sum of
+    the vectors of the recipes they rated, weighted by the rating against
+    NEUTRAL_RATING, and all recipes are scored with one sparse matrix-vector
+    product. It needs no training, so it works from a user's first rating.
+    """
+
+    def __init__(self, recipe_ids, matrix):
+        self.recipe_ids = np.asarray(recipe_ids, dtype=np.int64)
+        # recipe_id -> row of the matrix
+        self.recipe_index = IdMap(self.recipe_ids)
+        self.matrix = matrix.tocsr().astype(np.float32)
+
+    @classmethod
+    def from_catalog(cls, catalog, columns=CONTENT_COLUMNS):
+        blocks = [tf_idf(catalog.list_column(name)) for name in columns]
+        # every block has unit rows, the scaling gives the combined rows unit norm
+        return cls(catalog.listing['recipe_id'].to_numpy(), sp.hstack(blocks) / np.sqrt(len(blocks)))
+
+    def __len__(self):
+        return len(self.recipe_ids)
+
+    def nbytes(self):
+        """(resident, memory-mapped) bytes of the index."""
+        matrix = self.matrix.data.nbytes + self.matrix.indices.nbytes + self.matrix.indptr.nbytes
+        return self.recipe_index.nbytes() + matrix, 0
+
+    def user_profile(self, recipe_ids, ratings):
+        """Dense profile vector of a user from their ratings, None if no rated recipe counts."""
+        positions = self.recipe_index.to_index(recipe_ids)
+        known = positions >= 0
+        weights = np.asarray(ratings, dtype=np.float32)[known] - NEUTRAL_RATING
+        if not weights.any():
+            return None
+        return self.matrix[positions[known]].T @ weights
+
+    def get_scores(self, recipe_ids, ratings):
+        """Content scores of all recipes (aligned with recipe_ids) for a user's ratings, or None."""
+        profile = self.user_profile(recipe_ids, ratings)
+        return self.matrix @ profile if profile is not None else None
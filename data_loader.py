@@ -1,41 +1,266 @@
 import streamlit as st
 import pandas as pd
+import os
+from prediction_store import (PredictionStore, TopKStore, convert_feather_predictions, build_top_k_from_store,
+                              SCORES_FILE, TOPK_IDS_FILE)
+from dataset_registry import DatasetRegistry
+from page_cache import PageCache
+from recipe_catalog import RecipeCatalog, rebatch_recipes
+from rating_index import RatingIndex
+from popularity import PopularityIndex
+from neighbor_index import NeighborTable
+from factorization import FactorModel
+from ann_index import AnnIndex
+from content_index import ContentIndex
+from id_map import convert_pickle_mapping, RAW_IDS_FILE
+from data_schema import apply_schema, REVIEWS_SCHEMA
+from feather_io import read_feather, write_feather, DEFAULT_CODEC
+from data_manifest import (ManifestWatcher, create_manifest, update_manifest, stage_artifact, stage_file,
+                           overlay_entry, MANIFEST_FILE, OVERLAY_SUFFIX)
 
-@st.cache_data
-def load_data(path, modification_time, columns=None):
+DATA_FOLDER = "Data"
+# dataset name -> path inside DATA_FOLDER, used to create the first manifest
+DEFAULT_PATHS = {
+    'reviews': 'reviews_df.feather',
+    'recipes': 'recipes_clean.feather',
+    'user_pred': 'user_pred',
+    'item_pred': 'item_pred',
+    'user_pred_topk': 'user_pred_topk',
+    'item_pred_topk': 'item_pred_topk',
+    'user_neighbors': 'user_neighbors',
+    'item_neighbors': 'item_neighbors',
+    'mf_model': 'mf_model',
+    'item_ann': 'item_ann',
+    'user_id_map': 'user_id_map',
+    'recipe_id_map': 'recipe_id_map',
+}
+PREDICTION_DATASETS = ['user_pred', 'item_pred']
+# compression of the data files written by the app: uncompressed, lz4 or zstd (see feather_io.py),
+# uncompressed files are memory-mapped when loaded instead of being decoded
+DATA_CODEC = os.getenv("RECIPE_DATA_CODEC", DEFAULT_CODEC)
+# raw Food.com id <-> contiguous index maps, and the dict pickles older notebooks wrote instead
+ID_MAP_DATASETS = {'user_id_map': 'user_id_mapping.pkl', 'recipe_id_map': 'recipe_id_mapping.pkl'}
+
+@st.cache_resource
+def get_registry():
+    """The process-wide dataset registry shared by every session."""
+    return DatasetRegistry()
+
+@st.cache_resource
+def get_page_cache():
+    """The process-wide cache of Home recommendation pages."""
+    return PageCache()
+
+def load_data(path, version, columns=None, schema=None, name=None):
+    """
+    Load a dataset through the shared registry. The dataset is read once per
+    version (its content hash in the manifest) and every session gets a reference
+    to the same read-only DataFrame instead of its own copy. If a schema is given
+    (see data_schema.py) the columns are validated and converted to the declared dtypes.
+    """
+    def load():
+        df = read_data(path, version, columns)
+        return apply_schema(df, schema) if schema else df
+    return get_registry().get(name or path, version, load)
+
+def read_data(path, version=None, columns=None):
     """
     Generalized function to load a dataset from the specified path.
     Supports multiple file formats.
     """
-    print(f"Loading data from {path} (modification time: {modification_time})")
+    print(f"Loading data from {path} (version: {version})")
     if path.endswith('.feather'):
-        if columns:
-            return pd.read_feather(path,columns=columns)
-        else:
-            return pd.read_feather(path)
+        return read_feather(path, columns=columns)
     elif path.endswith('.pkl'):
         return pd.read_pickle(path)
     else:
         raise ValueError("Unsupported file format. Supported formats: .feather, .pkl")
     
-@st.cache_data
-def load_user_predictions(user_id, path, modification_time):
+def bootstrap_manifest(data_folder=DATA_FOLDER):
+    """
+    Create the manifest of a data folder that does not have one yet.
+    Prediction feather files and id mapping pickles written by older versions of
+    the app are converted, missing top-K artifacts are built from the stores, and a
+    recipes file written as one record batch is split into small batches.
+    """
+    recipes_path = os.path.join(data_folder, DEFAULT_PATHS['recipes'])
+    if os.path.exists(recipes_path) and rebatch_recipes(recipes_path):
+        print(f"Split {recipes_path} into record batches")
+    for name, pkl_file in ID_MAP_DATASETS.items():
+        folder = os.path.join(data_folder, DEFAULT_PATHS[name])
+        pkl_path = os.path.join(data_folder, pkl_file)
+        if not os.path.exists(os.path.join(folder, RAW_IDS_FILE)) and os.path.exists(pkl_path):
+            print(f"Converting {pkl_path} into an id map at {folder}")
+            convert_pickle_mapping(pkl_path, folder)
+    reviews_df = None
+    for name in PREDICTION_DATASETS:
+        folder = os.path.join(data_folder, DEFAULT_PATHS[name])
+        feather_path = folder + '.feather'
+        if not os.path.exists(os.path.join(folder, SCORES_FILE)) and os.path.exists(feather_path):
+            print(f"Converting {feather_path} into a prediction store at {folder}")
+            convert_feather_predictions(feather_path, folder)
+        topk_folder = os.path.join(data_folder, DEFAULT_PATHS[name + '_topk'])
+        if not os.path.exists(os.path.join(topk_folder, TOPK_IDS_FILE)) and os.path.exists(os.path.join(folder, SCORES_FILE)):
+            print(f"Building top-K artifact {topk_folder} from {folder}")
+            if reviews_df is None:
+                reviews_df = pd.read_feather(os.path.join(data_folder, DEFAULT_PATHS['reviews']))
+            build_top_k_from_store(PredictionStore(folder), topk_folder,
+                                   reviews_df['user_id'].to_numpy(), reviews_df['recipe_id'].to_numpy())
+    print(f"Creating {os.path.join(data_folder, MANIFEST_FILE)}")
+    return create_manifest(data_folder, DEFAULT_PATHS)
+
+@st.cache_resource
+def get_manifest_watcher(data_folder=DATA_FOLDER):
+    """The process-wide watcher of the data manifest."""
+    if not os.path.exists(os.path.join(data_folder, MANIFEST_FILE)):
+        bootstrap_manifest(data_folder)
+    return ManifestWatcher(data_folder)
+
+def current_manifest():
+    """
+    The current data manifest. Every rerun reads all its datasets from one
+    manifest, so a session never mixes artifacts of two versions.
+    """
+    return get_manifest_watcher().current()
+
+def dataset_path(manifest, name):
+    entry = manifest['datasets'].get(name)
+    return os.path.join(DATA_FOLDER, entry['path']) if entry else None
+
+def dataset_version(manifest, name):
+    entry = manifest['datasets'].get(name)
+    return entry['sha256'] if entry else None
+
+def load_reviews(manifest):
+    return load_data(dataset_path(manifest, 'reviews'), dataset_version(manifest, 'reviews'),
+                     schema=REVIEWS_SCHEMA, name='reviews')
+
+def load_rating_index(manifest):
+    """
+    The user -> rated recipes index of the reviews, built once per reviews version.
+    Submitted feedback publishes an updated index with publish_reviews instead of a rebuild.
+    """
+    version = dataset_version(manifest, 'reviews')
+    return get_registry().get('rating_index', version, lambda: RatingIndex.from_reviews(load_reviews(manifest)))
+
+def load_popularity(manifest):
+    """
+    Review count, rating sum and popularity ranking of every recipe, built once per
+    reviews version. Submitted feedback updates it in place with publish_reviews.
+    """
+    version = dataset_version(manifest, 'reviews')
+    return get_registry().get('popularity', version, lambda: PopularityIndex.from_reviews(load_reviews(manifest)))
+
+def load_recipe_catalog(manifest):
+    """
+    Open the recipe catalog once per version. Only the listing columns are read
+    up front, detail columns are fetched when a recipe is opened.
     """
-    Load only the specific user's predictions from the Feather file
+    path, version = dataset_path(manifest, 'recipes'), dataset_version(manifest, 'recipes')
+    def open_catalog():
+        print(f"Opening recipe catalog {path} (version: {version})")
+        return RecipeCatalog(path)
+    return get_registry().get('recipes', version, open_catalog)
+
+def load_content_index(manifest):
+    """
+    TF-IDF tag and ingredient vectors of the recipes, built from the catalog once
+    per recipes version. Nothing is trained, so it is always available.
+    """
+    version = dataset_version(manifest, 'recipes')
+    return get_registry().get('content_index', version, lambda: ContentIndex.from_catalog(load_recipe_catalog(manifest)))
+
+def load_with_overlay(manifest, name, open_artifact):
+    """
+    Open an artifact with user rows (a prediction store, top-K artifact or factor model)
+    once per version of it and of its overlay, the rows folded in since it was trained.
+    """
+    version = dataset_version(manifest, name)
+    overlay = overlay_entry(manifest['datasets'], name)
+    if overlay is None:
+        return get_registry().get(name, version, open_artifact)
+    def open_with_overlay():
+        artifact = open_artifact()
+        artifact.load_folded(os.path.join(DATA_FOLDER, overlay['path']))
+        return artifact
+    return get_registry().get(name, f"{version}+{overlay['sha256'][:12]}", open_with_overlay)
+
+def publish_fold_ins(manifest, artifacts):
+    """
+    Publish the rows folded into artifacts ({dataset name: artifact} of the given
+    manifest) as their overlays, so every process, and the app after a restart,
+    serves them. Rows another process published meanwhile are kept, artifacts
+    retrained meanwhile are skipped.
+    """
+    current = get_manifest_watcher().refresh()
+    entries = {}
+    for name, artifact in artifacts.items():
+        version = dataset_version(manifest, name)
+        if artifact is None or not artifact.has_folded() or dataset_version(current, name) != version:
+            continue
+        overlay = overlay_entry(current['datasets'], name)
+        if overlay is not None:
+            artifact.load_folded(os.path.join(DATA_FOLDER, overlay['path']), replace=False)
+        entry = stage_artifact(DATA_FOLDER, name + OVERLAY_SUFFIX, artifact.save_folded)
+        entries[name + OVERLAY_SUFFIX] = dict(entry, base=version)
+    if not entries:
+        return current
+    update_manifest(DATA_FOLDER, entries)
+    return get_manifest_watcher().refresh()
+
+def load_prediction_store(manifest, name):
+    """
+    Open a prediction store ('user_pred' or 'item_pred') once per version, or return
+    None if it has not been trained yet. The score matrix is memory-mapped,
+    so the store is shared by every session instead of being copied.
     """
-    if user_id is None:
+    folder, version = dataset_path(manifest, name), dataset_version(manifest, name)
+    if folder is None:
         return None
-    else:
-        print(f"Loading predictions for user {user_id} from {path} (modification time: {modification_time})")
-        
-        if path.endswith('.feather'):    
-            # Read just the user_id column first to find the row index
-            user_ids = pd.read_feather(path, columns=['user_id'])
-            row_index = user_ids[user_ids['user_id'] == user_id].index
-    
-            if len(row_index) == 0:
-                print(f"No predictions found for user {user_id}")
-                return None
-            else:
-                # Now read just that specific row
-                return pd.read_feather(path).iloc[row_index]
+    def open_store():
+        print(f"Opening prediction store {folder} (version: {version})")
+        return PredictionStore(folder)
+    return load_with_overlay(manifest, name, open_store)
+
+def load_top_k_store(manifest, name):
+    """Open a top-K artifact ('user_pred_topk' or 'item_pred_topk') once per version, or return None."""
+    folder, version = dataset_path(manifest, name), dataset_version(manifest, name)
+    if folder is None:
+        return None
+    def open_store():
+        print(f"Opening top-K artifact {folder} (version: {version})")
+        return TopKStore(folder)
+    return load_with_overlay(manifest, name, open_store)
+
+def load_neighbor_table(manifest, name):
+    """
+    Open a pruned similarity graph ('user_neighbors' or 'item_neighbors') once per
+    version, or return None if it has not been trained yet. The tables are memory-mapped.
+    """
+    folder, version = dataset_path(manifest, name), dataset_version(manifest, name)
+    if folder is None:
+        return None
+    def open_table():
+        print(f"Opening neighbor table {folder} (version: {version})")
+        return NeighborTable(folder)
+    return get_registry().get(name, version, open_table)
+
+def load_factor_model(manifest):
+    """Open the matrix factorization embeddings once per version, or return None if they have not been trained yet."""
+    folder, version = dataset_path(manifest, 'mf_model'), dataset_version(manifest, 'mf_model')
+    if folder is None:
+        return None
+    def open_model():
+        print(f"Opening factor model {folder} (version: {version})")
+        return FactorModel(folder)
+    return load_with_overlay(manifest, 'mf_model', open_model)
+
+def load_ann_index(manifest):
+    """Open the approximate nearest neighbor index of the recipes once per version, or return None if it has not been built yet."""
+    folder, version = dataset_path(manifest, 'item_ann'), dataset_version(manifest, 'item_ann')
+    if folder is None:
+        return None
+    def open_index():
+        print(f"Opening ANN index {folder} (version: {version})")
+        return AnnIndex(folder)
+    return get_registry().get('item_ann', version, open_index)
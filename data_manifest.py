@@ -0,0 +1,180 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+
+MANIFEST_FILE = "manifest.json"
+# how often running apps check the manifest for a new version, in seconds
+POLL_INTERVAL = 2.0
+
+# suffix of the overlay dataset of an artifact: the user rows folded in after it was
+# trained (see UserRowIndex.save_folded), applied when the artifact is opened
+OVERLAY_SUFFIX = "_folded"
+
+_write_lock = threading.Lock()
+
+
+def path_digest(path):
+    """
+    sha256 of a file, or of every file in a folder (names and contents, in sorted order).
+    """
+    digest = hashlib.sha256()
+    if os.path.isdir(path):
+        files = sorted(os.listdir(path))
+    else:
+        files = [None]
+    for name in files:
+        file_path = path if name is None else os.path.join(path, name)
+        if name is not None:
+            digest.update(name.encode())
+        with open(file_path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+    return digest.hexdigest()
+
+
+def manifest_version(datasets):
+    """Version of a manifest, a hash over the hashes of its datasets."""
+    digest = hashlib.sha256()
+    for name in sorted(datasets):
+        digest.update(f"{name}={datasets[name]['sha256']};".encode())
+    return digest.hexdigest()[:16]
+
+
+def overlay_entry(datasets, name):
+    """
+    Manifest entry of the overlay of a dataset, or None if there is none for its current
+    version. An overlay entry names the version it was made for in 'base', so a retrain
+    leaves the old overlay unused.
+    """
+    entry = datasets.get(name + OVERLAY_SUFFIX)
+    base = datasets.get(name)
+    if entry is None or base is None or entry.get("base") != base["sha256"]:
+        return None
+    return entry
+
+
+def read_manifest(data_folder):
+    with open(os.path.join(data_folder, MANIFEST_FILE)) as f:
+        return json.load(f)
+
+
+def _write_manifest(data_folder, datasets):
+    manifest = {"version": manifest_version(datasets), "created_at": time.time(), "datasets": datasets}
+    # write to a temporary file and rename it, readers never see a half written manifest
+    tmp_path = os.path.join(data_folder, f".{MANIFEST_FILE}.{uuid.uuid4().hex[:8]}")
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, os.path.join(data_folder, MANIFEST_FILE))
+    return manifest
+
+
+def create_manifest(data_folder, paths):
+    """
+    Create a manifest for existing datasets, paths maps dataset names to
+    paths relative to data_folder. Missing paths are skipped.
+    """
+    datasets = {}
+    for name, rel_path in paths.items():
+        full_path = os.path.join(data_folder, rel_path)
+        if os.path.exists(full_path):
+            datasets[name] = {"path": rel_path, "sha256": path_digest(full_path)}
+    with _write_lock:
+        return _write_manifest(data_folder, datasets)
+
+
+def update_manifest(data_folder, entries):
+    """
+    Atomically switch the given datasets to new entries ({name: {"path", "sha256"}}).
+    Versioned folders and files of those datasets that are neither the new nor the
+    previous version are deleted, the previous one is kept for sessions still using it.
+    """
+    with _write_lock:
+        datasets = dict(read_manifest(data_folder)["datasets"])
+        previous = {name: datasets.get(name, {}).get("path") for name in entries}
+        datasets.update(entries)
+        manifest = _write_manifest(data_folder, datasets)
+    for name, entry in entries.items():
+        keep = {entry["path"], previous[name]}
+        for file_name in os.listdir(data_folder):
+            if file_name.startswith(f"{name}@") and file_name not in keep:
+                path = os.path.join(data_folder, file_name)
+                if os.path.isdir(path):
+                    shutil.rmtree(path, ignore_errors=True)
+                else:
+                    os.remove(path)
+    return manifest
+
+
+def stage_artifact(data_folder, name, write):
+    """
+    Write a folder artifact through write(staging_path) and move it to its
+    content-addressed location '<name>@<hash>'. Returns the manifest entry,
+    the artifact is published once the entry is passed to update_manifest.
+    """
+    staging = os.path.join(data_folder, f".{name}.staging-{uuid.uuid4().hex[:8]}")
+    write(staging)
+    digest = path_digest(staging)
+    rel_path = f"{name}@{digest[:12]}"
+    final_path = os.path.join(data_folder, rel_path)
+    if os.path.exists(final_path):
+        shutil.rmtree(staging)
+    else:
+        os.replace(staging, final_path)
+    return {"path": rel_path, "sha256": digest}
+
+
+def stage_file(data_folder, name, extension, write):
+    """
+    Write a single file through write(tmp_path) and move it to its content-addressed
+    location '<name>@<hash><extension>', like stage_artifact. The file of the previous
+    version is left in place, so a path always holds the contents of its version.
+    """
+    tmp_path = os.path.join(data_folder, f".{name}{extension}.{uuid.uuid4().hex[:8]}")
+    write(tmp_path)
+    digest = path_digest(tmp_path)
+    rel_path = f"{name}@{digest[:12]}{extension}"
+    final_path = os.path.join(data_folder, rel_path)
+    if os.path.exists(final_path):
+        os.remove(tmp_path)
+    else:
+        os.replace(tmp_path, final_path)
+    return {"path": rel_path, "sha256": digest}
+
+
+class ManifestWatcher:
+    """
+    Cheaply polls the manifest of a data folder. The file is only stat'ed at most
+    every poll_interval seconds and only re-read when it was replaced.
+    """
+
+    def __init__(self, data_folder, poll_interval=POLL_INTERVAL):
+        self.data_folder = data_folder
+        self.poll_interval = poll_interval
+        self._lock = threading.Lock()
+        self._manifest = None
+        self._stat_key = None
+        self._checked_at = 0.0
+
+    def refresh(self):
+        """Check the manifest now, e.g. right after this process published a new version."""
+        with self._lock:
+            self._checked_at = 0.0
+        return self.current()
+
+    def current(self):
+        with self._lock:
+            now = time.monotonic()
+            if self._manifest is not None and now - self._checked_at < self.poll_interval:
+                return self._manifest
+            self._checked_at = now
+            stat = os.stat(os.path.join(self.data_folder, MANIFEST_FILE))
+            # a replaced manifest is a new inode, so this works with coarse timestamps too
+            stat_key = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+            if stat_key != self._stat_key:
+                self._manifest = read_manifest(self.data_folder)
+                self._stat_key = stat_key
+            return self._manifest
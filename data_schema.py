@@ -0,0 +1,49 @@
+import numpy as np
+import pandas as pd
+
+# Declared column types of the datasets. Tags and ingredients are not converted
+# here: the app reads them as ListColumns (list_column.py), flat int32 codes into
+# one vocabulary.
+REVIEWS_SCHEMA = {
+    'user_id': 'int32',
+    'recipe_id': 'int32',
+    'rating': 'int8',
+}
+
+RECIPES_SCHEMA = {
+    'recipe_id': 'int32',
+    'minutes': 'int16',
+    'n_steps': 'int16',
+}
+
+
+class SchemaError(ValueError):
+    """Raised when a dataset does not fit its declared schema."""
+
+
+def _to_integer(series, dtype, column):
+    values = pd.to_numeric(series, errors='coerce')
+    if values.isna().any():
+        raise SchemaError(f"column '{column}' has missing or non numeric values")
+    if not np.all(np.mod(values.to_numpy(dtype=np.float64), 1) == 0):
+        raise SchemaError(f"column '{column}' has non integer values")
+    info = np.iinfo(dtype)
+    if len(values) and (values.min() < info.min or values.max() > info.max):
+        raise SchemaError(f"column '{column}' has values outside the {dtype} range [{info.min}, {info.max}]")
+    return values.astype(dtype)
+
+
+def apply_schema(df, schema):
+    """
+    Validate the columns of df against schema and return a copy with the
+    declared dtypes. Columns that are not in the schema are left unchanged.
+    """
+    # columns are replaced, never modified in place, so a shallow copy keeps
+    # memory-mapped columns of df mapped when they already have the declared dtype
+    df = df.copy(deep=False)
+    for column, dtype in schema.items():
+        if column not in df.columns:
+            continue
+        if df[column].dtype != dtype:
+            df[column] = _to_integer(df[column], dtype, column)
+    return df
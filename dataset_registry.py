@@ -0,0 +1,105 @@
+import threading
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+from single_flight import SingleFlight
+
+# versions of a dataset kept at once: the current one and the one it superseded,
+# which sessions still on the previous manifest keep using until their next poll
+VERSIONS_KEPT = 2
+
+
+def dataset_nbytes(obj):
+    """
+    Return (resident_bytes, mapped_bytes) used by a dataset.
+    mapped_bytes is the size of memory-mapped files, which the OS pages in on demand
+    and shares between processes.
+    """
+    if isinstance(obj, pd.DataFrame):
+        return int(obj.memory_usage(index=True, deep=True).sum()), 0
+    if isinstance(obj, np.memmap):
+        return 0, int(obj.nbytes)
+    if isinstance(obj, np.ndarray):
+        return int(obj.nbytes), 0
+    if hasattr(obj, "nbytes"):
+        return obj.nbytes()
+    return 0, 0
+
+
+def dataset_rows(obj):
+    try:
+        return len(obj)
+    except TypeError:
+        return None
+
+
+class DatasetRegistry:
+    """
+    Process-wide registry of read-only datasets.
+    Each dataset is loaded once per version and every session receives a
+    reference to the same object, so memory stays flat as sessions are added.
+    Datasets must not be modified in place, writers publish a new object
+    with replace() instead.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._datasets = {}  # name -> OrderedDict of version -> dataset, oldest first
+        # one load per (name, version) at a time, concurrent sessions wait for it
+        self._loads = SingleFlight()
+
+    def _lookup(self, name, version):
+        with self._lock:
+            return self._datasets.get(name, {}).get(version)
+
+    def get(self, name, version, loader):
+        """
+        Return the dataset for name at version, calling loader() if it is not loaded yet.
+        Loaders run outside the registry lock, so datasets load in parallel and a loader
+        can get the datasets it is built from.
+        """
+        dataset = self._lookup(name, version)
+        if dataset is not None:
+            return dataset
+        return self._loads.do((name, version), lambda: self._load(name, version, loader))
+
+    def _load(self, name, version, loader):
+        # a load of the same version may have finished just before this one started
+        dataset = self._lookup(name, version)
+        if dataset is None:
+            dataset = loader()
+            self._store(name, version, dataset)
+        return dataset
+
+    def _store(self, name, version, dataset):
+        with self._lock:
+            versions = self._datasets.setdefault(name, OrderedDict())
+            versions[version] = dataset
+            # superseded versions are dropped, they stay alive for as long as a running session still references them
+            while len(versions) > VERSIONS_KEPT:
+                versions.popitem(last=False)
+
+    def replace(self, name, dataset, version):
+        """Publish a new version of a dataset to every session, the previous version stays available."""
+        self._store(name, version, dataset)
+
+    def names(self):
+        with self._lock:
+            return list(self._datasets)
+
+    def memory_report(self):
+        """DataFrame with the rows and memory used by each loaded dataset."""
+        with self._lock:
+            entries = [(name, version, dataset) for name, versions in self._datasets.items()
+                       for version, dataset in versions.items()]
+        report = []
+        for name, version, dataset in entries:
+            resident, mapped = dataset_nbytes(dataset)
+            report.append({
+                'dataset': name,
+                'version': str(version),
+                'rows': dataset_rows(dataset),
+                'memory_mb': round(resident / 1e6, 2),
+                'mapped_mb': round(mapped / 1e6, 2),
+            })
+        return pd.DataFrame(report, columns=['dataset', 'version', 'rows', 'memory_mb', 'mapped_mb'])
@@ -0,0 +1,137 @@
+import os
+import numpy as np
+import scipy.sparse as sp
+from id_map import IdMap
+from prediction_store import UserRowIndex, USER_IDS_FILE, RECIPE_IDS_FILE
+from neighbor_index import centered_ratings, RECIPE_MEANS_FILE, GLOBAL_MEAN_FILE
+
+# file names inside a factor model folder
+USER_FACTORS_FILE = "user_factors.npy"
+ITEM_FACTORS_FILE = "item_factors.npy"
+REGULARIZATION_FILE = "regularization.npy"
+
+# default hyperparameters of the ALS trainer
+FACTORS = 32
+REGULARIZATION = 0.1
+ITERATIONS = 15
+
+
+def solve_factors(rated, values, reg):
+    """
+    Least squares factors of one user or recipe against the fixed factors of what it
+    rated (one row per rating), ridge weighted by the number of ratings.
+    """
+    gram = rated.T @ rated + reg * len(rated) * np.eye(rated.shape[1])
+    return np.linalg.solve(gram, rated.T @ values)
+
+
+def _solve_rows(fixed, matrix, reg):
+    """
+    One half step of ALS: solve_factors for every row of the CSR matrix against
+    the fixed factors of its rated columns. Rows without ratings get zero factors.
+    """
+    factors = np.zeros((matrix.shape[0], fixed.shape[1]))
+    for row in range(matrix.shape[0]):
+        start, stop = matrix.indptr[row], matrix.indptr[row + 1]
+        if start < stop:
+            factors[row] = solve_factors(fixed[matrix.indices[start:stop]], matrix.data[start:stop], reg)
+    return factors
+
+
+def train_als(user_idx, item_idx, values, n_users, n_items, factors=FACTORS, reg=REGULARIZATION,
+              iterations=ITERATIONS, seed=0):
+    """
+    Factorize the sparse ratings (user_idx[i], item_idx[i]) -> values[i] into user and
+    item factors, values ~= user_factors[u] . item_factors[i], by alternating least squares.
+    Only the observed ratings are fitted. Returns (user_factors, item_factors) as float32.
+    """
+    ratings = sp.csr_matrix((np.asarray(values, dtype=np.float64), (user_idx, item_idx)), shape=(n_users, n_items))
+    ratings_t = ratings.T.tocsr()
+    rng = np.random.default_rng(seed)
+    item_factors = rng.normal(scale=0.1, size=(n_items, factors))
+    user_factors = np.zeros((n_users, factors))
+    for _ in range(iterations):
+        user_factors = _solve_rows(item_factors, ratings, reg)
+        item_factors = _solve_rows(user_factors, ratings_t, reg)
+    return user_factors.astype(np.float32), item_factors.astype(np.float32)
+
+
+def predict_pairs(user_factors, item_factors, user_idx, item_idx):
+    """Predicted ratings of (user, item) position pairs, e.g. of a test set."""
+    return np.einsum('ij,ij->i', user_factors[user_idx], item_factors[item_idx], dtype=np.float64)
+
+
+def save_factors(folder, user_factors, item_factors, user_ids, recipe_ids, recipe_means, global_mean, reg=REGULARIZATION):
+    """
+    Save a factor model: user_factors[i] is the embedding of user_ids[i] and
+    item_factors[j] the embedding of recipe_ids[j], both float32. The rating
+    baseline and the regularization are kept to fold in new ratings.
+    """
+    os.makedirs(folder, exist_ok=True)
+    np.save(os.path.join(folder, USER_FACTORS_FILE), np.asarray(user_factors, dtype=np.float32))
+    np.save(os.path.join(folder, ITEM_FACTORS_FILE), np.asarray(item_factors, dtype=np.float32))
+    np.save(os.path.join(folder, USER_IDS_FILE), np.asarray(user_ids, dtype=np.int64))
+    np.save(os.path.join(folder, RECIPE_IDS_FILE), np.asarray(recipe_ids, dtype=np.int64))
+    np.save(os.path.join(folder, RECIPE_MEANS_FILE), np.asarray(recipe_means, dtype=np.float32))
+    np.save(os.path.join(folder, GLOBAL_MEAN_FILE), np.float32(global_mean))
+    np.save(os.path.join(folder, REGULARIZATION_FILE), np.float32(reg))
+
+
+class FactorModel(UserRowIndex):
+    """
+    Matrix factorization model served like a prediction store: the scores of a
+    user are one vector-matrix product of their embedding with the item
+    embeddings, instead of a stored row of the dense prediction matrix.
+    """
+
+    def __init__(self, folder):
+        self.folder = folder
+        self.user_factors = np.load(os.path.join(folder, USER_FACTORS_FILE), mmap_mode='r')
+        # every lookup multiplies with all item factors, they are kept in memory
+        self.item_factors = np.load(os.path.join(folder, ITEM_FACTORS_FILE))
+        self.recipe_ids = np.load(os.path.join(folder, RECIPE_IDS_FILE))
+        # recipe_id -> position in the score vectors
+        self.recipe_index = IdMap(self.recipe_ids)
+        self.recipe_means = np.load(os.path.join(folder, RECIPE_MEANS_FILE))
+        self.global_mean = float(np.load(os.path.join(folder, GLOBAL_MEAN_FILE)))
+        self.reg = float(np.load(os.path.join(folder, REGULARIZATION_FILE)))
+        super().__init__(np.load(os.path.join(folder, USER_IDS_FILE)))
+
+    @property
+    def factors(self):
+        return self.item_factors.shape[1]
+
+    def nbytes(self):
+        """(resident, memory-mapped) bytes of the model."""
+        return self.index_nbytes() + self.recipe_index.nbytes() + self.item_factors.nbytes, self.user_factors.nbytes
+
+    def user_vector(self, user_id):
+        """The embedding of a user (folded in or trained), or None."""
+        if user_id in self._folded:
+            return self._folded[user_id]
+        row = self.row_of(user_id)
+        return np.asarray(self.user_factors[row]) if row is not None else None
+
+    def get_scores(self, user_id):
+        """Return the predicted ratings of a user as a 1-D array aligned with recipe_ids."""
+        vector = self.user_vector(user_id)
+        return self.item_factors @ vector if vector is not None else None
+
+    def fold_in(self, user_id, recipe_ids, ratings):
+        """
+        Re-solve the embedding of a user from all their current ratings against the
+        fixed item factors, as one ALS half step does for every user. The cost depends
+        on the user's ratings and the embedding size only, new users get an embedding too.
+        """
+        centered, positions = centered_ratings(self, recipe_ids, ratings)
+        known = positions >= 0
+        if not known.any():
+            return
+        rated = self.item_factors[positions[known]].astype(np.float64)
+        self._folded[user_id] = solve_factors(rated, centered[known], self.reg).astype(np.float32)
+
+    def _folded_rows(self, values):
+        return {USER_FACTORS_FILE: np.asarray(values, dtype=np.float32).reshape(len(values), self.factors)}
+
+    def _folded_values(self, arrays):
+        return list(arrays[USER_FACTORS_FILE])
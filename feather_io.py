@@ -0,0 +1,53 @@
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+
+# compression codecs the data files can be written with
+CODECS = ["uncompressed", "lz4", "zstd"]
+# pandas' to_feather default
+DEFAULT_CODEC = "lz4"
+
+
+def write_feather(df, path, codec=DEFAULT_CODEC):
+    """
+    Write a DataFrame as a feather file compressed with one of CODECS.
+    The file holds a single record batch, so every column of an uncompressed
+    file is one contiguous buffer that read_feather can map without copying.
+    """
+    if codec not in CODECS:
+        raise ValueError(f"Unsupported codec '{codec}'. Supported codecs: {', '.join(CODECS)}")
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    feather.write_feather(table, path, compression=codec, chunksize=max(len(df), 1))
+
+
+def _column_to_pandas(column):
+    # fixed width columns without nulls in a single chunk are used in place:
+    # for an uncompressed file that is the memory-mapped file itself
+    if column.num_chunks == 1 and column.null_count == 0:
+        try:
+            return column.chunk(0).to_numpy(zero_copy_only=True)
+        except pa.ArrowInvalid:
+            pass
+    return column.to_pandas()
+
+
+def read_feather(path, columns=None):
+    """
+    Read a feather file (any codec) into a DataFrame through a memory map.
+    Numeric columns of uncompressed files stay in the page cache, shared by every
+    process that reads the file, instead of being copied into the heap. They are
+    read-only, callers copy a frame before modifying it.
+    """
+    table = feather.read_table(path, columns=columns, memory_map=True)
+    # the pandas index is stored as columns (e.g. '__index_level_0__'), they become the index again
+    metadata = table.schema.pandas_metadata or {}
+    index_names = {column['field_name']: column['name'] for column in metadata.get('columns', [])}
+    index_columns = [name for name in metadata.get('index_columns', []) if isinstance(name, str) and name in table.column_names]
+    df = pd.DataFrame({name: _column_to_pandas(table.column(name)) for name in table.column_names
+                       if name not in index_columns}, copy=False)
+    if len(index_columns) == 1:
+        df.index = pd.Index(_column_to_pandas(table.column(index_columns[0])), name=index_names.get(index_columns[0]))
+    elif index_columns:
+        df.index = pd.MultiIndex.from_arrays([_column_to_pandas(table.column(name)) for name in index_columns],
+                                             names=[index_names.get(name) for name in index_columns])
+    return df
@@ -5,43 +5,61 @@ from recipe_display import show_recipe_description, view_recipe_callback
 from streamlit_extras.add_vertical_space import add_vertical_space
 import pandas as pd
 import numpy as np
-from recipe_recommend import getRecommendations
+from recipe_recommend import getRecommendations, has_predictions, strategy_version, explain_recommendations
+from data_loader import get_page_cache, load_popularity
 
-@st.cache_data
 def get_recipes(personalized="Popular"):
-    reviews_df = st.session_state.reviews_df
-    recipes_df = st.session_state.recipes_df
-    if st.session_state.logged_in:
-        user_id = st.session_state.user_data.get('user_id')
+    """
+    The recommendation page of the logged in user (or the anonymous Popular page),
+    from the process-wide page cache keyed by user, type and trained version.
+    """
+    user_id = st.session_state.user_data.get('user_id') if st.session_state.logged_in else None
+    # with the user's rating count in the version, a page cached by another process
+    # before they rated (and had the rating folded in) is not served after it
+    rated = len(st.session_state.rating_index.rated_recipes(user_id)) if user_id is not None else 0
+    version = f"{strategy_version(st.session_state.data_manifest, personalized)}:{rated}"
+    if personalized == "Popular":
+        # ratings update the ranking in place for everyone, the pages are rebuilt when it is
+        # reordered, the review counts shown on a cached page may lag until then
+        version += f":{load_popularity(st.session_state.data_manifest).ranking_version()}"
+    return get_page_cache().get(user_id, personalized, version, lambda: build_recipes(personalized, user_id))
+
+def build_recipes(personalized, user_id):
+    catalog = st.session_state.recipe_catalog
     recommended_recipes = None
-    # Calculate popularity metrics
-    recipe_stats = reviews_df.groupby('recipe_id').agg(
-        num_reviews=('rating', 'count'),
-        avg_rating=('rating', 'mean')
-    ).reset_index()
-    recipe_stats['popularity_score'] = recipe_stats['avg_rating'] * np.log(recipe_stats['num_reviews'])
-    recommended_recipes = pd.merge(recipe_stats, 
-                               recipes_df, 
-                               on='recipe_id', how='left')
+    # review counts, average ratings and popularity ranking, shared by every session
+    popularity = load_popularity(st.session_state.data_manifest)
     if personalized=="User-Based":
         recommendations = getRecommendations(user_id, "User-Based", 20)
-        # Extract recipe IDs from the recommendations dictionary
+        # Extract recipe IDs from the recommendations dictionary, the order matches the recommendations
         recommended_recipe_ids = list(recommendations.keys())
-        # Ensure the order matches recommendations dict
-        recommended_recipes = recommended_recipes.set_index('recipe_id').reindex(recommended_recipe_ids).reset_index()
     elif personalized=="Item-Based":
         recommendations = getRecommendations(user_id, "Item-Based", 20)
-        # Extract recipe IDs from the recommendations dictionary
+        # Extract recipe IDs from the recommendations dictionary, the order matches the recommendations
+        recommended_recipe_ids = list(recommendations.keys())
+    elif personalized=="Matrix Factorization":
+        recommendations = getRecommendations(user_id, "Matrix Factorization", 20)
+        recommended_recipe_ids = list(recommendations.keys())
+    elif personalized=="Content-Based":
+        recommendations = getRecommendations(user_id, "Content-Based", 20)
         recommended_recipe_ids = list(recommendations.keys())
-        # Ensure the order matches recommendations dict
-        recommended_recipes = recommended_recipes.set_index('recipe_id').reindex(recommended_recipe_ids).reset_index()
     elif personalized=="Popular":
+        recipes_rated = None
         if st.session_state.logged_in:  # if user is logged in only show those recipes which have not been rated
-            recipes_rated = reviews_df[reviews_df['user_id'] == user_id]['recipe_id'].unique()
-            recommended_recipes = recommended_recipes[~recommended_recipes['recipe_id'].isin(recipes_rated)]
-        recommended_recipes = recommended_recipes.sort_values(by='popularity_score', ascending=False).drop(columns=['popularity_score']).head(15)
+            recipes_rated = st.session_state.rating_index.rated_recipes(user_id)
+        recommended_recipe_ids = popularity.top(15, exclude=recipes_rated).tolist()
     else:
-        st.error("invalid recommedation type, please select, User-Based, Item-Based or Popular")
+        st.error("invalid recommedation type, please select, User-Based, Item-Based, Matrix Factorization, Content-Based or Popular")
+        return recommended_recipes
+    # only the shown recipes are taken from the catalog, in order, and get their review stats
+    recommended_recipes = catalog.take(recommended_recipe_ids)
+    num_reviews, avg_rating = popularity.stats(recommended_recipes['recipe_id'].to_numpy())
+    recommended_recipes.insert(1, 'num_reviews', num_reviews)
+    recommended_recipes.insert(2, 'avg_rating', avg_rating)
+    if personalized=="Item-Based":
+        # the rated recipes behind every item-based recommendation, shown on the cards
+        explanations = explain_recommendations(user_id, recommended_recipe_ids)
+        recommended_recipes['because'] = [', '.join(explanations.get(recipe_id, [])) for recipe_id in recommended_recipes['recipe_id'].tolist()]
     return recommended_recipes
 
 
@@ -49,8 +67,8 @@ def search_recipe_callback():
     st.session_state.current_page = "recipe_search"
 
 def recommeded_recipes_callback():
+    # the user's cached pages were invalidated if they submitted feedback
     view_recipe_callback(None, False)
-    get_recipes.clear(personalized=st.session_state.rec_choice) # clear the cache to reload the updated data removing the rated recipe
 
 def show_recipes(recommended_recipes):
     # Create a grid of boxes (3 columns)
@@ -89,7 +107,7 @@ def show_recipes(recommended_recipes):
                             border-radius: 8px;
                             overflow: hidden;
                         ">
-                            <img src="{row['Images'][0]}" style="
+                            <img src="{row['image']}" style="
                                 height: 100%;
                                 width: 100%;
                                 object-fit: cover;
@@ -121,6 +139,8 @@ def show_recipes(recommended_recipes):
                         """,
                         unsafe_allow_html=True
                     )
+                    if row.get('because'):
+                        st.caption(f"💡 Because you rated {row['because']}")
                     # Create columns for rating and button
                     col1, col2 = st.columns([2, 3])  # Adjust ratio as needed
                     
@@ -423,20 +443,19 @@ def app():
                     )
 
 
-        has_user_based = (
-            "user_pred_df" in st.session_state 
-            and (st.session_state.user_pred_df is not None)
-            and user_id in st.session_state.user_pred_df['user_id'].values
-        )
-        has_item_based = (
-            "item_pred_df" in st.session_state 
-            and (st.session_state.item_pred_df is not None)
-            and user_id in st.session_state.item_pred_df['user_id'].values
-        )
+        has_user_based = st.session_state.logged_in and has_predictions(user_id, "User-Based")
+        has_item_based = st.session_state.logged_in and has_predictions(user_id, "Item-Based")
+        has_content_based = st.session_state.logged_in and has_predictions(user_id, "Content-Based")
         # Display recommendations based on selection
         if st.session_state.rec_choice:
+            # users the last training did not cover (e.g. new signups) get recommendations
+            # from the tags and ingredients of what they rated so far instead of a warning
+            personalized = st.session_state.rec_choice
+            if (personalized == "User-Based" and not has_user_based) or (personalized == "Item-Based" and not has_item_based):
+                if has_content_based:
+                    personalized = "Content-Based"
             # If the user has not rated any item show warning
-            if st.session_state.rec_choice == "User-Based" and not has_user_based:
+            if personalized == "User-Based" and not has_user_based:
                 col1, col2 = st.columns([3,1])
                 with col1:
                     st.markdown("""
@@ -479,7 +498,7 @@ def app():
                 return
 
             # Item-Based Recommendations
-            if st.session_state.rec_choice == "Item-Based" and not has_item_based:
+            if personalized == "Item-Based" and not has_item_based:
                 col1,col2 = st.columns([2,1])
                 with col1:
                     st.markdown("""
@@ -521,12 +540,15 @@ def app():
                     st.button("← Back to Recommendation Options", type="secondary", on_click=handle_options_btn, args=(None,))
                 return
 
-            if st.session_state.rec_choice == "User-Based":
+            if personalized == "User-Based":
                 header_text = "✨ Your Personalized Recommendations"
                 subheader_text = "Recipes we think you'll love based on your preferences!"
-            elif st.session_state.rec_choice == "Item-Based":
+            elif personalized == "Item-Based":
                 header_text = "🔍 Recipes Similar to Your Favorites"
                 subheader_text = "Discover recipes similar to the ones you've liked!"
+            elif personalized == "Content-Based":
+                header_text = "🥕 Picked From Your First Ratings"
+                subheader_text = "Recipes sharing the tags and ingredients of the ones you rated, keep rating to sharpen them!"
             else:
                 if st.session_state.logged_in:
                     user_name = st.session_state.user_data.get('name', '')
@@ -535,7 +557,7 @@ def app():
                     header_text = f"👋 Welcome! Check Out Popular Recipes"
                 subheader_text = "Not sure what to cook? Here are some of the most-loved recipes!"
 
-            recommended_recipes = get_recipes(personalized=st.session_state.rec_choice)
+            recommended_recipes = get_recipes(personalized=personalized)
 
             # UI rendering
             # Check if a recipe description should be shown    
@@ -0,0 +1,87 @@
+import os
+import pickle
+import numpy as np
+
+# files of an id map folder
+RAW_IDS_FILE = "raw_ids.npy"
+SORTED_IDS_FILE = "sorted_ids.npy"
+ORDER_FILE = "order.npy"
+
+
+class IdMap:
+    """
+    Bidirectional map between raw ids (e.g. Food.com user and recipe ids) and
+    contiguous indices, backed by NumPy arrays instead of Python dicts.
+    raw_ids[index] is the raw id of an index, raw ids are found by binary search
+    in a sorted copy. Both directions are vectorized.
+    """
+
+    def __init__(self, raw_ids, sorted_ids=None, order=None):
+        self.raw_ids = np.asarray(raw_ids)
+        if sorted_ids is None or order is None:
+            order = np.argsort(self.raw_ids, kind='stable')
+            sorted_ids = self.raw_ids[order]
+        self._sorted_ids = sorted_ids
+        self._order = order
+
+    @classmethod
+    def load(cls, folder, mmap_mode='r'):
+        """Open an id map saved by save_id_map, memory-mapped by default."""
+        return cls(*(np.load(os.path.join(folder, name), mmap_mode=mmap_mode)
+                     for name in (RAW_IDS_FILE, SORTED_IDS_FILE, ORDER_FILE)))
+
+    @property
+    def sorted_ids(self):
+        return self._sorted_ids
+
+    def __len__(self):
+        return len(self.raw_ids)
+
+    def index_of(self, raw_id):
+        """Index of a single raw id, or None if it is unknown."""
+        if raw_id is None or len(self._sorted_ids) == 0:
+            return None
+        pos = np.searchsorted(self._sorted_ids, raw_id)
+        if pos < len(self._sorted_ids) and self._sorted_ids[pos] == raw_id:
+            return int(self._order[pos])
+        return None
+
+    def to_index(self, raw_ids):
+        """Vectorized index_of, unknown raw ids get -1."""
+        raw_ids = np.asarray(raw_ids)
+        if len(self._sorted_ids) == 0:
+            return np.full(raw_ids.shape, -1, dtype=np.int64)
+        pos = np.searchsorted(self._sorted_ids, raw_ids)
+        pos = np.minimum(pos, len(self._sorted_ids) - 1)
+        found = self._sorted_ids[pos] == raw_ids
+        return np.where(found, self._order[pos], -1)
+
+    def to_raw(self, indices):
+        """Raw ids of the given indices."""
+        return self.raw_ids[np.asarray(indices)]
+
+    def nbytes(self):
+        return self.raw_ids.nbytes + self._sorted_ids.nbytes + self._order.nbytes
+
+
+def save_id_map(folder, raw_ids):
+    """
+    Save the raw id of every index (e.g. the uniques returned by pd.factorize)
+    as an id map folder that IdMap.load can memory-map.
+    """
+    id_map = IdMap(raw_ids)
+    os.makedirs(folder, exist_ok=True)
+    np.save(os.path.join(folder, RAW_IDS_FILE), id_map.raw_ids)
+    np.save(os.path.join(folder, SORTED_IDS_FILE), id_map.sorted_ids)
+    np.save(os.path.join(folder, ORDER_FILE), id_map._order.astype(np.int32))
+    return id_map
+
+
+def convert_pickle_mapping(pkl_path, folder):
+    """Convert a {raw_id: index} dict pickle written by older notebooks into an id map folder."""
+    with open(pkl_path, "rb") as f:
+        mapping = pickle.load(f)
+    raw_ids = np.empty(len(mapping), dtype=np.int64)
+    raw_ids[np.fromiter(mapping.values(), dtype=np.int64, count=len(mapping))] = \
+        np.fromiter(mapping.keys(), dtype=np.int64, count=len(mapping))
+    return save_id_map(folder, raw_ids)
@@ -0,0 +1,98 @@
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+
+
+class ListColumn:
+    """
+    A list-of-strings column (tags, ingredients, steps, Images) stored flat,
+    like an Arrow list array: every row is codes[offsets[i]:offsets[i + 1]],
+    and codes are int32 ids into a dictionary of the distinct values.
+    Filters, counts and explodes run as NumPy operations over all rows at once.
+    """
+
+    def __init__(self, codes, offsets, vocabulary):
+        self.codes = codes
+        self.offsets = offsets
+        # kept as an Arrow string array, a lot more compact than Python strings
+        self.vocabulary = vocabulary
+        self._row_ids = None
+
+    @classmethod
+    def from_arrow(cls, array):
+        """Build from an Arrow list<string> array or chunked array, null lists become empty rows."""
+        if isinstance(array, pa.ChunkedArray):
+            array = array.combine_chunks()
+        lengths = pc.list_value_length(array).fill_null(0).to_numpy(zero_copy_only=False)
+        offsets = np.zeros(len(lengths) + 1, dtype=np.int32)
+        np.cumsum(lengths, out=offsets[1:])
+        encoded = pc.dictionary_encode(pc.list_flatten(array))
+        codes = encoded.indices.to_numpy(zero_copy_only=False).astype(np.int32)
+        return cls(codes, offsets, encoded.dictionary)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def lengths(self):
+        return np.diff(self.offsets)
+
+    def row_ids(self):
+        """Row of every flat value, the 'explode' of the column."""
+        if self._row_ids is None:
+            self._row_ids = np.repeat(np.arange(len(self), dtype=np.int32), self.lengths())
+        return self._row_ids
+
+    def row(self, i):
+        """The values of one row as a list of strings."""
+        return self.vocabulary.take(self.codes[self.offsets[i]:self.offsets[i + 1]]).to_pylist()
+
+    def explode(self):
+        """(row, code) pairs of every value, one per list element."""
+        return self.row_ids(), self.codes
+
+    def codes_of(self, values):
+        """Dictionary codes of the given values, -1 for values that never occur."""
+        codes = pc.index_in(pa.array(list(values), type=self.vocabulary.type), value_set=self.vocabulary)
+        return codes.fill_null(-1).to_numpy(zero_copy_only=False)
+
+    def value_counts(self):
+        """Number of occurrences of every dictionary value, indexed by code."""
+        return np.bincount(self.codes, minlength=len(self.vocabulary))
+
+    def rows_with_any(self, value_mask):
+        """Rows holding at least one value whose code is set in the boolean value_mask."""
+        hits = value_mask[self.codes]
+        return np.bincount(self.row_ids()[hits], minlength=len(self)) > 0
+
+    def rows_containing_all(self, values):
+        """Boolean mask of the rows that contain every one of the values."""
+        mask = np.ones(len(self), dtype=bool)
+        for code in self.codes_of(values):
+            if code < 0:
+                return np.zeros(len(self), dtype=bool)
+            mask &= self.rows_with_any(np.arange(len(self.vocabulary)) == code)
+        return mask
+
+    def rows_matching_all(self, substrings, ignore_case=True):
+        """
+        Boolean mask of the rows where every substring occurs in at least one value.
+        Each substring is matched once against the dictionary, not against every row.
+        """
+        mask = np.ones(len(self), dtype=bool)
+        for substring in substrings:
+            value_mask = pc.match_substring(self.vocabulary, substring, ignore_case=ignore_case)
+            mask &= self.rows_with_any(value_mask.to_numpy(zero_copy_only=False))
+        return mask
+
+    def first_values(self):
+        """First value of every row, None for empty rows."""
+        first = np.full(len(self), None, dtype=object)
+        nonempty = np.flatnonzero(self.lengths() > 0)
+        first[nonempty] = self.vocabulary.take(self.codes[self.offsets[nonempty]]).to_numpy(zero_copy_only=False)
+        return first
+
+    def nbytes(self):
+        total = self.codes.nbytes + self.offsets.nbytes + self.vocabulary.nbytes
+        if self._row_ids is not None:
+            total += self._row_ids.nbytes
+        return total
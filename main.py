@@ -1,7 +1,8 @@
 import streamlit as st
 from streamlit_option_menu import option_menu
-from data_loader import load_data, load_user_predictions
-import os
+from data_loader import (current_manifest, load_reviews, load_rating_index, load_recipe_catalog, load_prediction_store,
+                         load_top_k_store, load_neighbor_table, load_factor_model,
+                         load_ann_index, load_content_index)
 import about, account, recipe_search, login, contact, home, admin, recipe_recommend
 from styles import apply_styles
 from recipe_display import view_recipe_callback
@@ -15,29 +16,49 @@ st.set_page_config(
     )
 
 # initialize session state for the dataframes
+if "data_manifest" not in st.session_state:
+    st.session_state.data_manifest = None
 if "reviews_df" not in st.session_state:
     st.session_state.reviews_df = None
+if "rating_index" not in st.session_state:
+    st.session_state.rating_index = None
 if "recipes_df" not in st.session_state:
     st.session_state.recipes_df = None
-if "user_pred_df" not in st.session_state:
-    st.session_state.user_pred_df = None
-if "item_pred_df" not in st.session_state:
-    st.session_state.item_pred_df = None
-
-# Define the columns to load for recipes_df
-columns_to_load = ['recipe_id', 'tags', 'name', 'minutes', 'n_steps', 'steps', 'description', 'ingredients', 'Images']
+if "recipe_catalog" not in st.session_state:
+    st.session_state.recipe_catalog = None
+if "user_pred_store" not in st.session_state:
+    st.session_state.user_pred_store = None
+if "item_pred_store" not in st.session_state:
+    st.session_state.item_pred_store = None
+if "user_topk_store" not in st.session_state:
+    st.session_state.user_topk_store = None
+if "item_topk_store" not in st.session_state:
+    st.session_state.item_topk_store = None
+if "user_neighbors" not in st.session_state:
+    st.session_state.user_neighbors = None
+if "item_neighbors" not in st.session_state:
+    st.session_state.item_neighbors = None
+if "mf_model" not in st.session_state:
+    st.session_state.mf_model = None
+if "item_ann" not in st.session_state:
+    st.session_state.item_ann = None
+if "content_index" not in st.session_state:
+    st.session_state.content_index = None
 
 # Load datasets using the generalized function
 with st.spinner("Loading datasets..."):
     try:
-        #print("loading reviews_df in the main.py")
-        reviews_mod_time = os.path.getmtime('Data/reviews_df.feather')
-        recipes_mod_time = os.path.getmtime('Data/recipes_clean.feather')
-        user_pred_time = os.path.getmtime('Data/user_pred.feather')
-        item_pred_time = os.path.getmtime('Data/item_pred.feather')
-
-        st.session_state.reviews_df = load_data('Data/reviews_df.feather', reviews_mod_time)
-        st.session_state.recipes_df = load_data('Data/recipes_clean.feather', recipes_mod_time, columns=columns_to_load)
+        # one manifest snapshot per rerun, so all datasets come from the same version;
+        # a new version published by training or feedback is picked up on the next rerun
+        st.session_state.data_manifest = current_manifest()
+        st.session_state.reviews_df = load_reviews(st.session_state.data_manifest)
+        # user -> rated recipes, for the "already rated" checks without scanning the reviews
+        st.session_state.rating_index = load_rating_index(st.session_state.data_manifest)
+        # recipes_df only holds the listing columns, details are loaded by the catalog on demand
+        st.session_state.recipe_catalog = load_recipe_catalog(st.session_state.data_manifest)
+        st.session_state.recipes_df = st.session_state.recipe_catalog.listing
+        # tag and ingredient vectors of the recipes, recommends from a user's first ratings without training
+        st.session_state.content_index = load_content_index(st.session_state.data_manifest)
     except Exception as e:
         st.error("Failed to load data files. Please check your 'Data/' folder.")
         #st.exception(e)
@@ -77,21 +98,27 @@ if st.session_state.logged_in:
 
     apply_styles()
     
+    # Open the prediction stores, only the index is held in memory and the
+    # score matrices are memory-mapped, so a user's row is read on demand
+    try:
+        manifest = st.session_state.data_manifest
+        st.session_state.user_pred_store = load_prediction_store(manifest, 'user_pred')
+        st.session_state.item_pred_store = load_prediction_store(manifest, 'item_pred')
+        # compact top-K recommendations, used for serving whenever they hold enough recipes
+        st.session_state.user_topk_store = load_top_k_store(manifest, 'user_pred_topk')
+        st.session_state.item_topk_store = load_top_k_store(manifest, 'item_pred_topk')
+        # pruned similarity graphs, used to score users at request time in the 'neighbors' serving mode
+        st.session_state.user_neighbors = load_neighbor_table(manifest, 'user_neighbors')
+        st.session_state.item_neighbors = load_neighbor_table(manifest, 'item_neighbors')
+        # approximate nearest neighbor index of the recipes, queried in the 'ann' serving mode
+        st.session_state.item_ann = load_ann_index(manifest)
+        # user and recipe embeddings of the matrix factorization model, trained from Model Management
+        st.session_state.mf_model = load_factor_model(manifest)
+    except Exception as e:
+        st.error("Oops... couldn't load prediction data. please check your 'Data/' folder")
+
     # Different menu for admin vs regular users
     if st.session_state.user_role == "admin":
-        try:
-            st.session_state.user_pred_df = load_data('Data/user_pred.feather', user_pred_time)
-            st.session_state.item_pred_df = load_data('Data/item_pred.feather', item_pred_time)
-            # Convert all columns (except 'user_id') to integers
-            st.session_state.user_pred_df.columns = [
-                int(col) if col != 'user_id' else col for col in st.session_state.user_pred_df.columns
-            ]
-            # Convert all columns (except 'user_id') to integers
-            st.session_state.item_pred_df.columns = [
-                int(col) if col != 'user_id' else col for col in st.session_state.item_pred_df.columns
-            ]
-        except Exception as e:
-            st.error("Oops.. couldn't load data. Something happended. please check your 'Data/' folder")
         app = option_menu(
             menu_title=None,
             options=["Admin","recommendations", "Account"],
@@ -142,23 +169,6 @@ if st.session_state.logged_in:
         except Exception as e:
             st.error("An unexpected error occured.")
     else:
-        try:
-            st.session_state.user_pred_df = load_user_predictions(st.session_state.user_data.get('user_id', None), 'Data/user_pred.feather', user_pred_time)
-            st.session_state.item_pred_df = load_user_predictions(st.session_state.user_data.get('user_id', None), 'Data/item_pred.feather', item_pred_time)
-            
-            if st.session_state.user_pred_df is not None:
-                # Convert all columns (except 'user_id') to integers
-                st.session_state.user_pred_df.columns = [
-                    int(col) if col != 'user_id' else col for col in st.session_state.user_pred_df.columns
-                ]
-            if st.session_state.item_pred_df is not None:
-                # Convert all columns (except 'user_id') to integers
-                st.session_state.item_pred_df.columns = [
-                    int(col) if col != 'user_id' else col for col in st.session_state.item_pred_df.columns
-                ]
-        except Exception as e:
-            st.error("Oops... couldn't load user prediction data. please check your 'Data/' folder")
-            st.error(e)
         # Track previous page
         if 'previous_page' not in st.session_state:
             st.session_state.previous_page = None
@@ -0,0 +1,253 @@
+import os
+import numpy as np
+from id_map import IdMap
+
+# files of a neighbor table folder
+ROW_IDS_FILE = "row_ids.npy"
+NEIGHBOR_IDS_FILE = "neighbor_ids.npy"
+NEIGHBOR_SIMS_FILE = "neighbor_sims.npy"
+RECIPE_IDS_FILE = "recipe_ids.npy"
+RECIPE_MEANS_FILE = "recipe_means.npy"
+GLOBAL_MEAN_FILE = "global_mean.npy"
+DENSE_NORMS_FILE = "dense_norms.npy"
+
+# neighbors kept per user or recipe
+NEIGHBORS = 50
+# rows of the similarity matrix pruned at once
+NEIGHBOR_BLOCK_SIZE = 1024
+# rated recipes named as the reason of an item-based recommendation
+EXPLANATIONS = 2
+
+
+def top_k_neighbors(similarity, k=NEIGHBORS):
+    """
+    Prune a square similarity matrix to the k most similar other rows of every row.
+    Returns (positions, sims) as (N, k) int32/float32 arrays sorted most similar first,
+    slots without a neighbor (zero similarity) hold position -1 and similarity 0.
+    """
+    n_rows = similarity.shape[0]
+    k = min(k, n_rows - 1)
+    positions = np.full((n_rows, k), -1, dtype=np.int32)
+    sims = np.zeros((n_rows, k), dtype=np.float32)
+    for start in range(0, n_rows, NEIGHBOR_BLOCK_SIZE):
+        stop = min(start + NEIGHBOR_BLOCK_SIZE, n_rows)
+        block = np.array(similarity[start:stop], dtype=np.float64)
+        # a row is not its own neighbor
+        block[np.arange(stop - start), np.arange(start, stop)] = -np.inf
+        cols = np.argpartition(-block, k - 1, axis=1)[:, :k]
+        block_sims = np.take_along_axis(block, cols, axis=1)
+        order = np.argsort(-block_sims, axis=1, kind='stable')
+        cols = np.take_along_axis(cols, order, axis=1)
+        block_sims = np.take_along_axis(block_sims, order, axis=1)
+        valid = np.isfinite(block_sims) & (block_sims != 0)
+        positions[start:stop] = np.where(valid, cols, -1)
+        sims[start:stop] = np.where(valid, block_sims, 0)
+    return positions, sims
+
+
+def save_neighbors(folder, similarity, row_ids, recipe_ids, recipe_means, global_mean, k=NEIGHBORS):
+    """
+    Save the pruned top-k neighbor table of a user-user or recipe-recipe similarity
+    matrix whose rows are row_ids, with the rating baseline (mean rating of every
+    recipe and the global mean) used to center ratings when scoring, and the sum of
+    the absolute similarities of every row before pruning, which normalized the dense
+    predictions.
+    """
+    row_ids = np.asarray(row_ids, dtype=np.int64)
+    positions, sims = top_k_neighbors(similarity, k)
+    dense_norms = np.concatenate([np.abs(np.asarray(similarity[start:start + NEIGHBOR_BLOCK_SIZE])).sum(axis=1)
+                                  for start in range(0, similarity.shape[0], NEIGHBOR_BLOCK_SIZE)])
+    neighbor_ids = np.where(positions >= 0, row_ids[np.maximum(positions, 0)], -1).astype(np.int32)
+    os.makedirs(folder, exist_ok=True)
+    np.save(os.path.join(folder, ROW_IDS_FILE), row_ids)
+    np.save(os.path.join(folder, NEIGHBOR_IDS_FILE), neighbor_ids)
+    np.save(os.path.join(folder, NEIGHBOR_SIMS_FILE), sims)
+    np.save(os.path.join(folder, RECIPE_IDS_FILE), np.asarray(recipe_ids, dtype=np.int64))
+    np.save(os.path.join(folder, RECIPE_MEANS_FILE), np.asarray(recipe_means, dtype=np.float32))
+    np.save(os.path.join(folder, GLOBAL_MEAN_FILE), np.float32(global_mean))
+    np.save(os.path.join(folder, DENSE_NORMS_FILE), dense_norms.astype(np.float32))
+
+
+class NeighborTable:
+    """
+    Pruned top-k similarity graph of users or recipes: row i holds the ids and
+    similarities of the k most similar users/recipes of row_ids[i], as fixed-width
+    int32/float32 arrays (-1 padded). Its size grows with the number of rows
+    times k, not with users x recipes.
+    """
+
+    def __init__(self, folder):
+        self.folder = folder
+        self.neighbor_ids = np.load(os.path.join(folder, NEIGHBOR_IDS_FILE), mmap_mode='r')
+        self.sims = np.load(os.path.join(folder, NEIGHBOR_SIMS_FILE), mmap_mode='r')
+        self.rows = IdMap(np.load(os.path.join(folder, ROW_IDS_FILE)))
+        self.recipe_ids = np.load(os.path.join(folder, RECIPE_IDS_FILE))
+        # recipe_id -> position in the score vectors
+        self.recipe_index = IdMap(self.recipe_ids)
+        self.recipe_means = np.load(os.path.join(folder, RECIPE_MEANS_FILE))
+        self.global_mean = float(np.load(os.path.join(folder, GLOBAL_MEAN_FILE)))
+        # sum of the absolute similarities of every row, the normalization of its scores
+        self.norms = np.abs(self.sims).sum(axis=1)
+        # the same sums before pruning, None for tables saved without them
+        dense_norms = os.path.join(folder, DENSE_NORMS_FILE)
+        self.dense_norms = np.load(dense_norms) if os.path.exists(dense_norms) else None
+        self._reverse = None
+
+    @property
+    def k(self):
+        return self.neighbor_ids.shape[1]
+
+    def __len__(self):
+        return len(self.rows)
+
+    def has_row(self, row_id):
+        return self.rows.index_of(row_id) is not None
+
+    def neighbors(self, row_id):
+        """(neighbor ids, similarities) of one user or recipe, most similar first."""
+        row = self.rows.index_of(row_id)
+        if row is None:
+            return np.empty(0, dtype=np.int32), np.empty(0, dtype=np.float32)
+        ids, sims = self.neighbor_ids[row], self.sims[row]
+        valid = ids >= 0
+        return np.asarray(ids[valid]), np.asarray(sims[valid])
+
+    def reverse(self):
+        """
+        CSR of the transposed graph: for row position i, the rows that have i as a
+        neighbor and their similarity, as (indptr, rows, sims). Built on first use.
+        """
+        if self._reverse is None:
+            owners = np.repeat(np.arange(len(self), dtype=np.int32), self.k)
+            targets = self.rows.to_index(np.asarray(self.neighbor_ids).ravel())
+            sims = np.asarray(self.sims).ravel()
+            valid = targets >= 0
+            owners, targets, sims = owners[valid], targets[valid], sims[valid]
+            order = np.argsort(targets, kind='stable')
+            indptr = np.zeros(len(self) + 1, dtype=np.int64)
+            np.cumsum(np.bincount(targets, minlength=len(self)), out=indptr[1:])
+            self._reverse = (indptr, owners[order], sims[order])
+        return self._reverse
+
+    def nbytes(self):
+        """(resident, memory-mapped) bytes of the table."""
+        resident = self.rows.nbytes() + self.recipe_index.nbytes() + self.recipe_means.nbytes + self.norms.nbytes
+        if self.dense_norms is not None:
+            resident += self.dense_norms.nbytes
+        if self._reverse is not None:
+            resident += sum(array.nbytes for array in self._reverse)
+        return resident, self.neighbor_ids.nbytes + self.sims.nbytes
+
+
+def centered_ratings(table, recipe_ids, ratings, owners=None, n_owners=1):
+    """
+    Baseline centered ratings, rating - (user mean + recipe mean - global mean), as in
+    training. User means are taken from the ratings themselves, so ratings added after
+    training count. owners gives the user of every rating when they belong to several users.
+    """
+    ratings = np.asarray(ratings, dtype=np.float64)
+    owners = np.zeros(len(ratings), dtype=np.int64) if owners is None else owners
+    counts = np.bincount(owners, minlength=n_owners)
+    user_means = np.bincount(owners, weights=ratings, minlength=n_owners) / np.maximum(counts, 1)
+    positions = table.recipe_index.to_index(recipe_ids)
+    # recipes added after training have no mean yet, the global mean leaves them uncentered
+    recipe_means = np.where(positions >= 0, table.recipe_means[np.maximum(positions, 0)], table.global_mean)
+    return ratings - (user_means[owners] + recipe_means - table.global_mean), positions
+
+
+def item_based_scores(table, rating_index, user_id):
+    """
+    Predicted (centered) ratings of every recipe of a recipe neighbor table for a user:
+    score(j) = sum of sim(j, i) * r(u, i) over the rated neighbors i of j, divided by
+    the sum of |sim(j, i)| over all neighbors of j. Only the reverse neighbor lists of
+    the recipes the user rated are read. Returns None if the user rated nothing.
+    """
+    recipe_ids, ratings = rating_index.user_ratings(user_id)
+    if len(recipe_ids) == 0:
+        return None
+    centered, positions = centered_ratings(table, recipe_ids, ratings)
+    known = positions >= 0
+    numerator = _reverse_sums(table, positions[known], centered[known])
+    return np.divide(numerator, table.norms, out=np.zeros(len(table)), where=table.norms > 0)
+
+
+def _reverse_sums(table, positions, values):
+    """For every row j, the sum of sim(j, i) * values[i] over the given rows i that are neighbors of j."""
+    indptr, owners, sims = table.reverse()
+    starts, lengths = indptr[positions], indptr[positions + 1] - indptr[positions]
+    edges = np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+    return np.bincount(owners[edges], weights=sims[edges] * np.repeat(values, lengths), minlength=len(table))
+
+
+def item_based_delta(table, rating_index, user_id, recipe_id):
+    """
+    Change of a user's dense item-based predictions (sum of sim(j, i) * r(u, i) over
+    every recipe i, divided by the sum of |sim(j, i)| before pruning) when they rate
+    recipe_id: its centered rating is added and, as their mean moved, the centered
+    values of their other ratings shift. Both are spread over the reverse neighbor lists
+    of the rated recipes, similarities pruned from the table are left out. Returns None
+    if the table was saved without the dense norms.
+    """
+    if table.dense_norms is None:
+        return None
+    recipe_ids, ratings = rating_index.user_ratings(user_id)
+    after, positions = centered_ratings(table, recipe_ids, ratings)
+    before = np.zeros(len(after))
+    earlier = np.asarray(recipe_ids) != recipe_id
+    if earlier.any():
+        before[earlier], _ = centered_ratings(table, recipe_ids[earlier], ratings[earlier])
+    known = positions >= 0
+    numerator = _reverse_sums(table, positions[known], (after - before)[known])
+    return np.divide(numerator, table.dense_norms, out=np.zeros(len(table)), where=table.dense_norms > 0)
+
+
+def item_based_explanations(table, rating_index, user_id, recipe_ids, n=EXPLANATIONS):
+    """
+    {recipe_id: rated recipe ids} of the n rated recipes that contributed most to the
+    item-based score of each given (e.g. recommended) recipe, largest sim(j, i) * r(u, i)
+    first, positive contributions only. These are the edges of the reverse lists that
+    scoring read, looked up from the k neighbors of the given recipes only, so the cost
+    is k lookups per recipe whatever the size of the catalog.
+    """
+    explanations = {int(recipe_id): [] for recipe_id in recipe_ids}
+    rated_ids, ratings = rating_index.user_ratings(user_id)
+    if len(rated_ids) == 0:
+        return explanations
+    centered, _ = centered_ratings(table, rated_ids, ratings)
+    order = np.argsort(rated_ids)
+    rated_ids, centered = np.asarray(rated_ids)[order], centered[order]
+    rows = table.rows.to_index(np.fromiter(explanations, dtype=np.int64, count=len(explanations)))
+    known = np.flatnonzero(rows >= 0)
+    neighbor_ids = np.asarray(table.neighbor_ids[rows[known]])
+    # the rated neighbors of every recipe, by binary search in the user's sorted ratings
+    at = np.minimum(np.searchsorted(rated_ids, neighbor_ids), len(rated_ids) - 1)
+    rated = (rated_ids[at] == neighbor_ids) & (neighbor_ids >= 0)
+    contributions = np.where(rated, np.asarray(table.sims[rows[known]]) * centered[at], 0)
+    n = min(n, table.k)
+    best = np.argsort(-contributions, axis=1, kind='stable')[:, :n]
+    best_ids = np.take_along_axis(neighbor_ids, best, axis=1)
+    positive = np.take_along_axis(contributions, best, axis=1) > 0
+    recipe_ids = list(explanations)
+    for i, position in enumerate(known):
+        explanations[recipe_ids[position]] = best_ids[i][positive[i]].tolist()
+    return explanations
+
+
+def user_based_scores(table, rating_index, user_id):
+    """
+    Predicted (centered) ratings of every recipe for a user from a user neighbor table:
+    score(j) = sum of sim(u, v) * r(v, j) over the neighbors v who rated j, divided by
+    the sum of |sim(u, v)| over all neighbors of u. The ratings of the neighbors are read
+    from the rating index at request time. Returns None if the user is not in the table.
+    """
+    row = table.rows.index_of(user_id)
+    if row is None:
+        return None
+    neighbor_ids, sims = table.neighbors(user_id)
+    owners, recipe_ids, ratings = rating_index.pairs(neighbor_ids)
+    centered, positions = centered_ratings(table, recipe_ids, ratings, owners, len(neighbor_ids))
+    known = positions >= 0
+    numerator = np.bincount(positions[known], weights=sims[owners[known]] * centered[known],
+                            minlength=len(table.recipe_ids))
+    norm = table.norms[row]
+    return numerator / norm if norm > 0 else np.zeros(len(table.recipe_ids))
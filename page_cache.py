@@ -0,0 +1,102 @@
+import threading
+from collections import OrderedDict
+import pandas as pd
+from dataset_registry import dataset_nbytes
+from single_flight import SingleFlight
+
+# recommendation pages kept per process, a page is about 20 listing rows
+PAGE_CACHE_SIZE = 2048
+
+
+class PageCache:
+    """
+    Process-wide bounded LRU cache of Home recommendation pages, keyed by
+    (user_id, strategy, version). version identifies the trained datasets a page
+    was computed from, so a new version misses without clearing anything and the
+    old pages age out. All pages of a user are dropped when they rate a recipe.
+    Pages are shared between sessions and must not be modified in place.
+    """
+
+    def __init__(self, max_entries=PAGE_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._pages = OrderedDict()
+        self._user_keys = {}  # user_id -> keys of their cached pages
+        self._computing = SingleFlight()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def __len__(self):
+        return len(self._pages)
+
+    def get(self, user_id, strategy, version, compute):
+        """Return the cached page of a user, or compute() it and cache it if it is not None."""
+        key = (user_id, strategy, version)
+        with self._lock:
+            if key in self._pages:
+                self._pages.move_to_end(key)
+                self.hits += 1
+                return self._pages[key]
+            self.misses += 1
+        # computed outside the lock, so pages of other users are not held up, and once
+        # for the sessions missing the same page at the same time (e.g. Popular after a reload)
+        return self._computing.do(key, lambda: self._compute(key, compute))
+
+    def _compute(self, key, compute):
+        page = compute()
+        if page is None:
+            return page
+        with self._lock:
+            self._pages[key] = page
+            self._pages.move_to_end(key)
+            self._user_keys.setdefault(key[0], set()).add(key)
+            while len(self._pages) > self.max_entries:
+                old_key, _ = self._pages.popitem(last=False)
+                self._forget(old_key)
+                self.evictions += 1
+        return page
+
+    def _forget(self, key):
+        keys = self._user_keys.get(key[0])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._user_keys[key[0]]
+
+    def invalidate_user(self, user_id):
+        """Drop every cached page of one user, e.g. after they rated a recipe."""
+        with self._lock:
+            keys = self._user_keys.pop(user_id, set())
+            for key in keys:
+                del self._pages[key]
+            self.invalidations += len(keys)
+
+    def clear(self):
+        with self._lock:
+            self.invalidations += len(self._pages)
+            self._pages.clear()
+            self._user_keys.clear()
+
+    def nbytes(self):
+        """(resident, memory-mapped) bytes of the cached pages."""
+        with self._lock:
+            pages = list(self._pages.values())
+        return sum(dataset_nbytes(page)[0] for page in pages), 0
+
+    def stats(self):
+        """One row DataFrame with the size, hit rate and memory of the cache."""
+        lookups = self.hits + self.misses
+        return pd.DataFrame([{
+            'pages': len(self),
+            'max_pages': self.max_entries,
+            'users': len(self._user_keys),
+            'hits': self.hits,
+            'misses': self.misses,
+            'coalesced': self._computing.shared,
+            'hit_rate': round(self.hits / lookups, 3) if lookups else None,
+            'evictions': self.evictions,
+            'invalidations': self.invalidations,
+            'memory_mb': round(self.nbytes()[0] / 1e6, 2),
+        }])
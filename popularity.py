@@ -0,0 +1,134 @@
+import bisect
+import hashlib
+import threading
+import numpy as np
+from id_map import IdMap
+
+# recipes kept ranked for the Popular view, enough to skip the ones a user already rated
+POPULAR_TOP_K = 200
+
+
+def popularity_score(counts, totals):
+    """Average rating * log(number of reviews), 0 for recipes without reviews."""
+    counts = np.asarray(counts, dtype=np.float64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(counts > 0, np.asarray(totals) / counts * np.log(np.maximum(counts, 1)), 0.0)
+
+
+class PopularityIndex:
+    """
+    Per-recipe review count and rating sum with the derived popularity score, and
+    the POPULAR_TOP_K most popular recipes kept sorted. A new rating updates one
+    recipe and the ranked list in place (add_rating), the Popular view reads the
+    head of the list, so neither depends on the number of reviews.
+    Unlike the other datasets the index is updated in place and republished
+    with the new reviews version, readers only see counts grow.
+    """
+
+    def __init__(self, recipe_ids, counts, totals, k=POPULAR_TOP_K):
+        self.k = k
+        self._lock = threading.Lock()
+        self._set_arrays(np.asarray(recipe_ids, dtype=np.int64), np.asarray(counts, dtype=np.int64),
+                         np.asarray(totals, dtype=np.float64))
+
+    @classmethod
+    def from_reviews(cls, reviews_df, k=POPULAR_TOP_K):
+        recipe_ids, positions = np.unique(reviews_df['recipe_id'].to_numpy(), return_inverse=True)
+        counts = np.bincount(positions, minlength=len(recipe_ids))
+        totals = np.bincount(positions, weights=reviews_df['rating'].to_numpy(dtype=np.float64), minlength=len(recipe_ids))
+        return cls(recipe_ids, counts, totals, k)
+
+    def _set_arrays(self, recipe_ids, counts, totals):
+        self.recipe_ids = recipe_ids
+        # recipe_id -> position in the arrays
+        self.recipes = IdMap(recipe_ids, sorted_ids=recipe_ids, order=np.arange(len(recipe_ids)))
+        self.counts = counts
+        self.totals = totals
+        self.scores = popularity_score(counts, totals)
+        self._rank()
+        self._ranking_version = None
+
+    def _key(self, pos):
+        # best first, ties by recipe id
+        return (-self.scores[pos], self.recipe_ids[pos])
+
+    def _rank(self):
+        """Rebuild the ranked list from all recipes, O(recipes)."""
+        n = min(self.k, len(self.recipe_ids))
+        best = np.argpartition(-self.scores, n - 1)[:n] if 0 < n < len(self.recipe_ids) else np.arange(n)
+        self._top = sorted((self._key(pos), int(pos)) for pos in best)
+
+    def __len__(self):
+        return len(self.recipe_ids)
+
+    def add_rating(self, recipe_id, rating):
+        """Count a new rating of a recipe and move it in the ranked list."""
+        with self._lock:
+            pos = self.recipes.index_of(recipe_id)
+            if pos is None:
+                # first review of a recipe, the arrays are rebuilt with it
+                at = int(np.searchsorted(self.recipe_ids, recipe_id))
+                self._set_arrays(np.insert(self.recipe_ids, at, recipe_id), np.insert(self.counts, at, 1),
+                                 np.insert(self.totals, at, float(rating)))
+                return
+            self.counts[pos] += 1
+            self.totals[pos] += rating
+            # the ranked list may be reordered below, its version is hashed again on the next read
+            self._ranking_version = None
+            self.scores[pos] = popularity_score(self.counts[pos], self.totals[pos])
+            entry = (self._key(pos), pos)
+            top_positions = [p for _, p in self._top]
+            if pos in top_positions:
+                last_key = self._top[-1][0]
+                del self._top[top_positions.index(pos)]
+                if entry[0] < last_key or len(self._top) + 1 == len(self.recipe_ids):
+                    bisect.insort(self._top, entry)
+                else:
+                    # it fell below the last ranked recipe, one that is not ranked may now be better
+                    self._rank()
+            elif len(self._top) < self.k:
+                bisect.insort(self._top, entry)
+            elif entry[0] < self._top[-1][0]:
+                bisect.insort(self._top, entry)
+                self._top.pop()
+
+    def top(self, n, exclude=None):
+        """recipe_ids of the n most popular recipes, best first, skipping the excluded recipe ids."""
+        with self._lock:
+            ranked = self.recipe_ids[[pos for _, pos in self._top]]
+        if exclude is not None and len(exclude):
+            ranked = ranked[~np.isin(ranked, exclude)]
+        if len(ranked) >= n or len(self._top) == len(self.recipe_ids):
+            return ranked[:n]
+        # the user rated most of the ranked recipes, rank all of them
+        with self._lock:
+            order = np.lexsort((self.recipe_ids, -self.scores))
+            ranked = self.recipe_ids[order]
+        if exclude is not None and len(exclude):
+            ranked = ranked[~np.isin(ranked, exclude)]
+        return ranked[:n]
+
+    def ranking_version(self):
+        """
+        Hash of the ranked recipe ids, in order. It changes when a rating reorders the
+        ranked list, not with every rating, so pages built from it can be cached by it.
+        """
+        with self._lock:
+            if self._ranking_version is None:
+                ranked = self.recipe_ids[[pos for _, pos in self._top]]
+                self._ranking_version = hashlib.sha256(ranked.tobytes()).hexdigest()[:16]
+            return self._ranking_version
+
+    def stats(self, recipe_ids):
+        """(num_reviews, avg_rating) arrays of a batch of recipe ids, 0 for recipes without reviews."""
+        with self._lock:
+            positions = self.recipes.to_index(recipe_ids)
+            known = positions >= 0
+            counts = np.where(known, self.counts[np.maximum(positions, 0)], 0)
+            totals = np.where(known, self.totals[np.maximum(positions, 0)], 0.0)
+        return counts, np.divide(totals, counts, out=np.zeros(len(counts)), where=counts > 0)
+
+    def nbytes(self):
+        """(resident, memory-mapped) bytes of the index."""
+        resident = self.recipes.nbytes() + self.counts.nbytes + self.totals.nbytes + self.scores.nbytes
+        return resident + len(self._top) * 64, 0
@@ -0,0 +1,397 @@
+import os
+import numpy as np
+import pandas as pd
+from id_map import IdMap
+
+# file names inside a prediction store folder
+SCORES_FILE = "scores.npy"
+USER_IDS_FILE = "user_ids.npy"
+RECIPE_IDS_FILE = "recipe_ids.npy"
+TOPK_IDS_FILE = "topk_ids.npy"
+TOPK_SCORES_FILE = "topk_scores.npy"
+SCALE_FILE = "scale.npy"
+OFFSET_FILE = "offset.npy"
+
+# storage precisions of the dense prediction matrix, ranking only needs the
+# relative order of the scores and display about two decimals
+PRECISIONS = ["float64", "float32", "float16", "int8"]
+
+# number of recommendations kept per user in the top-K artifacts
+TOP_K = 20
+# users processed at once when building top-K artifacts from a dense matrix
+TOPK_BLOCK_SIZE = 1024
+
+
+def quantize_int8(scores):
+    """
+    Quantize every row of a score matrix to int8 with a per-row scale and offset,
+    score ~= (q + 128) * scale + offset. NaN scores are stored as the row minimum.
+    """
+    scores = np.asarray(scores, dtype=np.float64)
+    finite = np.isfinite(scores)
+    # rows without any finite score get offset 0 and scale 1
+    has_finite = finite.any(axis=1)
+    low = np.where(has_finite, np.min(np.where(finite, scores, np.inf), axis=1), 0.0)
+    high = np.where(has_finite, np.max(np.where(finite, scores, -np.inf), axis=1), 0.0)
+    scale = (high - low) / 255
+    scale[scale == 0] = 1.0
+    q = np.rint((np.where(finite, scores, low[:, None]) - low[:, None]) / scale[:, None]) - 128
+    return q.astype(np.int8), scale.astype(np.float32), low.astype(np.float32)
+
+
+def dequantize_int8(q, scale, offset):
+    """Inverse of quantize_int8 for one row (1-D q) or a block of rows (2-D q)."""
+    q = np.asarray(q, dtype=np.float32) + 128
+    if q.ndim == 1:
+        return q * scale + offset
+    return q * scale[:, None] + offset[:, None]
+
+
+def save_predictions(folder, scores, user_ids, recipe_ids, precision="float64"):
+    """
+    Save a dense prediction matrix (N users * M recipes) as a prediction store.
+    The score matrix is written as a plain .npy file so it can be memory-mapped,
+    user_ids[i] is the user of row i and recipe_ids[j] the recipe of column j.
+    precision is one of PRECISIONS, 'int8' stores a per-row scale and offset.
+    """
+    if precision not in PRECISIONS:
+        raise ValueError(f"Unsupported precision {precision}. Supported precisions: {', '.join(PRECISIONS)}")
+    os.makedirs(folder, exist_ok=True)
+    for file_name in (SCALE_FILE, OFFSET_FILE):
+        if os.path.exists(os.path.join(folder, file_name)):
+            os.remove(os.path.join(folder, file_name))
+    if precision == "int8":
+        q, scale, offset = quantize_int8(scores)
+        np.save(os.path.join(folder, SCORES_FILE), q)
+        np.save(os.path.join(folder, SCALE_FILE), scale)
+        np.save(os.path.join(folder, OFFSET_FILE), offset)
+    else:
+        np.save(os.path.join(folder, SCORES_FILE), np.ascontiguousarray(scores, dtype=precision))
+    np.save(os.path.join(folder, USER_IDS_FILE), np.asarray(user_ids, dtype=np.int64))
+    np.save(os.path.join(folder, RECIPE_IDS_FILE), np.asarray(recipe_ids, dtype=np.int64))
+
+
+def convert_feather_predictions(feather_path, folder):
+    """
+    Convert a prediction feather file (user_id column + one column per recipe)
+    written by older versions of the app into a prediction store.
+    """
+    pred_df = pd.read_feather(feather_path)
+    recipe_columns = [col for col in pred_df.columns if col != 'user_id']
+    save_predictions(
+        folder,
+        pred_df[recipe_columns].to_numpy(),
+        pred_df['user_id'].to_numpy(),
+        [int(col) for col in recipe_columns],
+    )
+
+
+def top_k_from_scores(scores, recipe_ids, rated_rows, rated_cols, k=TOP_K):
+    """
+    Select the k best unrated recipes of every row of a score matrix.
+    rated_rows/rated_cols are the (row, column) positions of already rated recipes.
+    Returns (ids, top_scores) as (N, k) int32/float32 arrays sorted best first,
+    rows with fewer than k unrated recipes are padded with id -1 and score NaN.
+    """
+    n_rows, n_items = scores.shape
+    k = min(k, n_items)
+    recipe_ids = np.asarray(recipe_ids)
+    rated_rows = np.asarray(rated_rows)
+    rated_cols = np.asarray(rated_cols)
+    ids = np.full((n_rows, k), -1, dtype=np.int32)
+    top_scores = np.full((n_rows, k), np.nan, dtype=np.float32)
+    # work on blocks of users so only a block sized copy of the matrix is made
+    for start in range(0, n_rows, TOPK_BLOCK_SIZE):
+        stop = min(start + TOPK_BLOCK_SIZE, n_rows)
+        block = np.array(scores[start:stop], dtype=np.float64)
+        in_block = (rated_rows >= start) & (rated_rows < stop)
+        block[rated_rows[in_block] - start, rated_cols[in_block]] = -np.inf
+        cols = np.argpartition(-block, k - 1, axis=1)[:, :k]
+        block_scores = np.take_along_axis(block, cols, axis=1)
+        # sort the k selected recipes, best first
+        order = np.argsort(-block_scores, axis=1, kind='stable')
+        cols = np.take_along_axis(cols, order, axis=1)
+        block_scores = np.take_along_axis(block_scores, order, axis=1)
+        valid = np.isfinite(block_scores)
+        ids[start:stop] = np.where(valid, recipe_ids[cols], -1)
+        top_scores[start:stop] = np.where(valid, block_scores, np.nan)
+    return ids, top_scores
+
+
+def save_top_k(folder, scores, user_ids, recipe_ids, rated_rows, rated_cols, k=TOP_K):
+    """
+    Save the compact top-K artifact: per-user best k unrated recipe ids and
+    their predicted ratings as fixed-width int32/float32 arrays.
+    """
+    ids, top_scores = top_k_from_scores(scores, recipe_ids, rated_rows, rated_cols, k)
+    os.makedirs(folder, exist_ok=True)
+    np.save(os.path.join(folder, TOPK_IDS_FILE), ids)
+    np.save(os.path.join(folder, TOPK_SCORES_FILE), top_scores)
+    np.save(os.path.join(folder, USER_IDS_FILE), np.asarray(user_ids, dtype=np.int64))
+
+
+def build_top_k_from_store(store, folder, rated_user_ids, rated_recipe_ids, k=TOP_K):
+    """
+    Build the top-K artifact of an existing prediction store, excluding
+    the (user_id, recipe_id) pairs that were already rated.
+    """
+    rows = store.rows_of(rated_user_ids)
+    cols = store.recipe_index.to_index(rated_recipe_ids)
+    found = (rows >= 0) & (cols >= 0)
+    save_top_k(folder, store.matrix, store.user_ids_of(slice(None)), store.recipe_ids, rows[found], cols[found], k)
+
+
+class UserRowIndex:
+    """
+    user_id -> row offset index shared by the prediction artifacts,
+    an IdMap over the user id of every row.
+    """
+
+    def __init__(self, user_ids):
+        self._rows = IdMap(user_ids)
+        # rows of users updated since training (fold_in), user_id -> replacement,
+        # kept in memory over the read-only artifact until the next version
+        self._folded = {}
+
+    @property
+    def user_ids(self):
+        return self._rows.sorted_ids
+
+    def __len__(self):
+        return len(self._rows)
+
+    def row_of(self, user_id):
+        """Return the row offset of the given user, or None if the user has no predictions."""
+        return self._rows.index_of(user_id)
+
+    def has_user(self, user_id):
+        return user_id in self._folded or self.row_of(user_id) is not None
+
+    def index_nbytes(self):
+        """Bytes of the user index and of the rows folded in since training."""
+        folded = sum(array.nbytes for value in self._folded.values()
+                     for array in (value if isinstance(value, tuple) else (value,)))
+        return self._rows.nbytes() + folded
+
+    def rows_of(self, user_ids):
+        """Vectorized row_of, users without predictions get -1."""
+        return self._rows.to_index(user_ids)
+
+    def user_ids_of(self, rows):
+        """User ids of row offsets (an offset, an array or a slice of them), the inverse of rows_of."""
+        return self._rows.raw_ids[rows]
+
+    def has_folded(self):
+        return len(self._folded) > 0
+
+    def save_folded(self, folder):
+        """
+        Write the rows folded in since training as an overlay folder: the user ids and,
+        per artifact file, the replacement rows in the same order. load_folded applies it
+        to another instance of the same version, e.g. in another process or after a restart.
+        """
+        user_ids = np.fromiter(self._folded, dtype=np.int64, count=len(self._folded))
+        os.makedirs(folder, exist_ok=True)
+        np.save(os.path.join(folder, USER_IDS_FILE), user_ids)
+        for file_name, rows in self._folded_rows([self._folded[user_id] for user_id in user_ids.tolist()]).items():
+            np.save(os.path.join(folder, file_name), rows)
+
+    def load_folded(self, folder, replace=True):
+        """Fold in the rows of an overlay written by save_folded, keeping the rows already folded in unless replace."""
+        user_ids = np.load(os.path.join(folder, USER_IDS_FILE))
+        arrays = {file_name: np.load(os.path.join(folder, file_name))
+                  for file_name in os.listdir(folder) if file_name != USER_IDS_FILE}
+        for user_id, value in zip(user_ids.tolist(), self._folded_values(arrays)):
+            if replace or user_id not in self._folded:
+                self._folded[user_id] = value
+
+    def _folded_rows(self, values):
+        """{file name: 2-D array} of folded values, one row each."""
+        raise NotImplementedError
+
+    def _folded_values(self, arrays):
+        """Inverse of _folded_rows."""
+        raise NotImplementedError
+
+
+class PredictionStore(UserRowIndex):
+    """
+    Random-access reader for a prediction store.
+    Keeps a sorted user_id -> row offset index in memory and memory-maps the
+    score matrix, so fetching one user's predictions reads a single row
+    no matter how many users the matrix holds.
+    """
+
+    def __init__(self, folder):
+        self.folder = folder
+        self.scores = np.load(os.path.join(folder, SCORES_FILE), mmap_mode='r')
+        self.recipe_ids = np.load(os.path.join(folder, RECIPE_IDS_FILE))
+        # recipe_id -> column of the score matrix
+        self.recipe_index = IdMap(self.recipe_ids)
+        super().__init__(np.load(os.path.join(folder, USER_IDS_FILE)))
+        # int8 stores keep a scale and offset per row
+        self.scale = None
+        self.offset = None
+        if os.path.exists(os.path.join(folder, SCALE_FILE)):
+            self.scale = np.load(os.path.join(folder, SCALE_FILE))
+            self.offset = np.load(os.path.join(folder, OFFSET_FILE))
+
+    @property
+    def precision(self):
+        return "int8" if self.scale is not None else str(self.scores.dtype)
+
+    @property
+    def matrix(self):
+        """The score matrix, dequantized block by block when sliced."""
+        return self.scores if self.scale is None else DequantizedMatrix(self)
+
+    def nbytes(self):
+        """(resident, memory-mapped) bytes of the store."""
+        resident = self.index_nbytes() + self.recipe_index.nbytes()
+        if self.scale is not None:
+            resident += self.scale.nbytes + self.offset.nbytes
+        return resident, self.scores.nbytes
+
+    def dequantize(self, rows):
+        """Scores of a row offset or a slice of row offsets as floats."""
+        if self.scale is None:
+            return np.array(self.scores[rows], dtype=np.float64)
+        return dequantize_int8(self.scores[rows], self.scale[rows], self.offset[rows])
+
+    def get_scores(self, user_id):
+        """Return the predicted ratings of a user as a 1-D array aligned with recipe_ids."""
+        if user_id in self._folded:
+            return self._folded[user_id]
+        row = self.row_of(user_id)
+        if row is None:
+            return None
+        # only the single row is read out of the memory map
+        return self.dequantize(row)
+
+    def fold_in(self, user_id, scores):
+        """Replace the predicted ratings of a user (aligned with recipe_ids) until the next trained version."""
+        self._folded[user_id] = np.asarray(scores, dtype=np.float64)
+
+    def _folded_rows(self, values):
+        return {SCORES_FILE: np.asarray(values, dtype=np.float32).reshape(len(values), len(self.recipe_ids))}
+
+    def _folded_values(self, arrays):
+        return [np.asarray(row, dtype=np.float64) for row in arrays[SCORES_FILE]]
+
+    def block_scores(self, rows):
+        """Scores of a slice of row offsets as floats, with the rows folded in since training."""
+        scores = self.dequantize(rows)
+        if self._folded:
+            user_ids = self.user_ids_of(rows)
+            folded = np.fromiter(self._folded, dtype=np.int64, count=len(self._folded))
+            for i in np.flatnonzero(np.isin(user_ids, folded)):
+                scores[i] = self._folded[int(user_ids[i])]
+        return scores
+
+    def to_frame(self):
+        """Load the whole store as a DataFrame (used by the admin dataset explorer)."""
+        pred_df = pd.DataFrame(self.dequantize(slice(None)), columns=self.recipe_ids.tolist())
+        pred_df.insert(0, 'user_id', self.user_ids_of(slice(None)))
+        return pred_df
+
+
+class DequantizedMatrix:
+    """Read-only 2-D view of an int8 prediction store that dequantizes the rows it is sliced with."""
+
+    def __init__(self, store):
+        self.store = store
+        self.shape = store.scores.shape
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __getitem__(self, rows):
+        return self.store.dequantize(rows)
+
+
+def top_n_overlap(full_scores, approx_scores, n=TOP_K):
+    """
+    Per-row overlap of the top-n columns of two score matrices, as a fraction of n.
+    Used to check that a lower storage precision keeps the recommendations.
+    """
+    n = min(n, full_scores.shape[1])
+    full_top = np.argpartition(-np.nan_to_num(full_scores, nan=-np.inf), n - 1, axis=1)[:, :n]
+    approx_top = np.argpartition(-np.nan_to_num(approx_scores, nan=-np.inf), n - 1, axis=1)[:, :n]
+    full_top.sort(axis=1)
+    approx_top.sort(axis=1)
+    return np.array([len(np.intersect1d(a, b, assume_unique=True)) / n for a, b in zip(full_top, approx_top)])
+
+
+def quantization_report(scores, precisions=PRECISIONS, n=TOP_K):
+    """
+    DataFrame with the size and the top-n overlap against full precision
+    of every storage precision of a dense score matrix.
+    """
+    scores = np.asarray(scores, dtype=np.float64)
+    report = []
+    for precision in precisions:
+        if precision == "int8":
+            q, scale, offset = quantize_int8(scores)
+            approx = dequantize_int8(q, scale, offset)
+            nbytes = q.nbytes + scale.nbytes + offset.nbytes
+        else:
+            approx = scores.astype(precision)
+            nbytes = approx.nbytes
+        overlap = top_n_overlap(scores, approx.astype(np.float64), n)
+        report.append({
+            'precision': precision,
+            'size_mb': round(nbytes / 1e6, 2),
+            'compression': round(scores.nbytes / nbytes, 1),
+            f'mean_top{n}_overlap': round(float(overlap.mean()), 4),
+            f'min_top{n}_overlap': round(float(overlap.min()), 4),
+        })
+    return pd.DataFrame(report)
+
+
+class TopKStore(UserRowIndex):
+    """
+    Reader for a top-K artifact. Memory grows with users * K
+    instead of users * recipes.
+    """
+
+    def __init__(self, folder):
+        self.folder = folder
+        self.ids = np.load(os.path.join(folder, TOPK_IDS_FILE), mmap_mode='r')
+        self.scores = np.load(os.path.join(folder, TOPK_SCORES_FILE), mmap_mode='r')
+        super().__init__(np.load(os.path.join(folder, USER_IDS_FILE)))
+
+    def nbytes(self):
+        """(resident, memory-mapped) bytes of the artifact."""
+        return self.index_nbytes(), self.ids.nbytes + self.scores.nbytes
+
+    @property
+    def k(self):
+        return self.ids.shape[1]
+
+    def get_top_k(self, user_id):
+        """Return (recipe_ids, scores) of a user's top-K recipes, best first, or None."""
+        if user_id in self._folded:
+            return self._folded[user_id]
+        row = self.row_of(user_id)
+        if row is None:
+            return None
+        ids = np.array(self.ids[row])
+        valid = ids >= 0
+        return ids[valid], np.array(self.scores[row])[valid]
+
+    def fold_in(self, user_id, recipe_ids, scores):
+        """Replace the top-K recipes of a user, best first, until the next trained version."""
+        self._folded[user_id] = (np.asarray(recipe_ids)[:self.k], np.asarray(scores)[:self.k])
+
+    def _folded_rows(self, values):
+        # padded like the artifact, id -1 and score NaN
+        ids = np.full((len(values), self.k), -1, dtype=np.int32)
+        scores = np.full((len(values), self.k), np.nan, dtype=np.float32)
+        for i, (recipe_ids, top_scores) in enumerate(values):
+            ids[i, :len(recipe_ids)] = recipe_ids
+            scores[i, :len(top_scores)] = top_scores
+        return {TOPK_IDS_FILE: ids, TOPK_SCORES_FILE: scores}
+
+    def _folded_values(self, arrays):
+        ids, scores = arrays[TOPK_IDS_FILE], arrays[TOPK_SCORES_FILE]
+        return [(ids[i][ids[i] >= 0].astype(np.int64), scores[i][ids[i] >= 0].astype(np.float64)) for i in range(len(ids))]
@@ -0,0 +1,96 @@
+import numpy as np
+from id_map import IdMap
+
+
+class RatingIndex:
+    """
+    Compressed sparse row index of the reviews: for the user at row i,
+    recipe_ids[indptr[i]:indptr[i + 1]] are the recipes they rated, sorted,
+    and ratings holds the matching ratings. Looking up a user is a binary
+    search over the sorted user ids, checking a recipe a binary search in their row.
+    The index is read-only and shared by every session, with_rating returns a new one.
+    """
+
+    def __init__(self, user_ids, indptr, recipe_ids, ratings):
+        # user_ids are sorted, so the id map needs no separate sort order
+        self.users = IdMap(user_ids, sorted_ids=user_ids, order=np.arange(len(user_ids)))
+        self.indptr = indptr
+        self.recipe_ids = recipe_ids
+        self.ratings = ratings
+
+    @classmethod
+    def from_reviews(cls, reviews_df):
+        users = reviews_df['user_id'].to_numpy()
+        recipes = reviews_df['recipe_id'].to_numpy()
+        order = np.lexsort((recipes, users))
+        users = users[order]
+        user_ids, starts = np.unique(users, return_index=True)
+        indptr = np.append(starts, len(users)).astype(np.int64)
+        return cls(user_ids, indptr, recipes[order].astype(np.int32), reviews_df['rating'].to_numpy()[order])
+
+    def __len__(self):
+        return len(self.recipe_ids)
+
+    def _span(self, user_id):
+        row = self.users.index_of(user_id)
+        if row is None:
+            return 0, 0
+        return self.indptr[row], self.indptr[row + 1]
+
+    def rated_recipes(self, user_id):
+        """Sorted recipe ids rated by the user (empty if they rated nothing)."""
+        start, stop = self._span(user_id)
+        return self.recipe_ids[start:stop]
+
+    def user_ratings(self, user_id):
+        """(recipe_ids, ratings) of the user."""
+        start, stop = self._span(user_id)
+        return self.recipe_ids[start:stop], self.ratings[start:stop]
+
+    def pairs(self, user_ids):
+        """
+        Every rating of a batch of users as (position in user_ids, recipe_id, rating)
+        arrays, gathered from their rows without a Python loop.
+        """
+        rows = self.users.to_index(user_ids)
+        known = np.flatnonzero(rows >= 0)
+        starts = self.indptr[rows[known]]
+        lengths = self.indptr[rows[known] + 1] - starts
+        owners = np.repeat(known, lengths)
+        # position of every pair in recipe_ids: its row start plus its offset inside the row
+        offsets = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+        positions = np.repeat(starts, lengths) + offsets
+        return owners, self.recipe_ids[positions], self.ratings[positions]
+
+    def has_rated(self, user_id, recipe_id):
+        rated = self.rated_recipes(user_id)
+        pos = np.searchsorted(rated, recipe_id)
+        return bool(pos < len(rated) and rated[pos] == recipe_id)
+
+    def with_rating(self, user_id, recipe_id, rating):
+        """
+        A new index that also holds (user_id, recipe_id, rating), e.g. right after
+        a feedback was submitted. An existing rating of the pair is replaced.
+        """
+        row = self.users.index_of(user_id)
+        user_ids, indptr = self.users.raw_ids, self.indptr
+        if row is None:
+            # insert an empty row for the new user at its sorted position
+            row = int(np.searchsorted(user_ids, user_id))
+            user_ids = np.insert(user_ids, row, user_id)
+            indptr = np.insert(indptr, row, indptr[row])
+        start, stop = indptr[row], indptr[row + 1]
+        pos = start + int(np.searchsorted(self.recipe_ids[start:stop], recipe_id))
+        if pos < stop and self.recipe_ids[pos] == recipe_id:
+            ratings = self.ratings.copy()
+            ratings[pos] = rating
+            return RatingIndex(user_ids, indptr, self.recipe_ids, ratings)
+        recipe_ids = np.insert(self.recipe_ids, pos, recipe_id)
+        ratings = np.insert(self.ratings, pos, rating)
+        indptr = indptr.copy()
+        indptr[row + 1:] += 1
+        return RatingIndex(user_ids, indptr, recipe_ids, ratings)
+
+    def nbytes(self):
+        """(resident, memory-mapped) bytes of the index."""
+        return self.users.nbytes() + self.indptr.nbytes + self.recipe_ids.nbytes + self.ratings.nbytes, 0
@@ -0,0 +1,141 @@
+import os
+import threading
+from collections import OrderedDict
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+import pyarrow.ipc as ipc
+from data_schema import apply_schema, RECIPES_SCHEMA
+from id_map import IdMap
+from list_column import ListColumn
+
+# columns loaded eagerly, everything the recipe cards and search results render
+LISTING_COLUMNS = ['recipe_id', 'name', 'minutes', 'n_steps', 'description', 'Images']
+# list columns available as flat ListColumns (see list_column.py), loaded on first use
+LIST_COLUMNS = ['tags', 'ingredients', 'steps', 'Images']
+# columns only needed on the recipe detail page
+DETAIL_COLUMNS = ['description', 'steps', 'ingredients', 'Images']
+
+# descriptions in the listing are cut to this many characters, the full text is a detail column
+SHORT_DESCRIPTION_LENGTH = 300
+# number of recipe details kept in memory
+DETAIL_CACHE_SIZE = 256
+# recipes per record batch of the recipes file, opening a recipe decompresses one batch
+DETAIL_BATCH_ROWS = 64
+
+
+def short_description(description):
+    if not isinstance(description, str) or len(description) <= SHORT_DESCRIPTION_LENGTH:
+        return description
+    return description[:SHORT_DESCRIPTION_LENGTH].rsplit(' ', 1)[0] + '...'
+
+
+def rebatch_recipes(path, codec="lz4", rows=DETAIL_BATCH_ROWS):
+    """
+    Rewrite a recipes file as record batches of `rows` recipes, so get_details reads
+    one small batch instead of the whole file. Returns False if it already is.
+    """
+    with pa.memory_map(path) as source:
+        reader = ipc.open_file(source)
+        if reader.num_record_batches > 1 or reader.get_batch(0).num_rows <= rows:
+            return False
+        table = reader.read_all().combine_chunks()
+    # written next to the file and moved over it, readers of the old file keep their copy
+    staged = path + ".tmp"
+    feather.write_feather(table, staged, compression=codec, chunksize=rows)
+    os.replace(staged, path)
+    return True
+
+
+class RecipeCatalog:
+    """
+    Column-projected view of the recipes file.
+    The listing (name, minutes, steps count, short description and first image)
+    is loaded eagerly as a DataFrame. List columns are loaded as flat ListColumns
+    when they are first needed, and details are read from the record batch holding
+    the recipe only when it is opened, with a bounded LRU cache.
+    """
+
+    def __init__(self, path, detail_cache_size=DETAIL_CACHE_SIZE):
+        self.path = path
+        # the file stays open, lazy reads see this version even if the file is replaced later
+        self._source = pa.memory_map(path)
+        table = feather.read_table(self._source, columns=LISTING_COLUMNS)
+        listing = apply_schema(table.drop_columns(['Images']).to_pandas(), RECIPES_SCHEMA)
+        listing['description'] = listing['description'].map(short_description)
+        # only the first image is rendered on the cards, taken from the flat values without a Python loop
+        listing['image'] = ListColumn.from_arrow(table.column('Images')).first_values()
+        self.listing = listing
+        # recipe_id -> row position
+        self._positions = IdMap(listing['recipe_id'].to_numpy())
+
+        self._lock = threading.Lock()
+        self._list_columns = {}
+        self._reader = ipc.open_file(self._source)
+        # every batch but the last holds the same number of rows (see rebatch_recipes)
+        self._batch_rows = self._reader.get_batch(0).num_rows if self._reader.num_record_batches > 1 else max(len(listing), 1)
+        self._detail_cache = OrderedDict()
+        self._detail_cache_size = detail_cache_size
+
+    def __len__(self):
+        return len(self.listing)
+
+    def positions(self, recipe_ids):
+        """Listing row of every recipe id, -1 for unknown ids."""
+        return self._positions.to_index(recipe_ids)
+
+    def take(self, recipe_ids, columns=None):
+        """
+        Listing rows of a batch of recipe ids in the given order with a single take,
+        unknown ids are skipped.
+        """
+        positions = self.positions(recipe_ids)
+        rows = self.listing.iloc[positions[positions >= 0]]
+        if columns is not None:
+            rows = rows[columns]
+        return rows.reset_index(drop=True)
+
+    def get(self, recipe_id):
+        """Listing row of one recipe as a Series, or None if the id is unknown."""
+        pos = self._positions.index_of(recipe_id)
+        return self.listing.iloc[pos] if pos is not None else None
+
+    def list_column(self, name):
+        """One of LIST_COLUMNS as a ListColumn aligned with the listing rows, loaded on first use."""
+        with self._lock:
+            if name not in self._list_columns:
+                self._list_columns[name] = ListColumn.from_arrow(
+                    feather.read_table(self._source, columns=[name]).column(name))
+            return self._list_columns[name]
+
+    def get_details(self, recipe_id):
+        """
+        Return a dict with the detail columns of one recipe, or None if it is unknown.
+        """
+        with self._lock:
+            if recipe_id in self._detail_cache:
+                self._detail_cache.move_to_end(recipe_id)
+                return self._detail_cache[recipe_id]
+            pos = self._positions.index_of(recipe_id)
+            if pos is None:
+                return None
+            # only the batch holding the recipe is decompressed, and it is not kept
+            batch = self._reader.get_batch(pos // self._batch_rows)
+            row = batch.select(DETAIL_COLUMNS).slice(pos % self._batch_rows, 1).to_pylist()[0]
+            details = {column: (row[column] if row[column] is not None else []) for column in DETAIL_COLUMNS}
+            details['description'] = row['description']
+            self._detail_cache[recipe_id] = details
+            if len(self._detail_cache) > self._detail_cache_size:
+                self._detail_cache.popitem(last=False)
+            return details
+
+    def to_frame(self):
+        """Load the full recipes file (used by the admin dataset explorer)."""
+        with self._lock:
+            return feather.read_table(self._source).to_pandas()
+
+    def nbytes(self):
+        """(resident, memory-mapped) bytes of the catalog."""
+        resident = int(self.listing.memory_usage(index=True, deep=True).sum())
+        resident += sum(column.nbytes() for column in self._list_columns.values())
+        return resident, 0
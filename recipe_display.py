@@ -1,5 +1,12 @@
 import streamlit as st
 import numpy as np
+import pandas as pd
+from data_loader import publish_reviews, get_page_cache, load_popularity, load_neighbor_table, load_ann_index
+from recipe_recommend import fold_in_rating, SERVING_MODE
+from data_schema import apply_schema, REVIEWS_SCHEMA
+
+# similar recipes shown under an opened recipe
+SIMILAR_RECIPES = 6
 
 def view_recipe_callback(recipe, show_description):
     """
@@ -12,13 +19,15 @@ def view_recipe_callback(recipe, show_description):
 def show_recipe_description(recipe):
     # Access the dataframe from the session
     reviews_df = st.session_state.reviews_df
+    # steps, ingredients, images and the full description are only loaded for the opened recipe
+    details = st.session_state.recipe_catalog.get_details(recipe['recipe_id'])
     #start_time = time.time()
     col1, col2, col3 = st.columns([2,3,1])
     with col1:
         st.subheader(':green[Images]', divider='green')
         st.write("Scroll to see all images")
         DEFAULT_IMAGE = "https://via.placeholder.com/200x300?text=No+Image"
-        image_urls = recipe['Images']
+        image_urls = details['Images']
         # Convert NumPy array to a list (if needed)
         if isinstance(image_urls, np.ndarray):  
             image_urls = image_urls.tolist()
@@ -59,21 +68,21 @@ def show_recipe_description(recipe):
         # Display the horizontal scrollable image gallery
         st.markdown(image_html, unsafe_allow_html=True)
         with st.container(height=150):
-            if recipe['description']:
-                st.write(f"Description: {recipe['description']}")
+            if details['description']:
+                st.write(f"Description: {details['description']}")
         st.write(f"Cooking Time: {recipe['minutes']} minutes")
     with col2:
         with st.container(border=True):
             st.subheader(':green[Directions]', divider='green')
             num = 1
-            for step in recipe['steps']:
+            for step in details['steps']:
                 st.write(f"Step {num}: {step.capitalize()}")
                 num += 1
     with col3:
         with st.container(border=True):
             st.subheader(':green[Ingredients]', divider='green')
             with st.container(height=300):
-                for ingredient in recipe['ingredients']:
+                for ingredient in details['ingredients']:
                     st.write(ingredient.capitalize())
     feedback_col1,feedback_col2 = st.columns([1,1])
     with feedback_col1:
@@ -85,10 +94,7 @@ def show_recipe_description(recipe):
         if st.session_state.logged_in:
             user_id = st.session_state.user_data.get('user_id')
             # Check if the user has rated this recipe
-            user_has_rated = not reviews_df[
-                (reviews_df['user_id'] == user_id) & 
-                (reviews_df['recipe_id'] == recipe['recipe_id'])
-            ].empty
+            user_has_rated = st.session_state.rating_index.has_rated(user_id, recipe['recipe_id'])
         else:
             user_has_rated = False
         
@@ -122,11 +128,69 @@ def show_recipe_description(recipe):
                             'recipe_id': recipe['recipe_id'],
                             'rating': feedback_rating,
                         }
-                        reviews_df.loc[len(reviews_df)] = new_review
+                        # reviews_df is shared by all sessions, so build a new frame instead of appending in place
+                        # the new row is converted to the reviews schema so the appended frame keeps the compact dtypes
+                        new_review_df = apply_schema(pd.DataFrame([new_review]), REVIEWS_SCHEMA)
+                        updated_reviews = pd.concat([reviews_df, new_review_df], ignore_index=True)
                         #st.write(new_review)
-                        # Save the updated reviews_df to the feather file
-                        reviews_df.to_feather('Data/reviews_df.feather')
+                        # Save the updated reviews_df to the feather file and publish it to every session
+                        # the rating index gets the new rating directly instead of being rebuilt
+                        rating_index = st.session_state.rating_index.with_rating(user_id, recipe['recipe_id'], feedback_rating)
+                        # the popularity aggregates of the recipe are updated in place
+                        popularity = load_popularity(st.session_state.data_manifest)
+                        popularity.add_rating(recipe['recipe_id'], feedback_rating)
+                        publish_reviews(updated_reviews, rating_index=rating_index, popularity=popularity)
+                        st.session_state.reviews_df = updated_reviews
+                        st.session_state.rating_index = rating_index
+                        # update this user's recommendations now instead of at the next retrain
+                        fold_in_rating(user_id, recipe['recipe_id'])
+                        # only this user's cached Home pages are stale
+                        get_page_cache().invalidate_user(user_id)
                         st.success("Thank you for your feedback! 🎉")
         else:
             st.info("You've already rated this recipe. Thank you! 🎉")
+    show_similar_recipes(recipe['recipe_id'])
     #print(f"Time taken show selected recipe: {time.time() - start_time:.2f} seconds")
+
+def similar_recipes(recipe_id, n=SIMILAR_RECIPES):
+    """
+    Listing rows of the n recipes most similar to a recipe, best first, read from the
+    trained item neighbor table (O(k), the similarity matrix is not needed), or queried
+    from the approximate nearest neighbor index in the 'ann' serving mode.
+    Returns None if neither has been trained yet.
+    """
+    if SERVING_MODE == "ann":
+        index = load_ann_index(st.session_state.data_manifest)
+        if index is None:
+            return None
+        neighbor_ids, sims = index.similar(recipe_id, n)
+        return st.session_state.recipe_catalog.take(neighbor_ids[sims > 0])
+    table = load_neighbor_table(st.session_state.data_manifest, 'item_neighbors')
+    if table is None:
+        return None
+    neighbor_ids, sims = table.neighbors(recipe_id)
+    return st.session_state.recipe_catalog.take(neighbor_ids[sims > 0][:n])
+
+def show_similar_recipes(recipe_id):
+    similar = similar_recipes(recipe_id)
+    if similar is None or similar.empty:
+        return
+    st.subheader(":green[Similar Recipes]", divider='green')
+    DEFAULT_IMAGE = "https://via.placeholder.com/200x300?text=No+Image"
+    for col, (_, row) in zip(st.columns(SIMILAR_RECIPES), similar.iterrows()):
+        with col:
+            st.markdown(
+                f"""
+                <div style="height: 120px; width: 100%; overflow: hidden; border-radius: 8px; background-color: #f8f8f8;">
+                    <img src="{row['image']}" style="height: 100%; width: 100%; object-fit: cover;"
+                         onerror="this.src='{DEFAULT_IMAGE}';this.onerror=null;" loading="lazy">
+                </div>
+                <div style="font-weight: bold; margin: 6px 0; white-space: nowrap; overflow: hidden; text-overflow: ellipsis;">
+                    {row['name']}
+                </div>
+                """,
+                unsafe_allow_html=True
+            )
+            st.write(f"⏱ {row['minutes']} min")
+            st.button("View", key=f"similar_{recipe_id}_{row['recipe_id']}", on_click=view_recipe_callback,
+                      args=(row, True), use_container_width=True)
@@ -1,48 +1,195 @@
+import os
 import streamlit as st
+import numpy as np
+from recommendation_engine import recommend, exclusion_mask, constraint_mask
+from neighbor_index import user_based_scores, item_based_scores, item_based_delta, item_based_explanations
+from ann_index import ann_item_scores, ann_item_explanations
+from data_manifest import manifest_version
+from data_loader import publish_fold_ins
 
-def getRecommendations(user_id, filter_type='User-Based', top_n=10):
-    user_pred = st.session_state.user_pred_df
-    item_pred = st.session_state.item_pred_df
-    reviews_df = st.session_state.reviews_df
-    
-    # Select the appropriate prediction DataFrame
+# 'dense': serve the stored top-K and dense predictions of the last training
+# 'neighbors': score users at request time from the pruned similarity graphs and the current ratings
+# 'ann': like 'neighbors', but item-based scores query the approximate nearest neighbor index;
+#        experimental, slower than 'neighbors' on this catalog ('python benchmark.py ann')
+SERVING_MODE = os.getenv("RECIPE_SERVING_MODE", "dense")
+REQUEST_TIME_MODES = ("neighbors", "ann")
+
+# datasets the recommendations of every type are computed from, besides the ratings
+STRATEGY_DATASETS = {
+    "User-Based": ["recipes", "user_pred", "user_pred_topk", "user_neighbors"],
+    "Item-Based": ["recipes", "item_pred", "item_pred_topk", "item_neighbors", "item_ann"],
+    "Matrix Factorization": ["recipes", "mf_model"],
+    "Content-Based": ["recipes"],
+    "Popular": ["recipes"],
+}
+
+def strategy_version(manifest, filter_type):
+    """
+    Version of the datasets behind a recommendation type. It changes when they are
+    retrained, not when ratings are added: the pages of the user who rated are invalidated instead.
+    """
+    datasets = manifest['datasets']
+    return manifest_version({name: datasets[name] for name in STRATEGY_DATASETS.get(filter_type, []) if name in datasets})
+
+def get_prediction_stores(filter_type):
+    """Return the (top-K, dense) prediction stores of a recommendation type."""
     if filter_type == "User-Based":
-        pred_df = user_pred
+        return st.session_state.get("user_topk_store"), st.session_state.get("user_pred_store")
     elif filter_type == "Item-Based":
-        pred_df = item_pred
+        return st.session_state.get("item_topk_store"), st.session_state.get("item_pred_store")
+    elif filter_type == "Matrix Factorization":
+        # the embeddings score a user in one product, there is no top-K artifact
+        return None, st.session_state.get("mf_model")
+    else:
+        raise ValueError("Invalid method! Choose 'User-Based', 'Item-Based' or 'Matrix Factorization'.")
+
+def get_neighbor_table(filter_type):
+    """Return the neighbor table of a recommendation type and the function scoring a user with it."""
+    if filter_type == "User-Based":
+        return st.session_state.get("user_neighbors"), user_based_scores
+    elif filter_type == "Item-Based":
+        if SERVING_MODE == "ann":
+            # approximate neighbors of the rated recipes, looked up at request time
+            return st.session_state.get("item_ann"), ann_item_scores
+        return st.session_state.get("item_neighbors"), item_based_scores
     else:
         raise ValueError("Invalid method! Choose either 'user' or 'item'.")
+
+def has_predictions(user_id, filter_type):
+    """Check if the user has predictions for the given recommendation type."""
+    if filter_type == "Content-Based":
+        # scored from the current ratings, one is enough
+        return st.session_state.get("content_index") is not None and len(st.session_state.rating_index.rated_recipes(user_id)) > 0
+    if SERVING_MODE in REQUEST_TIME_MODES and filter_type != "Matrix Factorization":
+        table, _ = get_neighbor_table(filter_type)
+        if table is None:
+            return False
+        # item-based scores only need ratings, user-based ones a trained user
+        if filter_type == "Item-Based":
+            return len(st.session_state.rating_index.rated_recipes(user_id)) > 0
+        return table.has_row(user_id)
+    topk_store, pred_store = get_prediction_stores(filter_type)
+    return any(store is not None and store.has_user(user_id) for store in (topk_store, pred_store))
+
+def getRecommendations(user_id, filter_type='User-Based', top_n=10, allowed=None):
+    """
+    {recipe_id: score} of the top_n unrated recipes of a user, best first. allowed
+    restricts them to a set of recipe ids, e.g. the matches of a search: the recipes
+    outside it are masked out of the score row before the top N are selected.
+    """
     # find all the recipes rated by the given user 
-    recipes_rated = list(reviews_df['recipe_id'].loc[reviews_df['user_id'] == user_id])
-    # select the row of predicted rating by the given user from the user_prediction dataframe
-    predicted_rating = pred_df.loc[pred_df['user_id'] == user_id].copy()
-    # drop the rated recipes columns and store the predicted rating of unrated recipes 
-    predicted_rating.drop(pred_df[recipes_rated], axis = 1, inplace = True)
-    # sort the predicted rating of recipes by the user column wise
-    unrated_recipes = predicted_rating.iloc[:,1:].sort_values(by = predicted_rating.index[0], axis = 1, ascending = False)
-    # Selects only the top N columns (recipes) with the highest predicted ratings.
-    # Converts the DataFrame into a list of dictionaries, where: Keys are recipe IDs. Values are predicted ratings.
-    dict_top_n = unrated_recipes.iloc[:, :top_n].to_dict(orient = 'records') 
-    return dict_top_n[0]
+    recipes_rated = st.session_state.rating_index.rated_recipes(user_id)
+    if filter_type == "Content-Based":
+        # the user's tag and ingredient profile against every recipe, from their current ratings
+        content_index = st.session_state.get("content_index")
+        scores = content_index.get_scores(*st.session_state.rating_index.user_ratings(user_id)) if content_index is not None else None
+        if scores is None:
+            return {}
+        return recommend(scores, content_index.recipe_ids, top_n, constraint_mask(content_index.recipe_index, recipes_rated, allowed))
+    # Select the appropriate prediction stores
+    topk_store, pred_store = get_prediction_stores(filter_type)
+    if SERVING_MODE in REQUEST_TIME_MODES and filter_type != "Matrix Factorization":
+        # sparse scores of this user only, new ratings count without retraining
+        table, score_user = get_neighbor_table(filter_type)
+        scores = score_user(table, st.session_state.rating_index, user_id) if table is not None else None
+        if scores is None:
+            return {}
+        return recommend(scores, table.recipe_ids, top_n, constraint_mask(table.recipe_index, recipes_rated, allowed))
+    # serve from the compact top-K artifact if it holds enough recipes,
+    # recipes rated after the last training and the ones outside allowed are filtered out here
+    top_k = topk_store.get_top_k(user_id) if (topk_store is not None and top_n <= topk_store.k) else None
+    if top_k is not None:
+        recipe_ids, scores = top_k
+        unrated = ~np.isin(recipe_ids, recipes_rated)
+        if allowed is not None:
+            unrated &= np.isin(recipe_ids, allowed)
+        if unrated.sum() >= top_n or len(recipe_ids) < topk_store.k:
+            return dict(zip(recipe_ids[unrated][:top_n].tolist(), scores[unrated][:top_n].tolist()))
+    # read only the row of predicted rating by the given user from the prediction store,
+    # mask the rated (and not allowed) recipes and select the top N unrated ones without sorting the whole row
+    scores = pred_store.get_scores(user_id) if pred_store is not None else None
+    if scores is None:
+        return {}
+    return recommend(scores, pred_store.recipe_ids, top_n, constraint_mask(pred_store.recipe_index, recipes_rated, allowed))
+
+def explain_recommendations(user_id, recipe_ids):
+    """
+    {recipe_id: names of the rated recipes that contributed most to its item-based score}
+    of recommended recipes. In the 'neighbors' mode they come from the recipe neighbor table
+    the scores were read from. The dense and ann scores use the similarities of all rated
+    recipes, which the pruned table does not hold, so there they come from the exact
+    similarities of the recipe vectors of the ANN index. Empty if that has not been trained.
+    """
+    if SERVING_MODE == "neighbors":
+        table, explain = st.session_state.get("item_neighbors"), item_based_explanations
+    else:
+        table, explain = st.session_state.get("item_ann"), ann_item_explanations
+    if table is None:
+        return {}
+    explanations = explain(table, st.session_state.rating_index, user_id, recipe_ids)
+    # the names of all the rated recipes named, with one catalog take
+    rated_ids = sorted({rated_id for rated in explanations.values() for rated_id in rated})
+    names = st.session_state.recipe_catalog.take(rated_ids, ["recipe_id", "name"])
+    names = dict(zip(names["recipe_id"].tolist(), names["name"].tolist()))
+    return {recipe_id: [names[rated_id] for rated_id in rated if rated_id in names] for recipe_id, rated in explanations.items()}
+
+def fold_in_rating(user_id, recipe_id):
+    """
+    Bring the served recommendations of a user up to date after they rated a recipe,
+    without retraining. In the dense serving mode, the change the rating makes to the
+    user's item-based predictions is added to their trained row and their top-K is
+    re-ranked from it. Their user-based row is kept: with the user similarities fixed,
+    their own ratings only move the recipes they rated, which are never recommended.
+    The request-time modes score from the current ratings already. Their factorization
+    embedding is re-solved against the fixed recipe embeddings. The updated rows are
+    published as overlays of the trained artifacts, which every process applies until
+    the next trained version.
+    """
+    rating_index = st.session_state.rating_index
+    folded = {}
+    if SERVING_MODE not in REQUEST_TIME_MODES:
+        table = st.session_state.get("item_neighbors")
+        topk_store, pred_store = get_prediction_stores("Item-Based")
+        delta = item_based_delta(table, rating_index, user_id, recipe_id) if table is not None else None
+        if delta is not None and pred_store is not None:
+            row = pred_store.get_scores(user_id)
+            # users trained without ratings start from an empty row
+            row = np.zeros(len(pred_store.recipe_ids)) if row is None else row.copy()
+            # align the delta with the columns of the prediction store
+            positions = table.recipe_index.to_index(pred_store.recipe_ids)
+            row[positions >= 0] += delta[positions[positions >= 0]]
+            pred_store.fold_in(user_id, row)
+            folded["item_pred"] = pred_store
+            if topk_store is not None:
+                recipes_rated = rating_index.rated_recipes(user_id)
+                top_k = recommend(row, pred_store.recipe_ids, topk_store.k, exclusion_mask(pred_store.recipe_index, recipes_rated))
+                topk_store.fold_in(user_id, np.fromiter(top_k.keys(), dtype=np.int64), np.fromiter(top_k.values(), dtype=np.float64))
+                folded["item_pred_topk"] = topk_store
+    mf_model = st.session_state.get("mf_model")
+    if mf_model is not None:
+        mf_model.fold_in(user_id, *rating_index.user_ratings(user_id))
+        folded["mf_model"] = mf_model
+    return publish_fold_ins(st.session_state.data_manifest, folded)
 
 def display_recipes(recommendations, filter_type, user_id):
-    recipes_df = st.session_state.recipes_df
-    recommended_recipes = []
-    for recipe_id in recommendations.keys():
-        recipe_details = recipes_df.loc[recipes_df["recipe_id"] == recipe_id, ["name", "minutes", "description"]]
-        if not recipe_details.empty:
-            name = recipe_details["name"].values[0]
-            minutes = recipe_details["minutes"].values[0]
-            description = recipe_details["description"].values[0]
-            recommended_recipes.append((name, minutes, description))
+    # fetch all recommended recipes from the catalog at once, in recommendation order
+    recipe_details = st.session_state.recipe_catalog.take(list(recommendations.keys()), ["recipe_id", "name", "minutes", "description"])
+    recommended_recipes = list(recipe_details.itertuples(index=False, name=None))
+    explanations = explain_recommendations(user_id, list(recommendations.keys())) if filter_type == "Item-Based" else {}
     # Select the appropriate prediction DataFrame
     if filter_type == "User-Based":
         st.write(f"Using User-Based Collaborative Filtering for User ID: {user_id}")
     elif filter_type == "Item-Based":
         st.write(f"Using Item-Based Collaborative Filtering for User ID: {user_id}")
+    elif filter_type == "Matrix Factorization":
+        st.write(f"Using Matrix Factorization for User ID: {user_id}")
+    elif filter_type == "Content-Based":
+        st.write(f"Using the tags and ingredients of the recipes rated by User ID: {user_id}")
     # Display recommendations
-    for idx, (name, minutes, description) in enumerate(recommended_recipes, start=1):
+    for idx, (recipe_id, name, minutes, description) in enumerate(recommended_recipes, start=1):
         st.subheader(f"Top {idx}: {name}")
+        if explanations.get(recipe_id):
+            st.write(f"💡 **Because you rated:** {', '.join(explanations[recipe_id])}")
         st.write(f"⏱ **Time Required:** {minutes} minutes")
         st.write(f"📖 **Description:** {description}")
         st.markdown("---")
@@ -53,12 +200,13 @@ def app():
     try:
         st.sidebar.header("Recipe Recommendation System")
         # Get the maximum user_id dynamically
-        max_user_id = st.session_state.user_pred_df["user_id"].max()
+        pred_store = st.session_state.user_pred_store
+        max_user_id = int(pred_store.user_ids.max() if pred_store is not None else st.session_state.rating_index.users.sorted_ids[-1])
 
         # Create a form in the sidebar
         with st.sidebar.form(key="recommendation_form"):
             userid = st.number_input("User ID", min_value=0, max_value=max_user_id, value=5, step=1)
-            filter_type = st.selectbox("Select Recommendation Type", ["User-Based", "Item-Based"])
+            filter_type = st.selectbox("Select Recommendation Type", ["User-Based", "Item-Based", "Matrix Factorization", "Content-Based"])
             n_items = st.number_input("Number of Recommendations", min_value=1, max_value=20, value=5, step=1)
 
             # Submit button (only triggers when clicked)
@@ -2,24 +2,12 @@ import streamlit as st
 import numpy as np
 import requests
 from recipe_display import show_recipe_description, view_recipe_callback
+from single_flight import SingleFlight
+from recipe_recommend import getRecommendations, has_predictions
 
-# check if all selected tags are present in the recipe
-def all_tags_present(item_tags, selected):
-    return all(string in item_tags for string in selected)
-
-
-# check if all ingredients are available in specific recipe
-def check_ingredients_df(row, selected):
-    ing_matched = row
-    # Join all ingredients into a single lowercase string
-    ing_str = ' '.join(str(ing).lower() for ing in ing_matched)
-    #check each item in ing_selected
-    for item in selected:
-        if item not in ing_str:
-            return False
-    # If we've made it through all items without returning False, return True
-    return True
-
+# matching recipes ranked for the user when "Rank for me" is chosen
+RANKED_RESULTS = 20
+RANK_OPTIONS = ["No", "User-Based", "Item-Based", "Matrix Factorization", "Content-Based"]
 
 def is_valid_image(url):
     """Check if the image URL is valid by sending a HEAD request."""
@@ -39,30 +27,48 @@ def handle_select_recipe(recipe):
     st.session_state.selected_recipe = recipe
     st.session_state.show_description = True
 
+@st.cache_resource
+def get_search_flight():
+    """Process-wide coalescing of identical searches running at the same time."""
+    return SingleFlight()
+
 # Filter out recipes to find a match base on the inputs tags, ingredients, max minutes, number of steps to cook
 def filter_recipes(tags_selected, ing_selected, max_minutes, max_steps):
-    recipes_df = st.session_state.recipes_df
-    ing_selected = ing_selected.split(',')
-    recipe_rec = recipes_df[['recipe_id', 'tags', 'ingredients', 'minutes', 'n_steps']].copy()
+    catalog = st.session_state.recipe_catalog
+    ing_selected = [item.strip() for item in ing_selected.split(',') if item.strip()]
+    # sessions searching the same query of the same catalog at once share one computation
+    key = (id(catalog), tuple(sorted(tags_selected or [])), tuple(ing_selected), max_minutes, max_steps)
+    return get_search_flight().do(key, lambda: match_recipes(catalog, tags_selected, ing_selected, max_minutes, max_steps))
+
+def match_recipes(catalog, tags_selected, ing_selected, max_minutes, max_steps):
+    recipes_df = catalog.listing
+    # every filter is a boolean mask over all recipes, tags and ingredients are
+    # flat list columns loaded from the catalog the first time someone searches
+    match = np.ones(len(recipes_df), dtype=bool)
     #Filter by tags
     if tags_selected:
-        recipe_rec['tag_match'] = recipe_rec['tags'].apply(all_tags_present, selected=tags_selected)
-        recipe_rec = recipe_rec[recipe_rec['tag_match'] == True]
-    #Filter by ingredients
+        match &= catalog.list_column('tags').rows_containing_all(tags_selected)
+    #Filter by ingredients, each entered ingredient has to be part of one of the recipe ingredients
     if ing_selected:
-        recipe_rec['ing_match'] = recipe_rec['ingredients'].apply(check_ingredients_df, selected=ing_selected)
-        recipe_rec = recipe_rec[recipe_rec['ing_match'] == True]
+        match &= catalog.list_column('ingredients').rows_matching_all(ing_selected)
     # Filter by maximum cooking time
     if max_minutes is not None:
-        recipe_rec = recipe_rec[recipe_rec['minutes'] <= max_minutes]
+        match &= recipes_df['minutes'].to_numpy() <= max_minutes
     # Filter by maximum number of steps
     if max_steps is not None:
-        recipe_rec = recipe_rec[recipe_rec['n_steps'] <= max_steps]
-    
-    recipe_id = recipe_rec['recipe_id'].values
-    recipe_steps_rec= recipes_df[recipes_df['recipe_id'].isin(recipe_id)][['recipe_id', 'name', 'description', 'minutes', 'n_steps', 'Images']]
+        match &= recipes_df['n_steps'].to_numpy() <= max_steps
+
+    recipe_steps_rec = recipes_df.loc[match, ['recipe_id', 'name', 'description', 'minutes', 'n_steps', 'image']]
     return recipe_steps_rec
 
+def rank_for_user(matches, user_id, filter_type, n=RANKED_RESULTS):
+    """
+    The n matching recipes the user is predicted to like most, best first: the
+    matches mask the user's score row, so only they compete for the top n.
+    """
+    recommendations = getRecommendations(user_id, filter_type, n, allowed=matches['recipe_id'].to_numpy())
+    return st.session_state.recipe_catalog.take(list(recommendations.keys()), matches.columns.tolist())
+
 # Improved Pagination function for recipes display recipes in pages with expander function
 def paginate_recipes(recipes, page_size=5, page_state_key="current_page"):
     total_recipes = len(recipes)
@@ -121,7 +127,7 @@ def paginate_recipes(recipes, page_size=5, page_state_key="current_page"):
                             border-radius: 8px;
                             overflow: hidden;
                         ">
-                            <img src="{recipe['Images'][0]}" 
+                            <img src="{recipe['image']}" 
                                  style="
                                     height: 100%;
                                     width: 100%;
@@ -209,6 +215,12 @@ def app():
                                                max_value=24,  # Set a max value based on your dataset
                                                value=None)  # Default value
 
+                # order the matches by the user's predicted ratings instead of the catalog order
+                rank_for = "No"
+                if st.session_state.logged_in:
+                    rank_for = st.selectbox('Rank for me', RANK_OPTIONS,
+                                            help=f'Show your {RANKED_RESULTS} best matching recipes for a recommendation type')
+
                 submit = st.form_submit_button('Search for matching Recipes')
 
             # after submission
@@ -219,7 +231,14 @@ def app():
                     st.session_state.search_results = None
                     st.session_state.matching_recipes_page = 1
                     st.session_state.show_description = False
-                    st.session_state.search_results = filter_recipes(tags_selected, ing_selected, max_minutes, max_steps)
+                    search_results = filter_recipes(tags_selected, ing_selected, max_minutes, max_steps)
+                    user_id = st.session_state.user_data.get('user_id') if st.session_state.logged_in else None
+                    if rank_for != "No" and not search_results.empty:
+                        if has_predictions(user_id, rank_for):
+                            search_results = rank_for_user(search_results, user_id, rank_for)
+                        else:
+                            st.info(f"No {rank_for} recommendations yet, rate a few recipes first. Showing all matches.")
+                    st.session_state.search_results = search_results
         with col2:
             # Display search results 
             if st.session_state.search_results is not None:
@@ -241,7 +260,7 @@ def app():
             with st.container(border=True):
                 # Use st.status for a persistent loading indicator
                 with st.spinner("Loading selected recipe details..."):
-                    recipe = st.session_state.recipes_df[st.session_state.recipes_df['recipe_id'] == st.session_state.selected_recipe["recipe_id"]].iloc[0]
+                    recipe = st.session_state.recipe_catalog.get(st.session_state.selected_recipe["recipe_id"])
                     st.subheader(f":green[{recipe['name']}]", divider='green', anchor='selected_recipe')
                     # Display selected recipe
                     show_recipe_description(recipe)
@@ -0,0 +1,70 @@
+import numpy as np
+import pandas as pd
+from prediction_store import top_k_from_scores
+
+
+def top_n_positions(scores, n, exclude=None):
+    """
+    Positions of the n highest scores of a 1-D score row, best first.
+    Positions set in the boolean exclude mask are skipped and NaN scores rank last.
+    argpartition selects the n best in O(R), only those n are sorted.
+    """
+    scores = np.asarray(scores)
+    positions = np.flatnonzero(~exclude) if exclude is not None else np.arange(len(scores))
+    values = scores[positions]
+    values = np.where(np.isnan(values), -np.inf, values)
+    n = min(n, len(positions))
+    if n <= 0:
+        return np.empty(0, dtype=np.int64)
+    if n < len(positions):
+        best = np.argpartition(-values, n - 1)[:n]
+    else:
+        best = np.arange(len(positions))
+    best = best[np.argsort(-values[best], kind='stable')]
+    return positions[best]
+
+
+def exclusion_mask(recipe_index, recipe_ids):
+    """Boolean mask over the columns of a score row, set for the given recipe ids (e.g. the rated ones)."""
+    exclude = np.zeros(len(recipe_index), dtype=bool)
+    positions = recipe_index.to_index(recipe_ids)
+    exclude[positions[positions >= 0]] = True
+    return exclude
+
+
+def constraint_mask(recipe_index, recipe_ids, allowed=None):
+    """
+    exclusion_mask of the given recipe ids (e.g. the rated ones), also set for every
+    column outside the allowed recipe ids (e.g. the matches of a search), None allows all.
+    """
+    exclude = exclusion_mask(recipe_index, recipe_ids)
+    if allowed is not None:
+        exclude |= ~exclusion_mask(recipe_index, allowed)
+    return exclude
+
+
+def recommend(scores, recipe_ids, n, exclude=None):
+    """{recipe_id: score} of the n best recipes of a score row, best first."""
+    positions = top_n_positions(scores, n, exclude)
+    return dict(zip(np.asarray(recipe_ids)[positions].tolist(), np.asarray(scores)[positions].tolist()))
+
+
+def recommend_block(store, rating_index, rows, n):
+    """
+    Top-n unrated recipes of a block of users in one matrix operation.
+    rows is a slice of row offsets of the prediction store, with the rows folded in
+    since training, rated recipes come from the rating index. Returns a long DataFrame (user_id, rank, recipe_id, score).
+    """
+    user_ids = store.user_ids_of(rows)
+    owners, rated_recipe_ids, _ = rating_index.pairs(user_ids)
+    cols = store.recipe_index.to_index(rated_recipe_ids)
+    found = cols >= 0
+    ids, scores = top_k_from_scores(store.block_scores(rows), store.recipe_ids, owners[found], cols[found], n)
+    ranks = np.broadcast_to(np.arange(1, ids.shape[1] + 1, dtype=np.int16), ids.shape)
+    valid = ids >= 0
+    return pd.DataFrame({
+        'user_id': np.broadcast_to(user_ids[:, None], ids.shape)[valid],
+        'rank': ranks[valid],
+        'recipe_id': ids[valid],
+        'score': scores[valid],
+    })
@@ -0,0 +1,90 @@
+import os
+import numpy as np
+from data_manifest import (
+    ManifestWatcher, OVERLAY_SUFFIX, create_manifest, overlay_entry, read_manifest,
+    stage_artifact, stage_file, update_manifest,
+)
+
+
+def write_array(values):
+    def write(path):
+        os.makedirs(path)
+        np.save(os.path.join(path, "values.npy"), np.asarray(values))
+    return write
+
+
+def write_text(text):
+    def write(path):
+        with open(path, "w") as f:
+            f.write(text)
+    return write
+
+
+def test_create_manifest_skips_missing(tmp_path):
+    (tmp_path / "reviews.feather").write_bytes(b"reviews")
+    manifest = create_manifest(tmp_path, {"reviews": "reviews.feather", "recipes": "missing.feather"})
+    assert list(manifest["datasets"]) == ["reviews"]
+    assert read_manifest(tmp_path) == manifest
+
+
+def test_staging_is_content_addressed(tmp_path):
+    first = stage_artifact(tmp_path, "item_pred", write_array([1, 2]))
+    again = stage_artifact(tmp_path, "item_pred", write_array([1, 2]))
+    other = stage_artifact(tmp_path, "item_pred", write_array([1, 3]))
+    assert first == again
+    assert first["path"] == "item_pred@" + first["sha256"][:12]
+    assert other["path"] != first["path"]
+    staged = stage_file(tmp_path, "reviews", ".feather", write_text("a"))
+    assert staged["path"].startswith("reviews@") and staged["path"].endswith(".feather")
+    # no staging leftovers
+    assert sorted(os.listdir(tmp_path)) == sorted([first["path"], other["path"], staged["path"]])
+
+
+def test_update_keeps_previous_version(tmp_path):
+    create_manifest(tmp_path, {})
+    entries, versions = [], []
+    for i in range(3):
+        entries.append(stage_file(tmp_path, "reviews", ".feather", write_text(str(i))))
+        versions.append(update_manifest(tmp_path, {"reviews": entries[-1]})["version"])
+    assert len(set(versions)) == 3
+    # the current and the previous version stay, the one before is deleted
+    assert read_manifest(tmp_path)["datasets"]["reviews"] == entries[2]
+    assert os.path.exists(tmp_path / entries[1]["path"])
+    assert not os.path.exists(tmp_path / entries[0]["path"])
+    # rolling back to the previous version restores the earlier manifest version
+    assert update_manifest(tmp_path, {"reviews": entries[1]})["version"] == versions[1]
+    assert os.path.exists(tmp_path / entries[2]["path"])
+
+
+def test_update_leaves_other_datasets(tmp_path):
+    create_manifest(tmp_path, {})
+    user_pred = stage_artifact(tmp_path, "user_pred", write_array([1]))
+    update_manifest(tmp_path, {"user_pred": user_pred})
+    for values in ([1], [2], [3]):
+        update_manifest(tmp_path, {"user_pred_topk": stage_artifact(tmp_path, "user_pred_topk", write_array(values))})
+    assert read_manifest(tmp_path)["datasets"]["user_pred"] == user_pred
+    assert os.path.exists(tmp_path / user_pred["path"])
+    assert len([name for name in os.listdir(tmp_path) if name.startswith("user_pred_topk@")]) == 2
+
+
+def test_overlay_entry_follows_base(tmp_path):
+    create_manifest(tmp_path, {})
+    base = stage_artifact(tmp_path, "item_pred", write_array([1]))
+    overlay = dict(stage_artifact(tmp_path, "item_pred" + OVERLAY_SUFFIX, write_array([9])), base=base["sha256"])
+    datasets = update_manifest(tmp_path, {"item_pred": base, "item_pred" + OVERLAY_SUFFIX: overlay})["datasets"]
+    assert overlay_entry(datasets, "item_pred") == overlay
+    # a retrain leaves the overlay of the old version unused
+    retrained = stage_artifact(tmp_path, "item_pred", write_array([2]))
+    datasets = update_manifest(tmp_path, {"item_pred": retrained})["datasets"]
+    assert overlay_entry(datasets, "item_pred") is None
+    assert overlay_entry(datasets, "user_pred") is None
+
+
+def test_watcher_sees_new_versions(tmp_path):
+    create_manifest(tmp_path, {})
+    watcher = ManifestWatcher(tmp_path, poll_interval=3600)
+    first = watcher.current()
+    manifest = update_manifest(tmp_path, {"reviews": stage_file(tmp_path, "reviews", ".feather", write_text("a"))})
+    # polled at most every poll_interval, unless refreshed
+    assert watcher.current() is first
+    assert watcher.refresh()["version"] == manifest["version"]
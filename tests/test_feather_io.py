@@ -0,0 +1,60 @@
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+import pytest
+from feather_io import CODECS, read_feather, write_feather
+
+
+def make_frame():
+    return pd.DataFrame({
+        "user_id": np.array([3, 1, 2, 5], dtype=np.int32),
+        "rating": np.array([5, 4, 0, 3], dtype=np.int8),
+        "score": np.array([0.5, np.nan, 1.25, 2.0]),
+        "name": ["a", "b", None, "d"],
+    })
+
+
+@pytest.mark.parametrize("codec", CODECS)
+def test_round_trip(tmp_path, codec):
+    df = make_frame()
+    write_feather(df, tmp_path / "df.feather", codec)
+    pd.testing.assert_frame_equal(read_feather(tmp_path / "df.feather"), df)
+
+
+def test_unknown_codec(tmp_path):
+    with pytest.raises(ValueError):
+        write_feather(make_frame(), tmp_path / "df.feather", "snappy")
+
+
+def test_uncompressed_columns_are_mapped(tmp_path):
+    write_feather(make_frame(), tmp_path / "df.feather", "uncompressed")
+    df = read_feather(tmp_path / "df.feather", columns=["user_id"])
+    assert not df["user_id"].to_numpy().flags.writeable
+
+
+@pytest.mark.parametrize("codec", CODECS)
+def test_stored_index_is_restored(tmp_path, codec):
+    # files written with the index kept, like the filtered reviews_df.feather
+    df = make_frame().iloc[[3, 1]]
+    table = pa.Table.from_pandas(df, preserve_index=True)
+    assert "__index_level_0__" in table.column_names
+    feather.write_feather(table, tmp_path / "df.feather", compression=codec)
+    restored = read_feather(tmp_path / "df.feather")
+    assert "__index_level_0__" not in restored.columns
+    pd.testing.assert_frame_equal(restored, df)
+
+
+def test_named_multi_index_is_restored(tmp_path):
+    df = make_frame().set_index(["user_id", "rating"])
+    feather.write_feather(pa.Table.from_pandas(df, preserve_index=True), tmp_path / "df.feather")
+    restored = read_feather(tmp_path / "df.feather")
+    pd.testing.assert_frame_equal(restored, df)
+
+
+def test_selected_columns_keep_index(tmp_path):
+    df = make_frame().iloc[[2, 0]]
+    feather.write_feather(pa.Table.from_pandas(df, preserve_index=True), tmp_path / "df.feather")
+    restored = read_feather(tmp_path / "df.feather", columns=["user_id", "__index_level_0__"])
+    assert list(restored.columns) == ["user_id"]
+    assert restored.index.tolist() == [2, 0]
@@ -0,0 +1,177 @@
+import os
+import numpy as np
+import pandas as pd
+import pytest
+import data_loader
+from data_manifest import ManifestWatcher, create_manifest, stage_artifact, update_manifest
+from dataset_registry import DatasetRegistry
+from factorization import FactorModel, save_factors
+from neighbor_index import DENSE_NORMS_FILE, NeighborTable, item_based_delta, item_based_scores, save_neighbors
+from prediction_store import PredictionStore, TopKStore, save_predictions, save_top_k
+from rating_index import RatingIndex
+
+N_USERS, N_RECIPES = 12, 40
+
+
+@pytest.fixture
+def ratings():
+    rng = np.random.default_rng(0)
+    reviews = pd.DataFrame({
+        'user_id': rng.integers(0, N_USERS, 150),
+        'recipe_id': rng.integers(0, N_RECIPES, 150) * 10,
+        'rating': rng.integers(1, 6, 150),
+    }).drop_duplicates(['user_id', 'recipe_id'])
+    return reviews
+
+
+def make_table(folder, reviews, k):
+    rng = np.random.default_rng(1)
+    similarity = rng.uniform(-0.2, 1, (N_RECIPES, N_RECIPES))
+    similarity = (similarity + similarity.T) / 2
+    # no recipe is its own neighbor in the table, so the dense sums leave it out too
+    np.fill_diagonal(similarity, 0)
+    recipe_ids = np.arange(N_RECIPES) * 10
+    recipe_means = reviews.groupby('recipe_id')['rating'].mean().reindex(recipe_ids, fill_value=0).to_numpy()
+    save_neighbors(folder, similarity, recipe_ids, recipe_ids, recipe_means, reviews['rating'].mean(), k)
+    return NeighborTable(folder), similarity
+
+
+def dense_scores(table, similarity, rating_index, user_id):
+    # the dense item-based prediction: centered ratings times the full similarity matrix
+    centered = np.zeros(N_RECIPES)
+    recipe_ids, ratings = rating_index.user_ratings(user_id)
+    if len(recipe_ids):
+        user_mean = np.mean(ratings)
+        positions = table.recipe_index.to_index(recipe_ids)
+        centered[positions] = ratings - (user_mean + table.recipe_means[positions] - table.global_mean)
+    return similarity.dot(centered) / np.abs(similarity).sum(axis=1)
+
+
+def unrated(rating_index, user_id):
+    rated = set(rating_index.rated_recipes(user_id).tolist())
+    return next(recipe_id for recipe_id in range(0, N_RECIPES * 10, 10) if recipe_id not in rated)
+
+
+@pytest.mark.parametrize("user_id", [0, 5, 99])
+def test_delta_matches_dense_recompute(tmp_path, ratings, user_id):
+    table, similarity = make_table(tmp_path / "item_neighbors", ratings, N_RECIPES - 1)
+    before = RatingIndex.from_reviews(ratings)
+    recipe_id = unrated(before, user_id)
+    after = before.with_rating(user_id, recipe_id, 5)
+    delta = item_based_delta(table, after, user_id, recipe_id)
+    expected = dense_scores(table, similarity, after, user_id) - dense_scores(table, similarity, before, user_id)
+    assert np.allclose(delta, expected, atol=1e-5)
+
+
+def test_delta_of_pruned_table(tmp_path, ratings):
+    table, _ = make_table(tmp_path / "item_neighbors", ratings, 5)
+    before = RatingIndex.from_reviews(ratings)
+    recipe_id = unrated(before, 3)
+    after = before.with_rating(3, recipe_id, 1)
+    delta = item_based_delta(table, after, 3, recipe_id)
+    # the pruned scores divide by the pruned sums, the delta by the dense ones
+    change = item_based_scores(table, after, 3) - item_based_scores(table, before, 3)
+    assert np.allclose(delta * table.dense_norms, change * table.norms, atol=1e-5)
+
+
+def test_delta_needs_dense_norms(tmp_path, ratings):
+    make_table(tmp_path / "item_neighbors", ratings, 5)
+    os.remove(tmp_path / "item_neighbors" / DENSE_NORMS_FILE)
+    table = NeighborTable(tmp_path / "item_neighbors")
+    rating_index = RatingIndex.from_reviews(ratings).with_rating(3, 10, 4)
+    assert item_based_delta(table, rating_index, 3, 10) is None
+
+
+def make_artifacts(folder):
+    rng = np.random.default_rng(2)
+    user_ids, recipe_ids = np.arange(N_USERS) * 7, np.arange(N_RECIPES) * 10
+    scores = rng.standard_normal((N_USERS, N_RECIPES))
+    save_predictions(folder / "pred", scores, user_ids, recipe_ids)
+    no_ratings = np.empty(0, dtype=np.int64)
+    save_top_k(folder / "topk", scores, user_ids, recipe_ids, no_ratings, no_ratings, 5)
+    save_factors(folder / "mf", rng.standard_normal((N_USERS, 4)), rng.standard_normal((N_RECIPES, 4)),
+                 user_ids, recipe_ids, np.full(N_RECIPES, 3.0), 3.0)
+    return PredictionStore(folder / "pred"), TopKStore(folder / "topk"), FactorModel(folder / "mf")
+
+
+def test_overlays_round_trip(tmp_path):
+    store, topk, model = make_artifacts(tmp_path)
+    row = np.linspace(-1, 1, N_RECIPES)
+    store.fold_in(14, row)
+    store.fold_in(1000, -row)
+    topk.fold_in(14, [30, 20], [2.5, 1.5])
+    model.fold_in(14, np.array([10, 20, 30]), np.array([5, 4, 1]))
+    model.fold_in(1000, np.array([10]), np.array([2]))
+    for artifact in (store, topk, model):
+        artifact.save_folded(tmp_path / f"{artifact.folder.name}_folded")
+    store2, topk2, model2 = make_artifacts(tmp_path)
+    for artifact in (store2, topk2, model2):
+        assert not artifact.has_folded()
+        artifact.load_folded(tmp_path / f"{artifact.folder.name}_folded")
+    assert np.allclose(store2.get_scores(14), row) and np.allclose(store2.get_scores(1000), -row)
+    assert np.array_equal(store2.get_scores(21), store.get_scores(21))
+    ids, scores = topk2.get_top_k(14)
+    assert ids.tolist() == [30, 20] and scores.tolist() == [2.5, 1.5]
+    assert np.allclose(model2.get_scores(14), model.get_scores(14))
+    assert np.allclose(model2.get_scores(1000), model.get_scores(1000))
+
+
+def test_load_folded_keeps_own_rows_unless_replace(tmp_path):
+    store, _, _ = make_artifacts(tmp_path)
+    store.fold_in(14, np.ones(N_RECIPES))
+    store.fold_in(21, np.ones(N_RECIPES))
+    store.save_folded(tmp_path / "overlay")
+    other, _, _ = make_artifacts(tmp_path)
+    other.fold_in(14, np.zeros(N_RECIPES))
+    other.load_folded(tmp_path / "overlay", replace=False)
+    assert np.all(other.get_scores(14) == 0) and np.all(other.get_scores(21) == 1)
+    other.load_folded(tmp_path / "overlay")
+    assert np.all(other.get_scores(14) == 1)
+
+
+def test_block_scores_use_folded_rows(tmp_path):
+    store, _, _ = make_artifacts(tmp_path)
+    trained = store.dequantize(slice(None))
+    store.fold_in(14, np.ones(N_RECIPES))
+    block = store.block_scores(slice(1, 4))
+    assert np.all(block[1] == 1)
+    assert np.array_equal(block[[0, 2]], trained[[1, 3]])
+
+
+def test_publish_fold_ins(tmp_path, monkeypatch):
+    data_folder = str(tmp_path / "data")
+    os.makedirs(data_folder)
+    create_manifest(data_folder, {})
+    watcher = ManifestWatcher(data_folder)
+    registries = [DatasetRegistry()]
+    monkeypatch.setattr(data_loader, "DATA_FOLDER", data_folder)
+    monkeypatch.setattr(data_loader, "get_manifest_watcher", lambda: watcher)
+    monkeypatch.setattr(data_loader, "get_registry", lambda: registries[-1])
+
+    def publish_store(seed):
+        rng = np.random.default_rng(seed)
+        entry = stage_artifact(data_folder, "item_pred", lambda path: save_predictions(
+            path, rng.standard_normal((N_USERS, N_RECIPES)), np.arange(N_USERS), np.arange(N_RECIPES)))
+        update_manifest(data_folder, {"item_pred": entry})
+        return watcher.refresh()
+
+    manifest = publish_store(0)
+    store = data_loader.load_prediction_store(manifest, "item_pred")
+    store.fold_in(3, np.ones(N_RECIPES))
+    manifest = data_loader.publish_fold_ins(manifest, {"item_pred": store, "item_pred_topk": None})
+    # another process, or the app after a restart, opens the store with the overlay
+    registries.append(DatasetRegistry())
+    reopened = data_loader.load_prediction_store(manifest, "item_pred")
+    assert reopened is not store
+    assert np.all(reopened.get_scores(3) == 1)
+    # rows folded in by another process meanwhile are kept
+    reopened.fold_in(4, np.zeros(N_RECIPES))
+    store.fold_in(5, np.ones(N_RECIPES))
+    manifest = data_loader.publish_fold_ins(manifest, {"item_pred": store})
+    registries.append(DatasetRegistry())
+    merged = data_loader.load_prediction_store(manifest, "item_pred")
+    assert np.all(merged.get_scores(3) == 1) and np.all(merged.get_scores(5) == 1)
+    # a retrain leaves the overlay unused
+    registries.append(DatasetRegistry())
+    retrained = data_loader.load_prediction_store(publish_store(1), "item_pred")
+    assert not retrained.has_folded()
@@ -0,0 +1,44 @@
+import pickle
+import numpy as np
+from id_map import IdMap, save_id_map, convert_pickle_mapping
+
+
+def test_round_trip_unsorted_ids():
+    raw_ids = np.array([537716, 24008, 1533, 87, 2002])
+    id_map = IdMap(raw_ids)
+    indices = id_map.to_index(raw_ids)
+    assert indices.tolist() == [0, 1, 2, 3, 4]
+    assert id_map.to_raw(indices).tolist() == raw_ids.tolist()
+    assert [id_map.index_of(raw_id) for raw_id in raw_ids] == [0, 1, 2, 3, 4]
+
+
+def test_misses():
+    id_map = IdMap(np.array([10, 30, 20]))
+    # below, between and above the known ids
+    assert id_map.to_index([5, 25, 99, 20]).tolist() == [-1, -1, -1, 2]
+    assert id_map.index_of(25) is None
+    assert id_map.index_of(99) is None
+    assert id_map.index_of(None) is None
+
+
+def test_empty_map():
+    id_map = IdMap(np.array([], dtype=np.int64))
+    assert id_map.index_of(1) is None
+    assert id_map.to_index([1, 2]).tolist() == [-1, -1]
+
+
+def test_save_and_load(tmp_path):
+    raw_ids = np.array([7, 3, 11])
+    save_id_map(tmp_path / "ids", raw_ids)
+    id_map = IdMap.load(tmp_path / "ids")
+    assert id_map.to_index([11, 3, 7, 4]).tolist() == [2, 1, 0, -1]
+
+
+def test_convert_pickle_mapping(tmp_path):
+    # the {raw id: index} dicts written by the old notebooks
+    with open(tmp_path / "mapping.pkl", "wb") as f:
+        pickle.dump({500: 1, 42: 0, 9000: 2}, f)
+    convert_pickle_mapping(tmp_path / "mapping.pkl", tmp_path / "ids")
+    id_map = IdMap.load(tmp_path / "ids")
+    assert id_map.to_raw([0, 1, 2]).tolist() == [42, 500, 9000]
+    assert id_map.to_index([500]).tolist() == [1]
@@ -0,0 +1,63 @@
+import numpy as np
+import pandas as pd
+import pytest
+from popularity import PopularityIndex
+
+
+def make_reviews(seed=0, n=2000):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'user_id': rng.integers(0, 300, n),
+        'recipe_id': rng.integers(0, 150, n) * 3,
+        'rating': rng.integers(0, 6, n),
+    })
+
+
+@pytest.mark.parametrize("k", [10, 500])
+def test_add_rating_matches_rebuild(k):
+    reviews = make_reviews()
+    index = PopularityIndex.from_reviews(reviews, k)
+    rng = np.random.default_rng(1)
+    # known recipes, and recipes reviewed for the first time
+    new = pd.DataFrame({
+        'user_id': rng.integers(0, 300, 500),
+        'recipe_id': rng.integers(0, 160, 500) * 3 + rng.integers(0, 2, 500),
+        'rating': rng.integers(0, 6, 500),
+    })
+    for recipe_id, rating in zip(new['recipe_id'].tolist(), new['rating'].tolist()):
+        index.add_rating(recipe_id, rating)
+    rebuilt = PopularityIndex.from_reviews(pd.concat([reviews, new]), k)
+    assert index.top(k).tolist() == rebuilt.top(k).tolist()
+    assert index.ranking_version() == rebuilt.ranking_version()
+    counts, averages = index.stats(rebuilt.recipe_ids)
+    expected_counts, expected_averages = rebuilt.stats(rebuilt.recipe_ids)
+    assert counts.tolist() == expected_counts.tolist()
+    assert np.allclose(averages, expected_averages)
+
+
+def test_top_matches_full_sort():
+    reviews = make_reviews()
+    index = PopularityIndex.from_reviews(reviews, 10)
+    stats = reviews.groupby('recipe_id')['rating'].agg(['count', 'mean'])
+    stats['score'] = stats['mean'] * np.log(stats['count'])
+    ranked = stats.reset_index().sort_values(['score', 'recipe_id'], ascending=[False, True])['recipe_id']
+    assert index.top(10).tolist() == ranked[:10].tolist()
+    # excluding most of the ranked recipes falls back to ranking all of them
+    exclude = ranked[:8].to_numpy()
+    assert index.top(5, exclude).tolist() == ranked[8:13].tolist()
+
+
+def test_ranking_version_follows_order():
+    index = PopularityIndex.from_reviews(make_reviews(), 5)
+    version = index.ranking_version()
+    top = index.top(5).tolist()
+    # a recipe outside the ranked ones gets a low rating
+    last = [recipe_id for recipe_id in index.recipe_ids.tolist() if recipe_id not in top][-1]
+    index.add_rating(last, 0)
+    assert index.top(5).tolist() == top
+    assert index.ranking_version() == version
+    # many top ratings move a recipe to the head of the list
+    for _ in range(200):
+        index.add_rating(last, 5)
+    assert index.top(1).tolist() == [last]
+    assert index.ranking_version() != version
@@ -0,0 +1,68 @@
+import numpy as np
+import pandas as pd
+from rating_index import RatingIndex
+
+
+def make_reviews(seed=0, n=300):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'user_id': rng.choice([5, 17, 2000, 31, 8, 99999], n),
+        'recipe_id': rng.integers(0, 80, n),
+        'rating': rng.integers(0, 6, n).astype(np.int8),
+    }).drop_duplicates(['user_id', 'recipe_id'])
+
+
+def assert_same_index(index, reviews):
+    for user_id, rows in reviews.groupby('user_id'):
+        rows = rows.sort_values('recipe_id')
+        recipe_ids, ratings = index.user_ratings(user_id)
+        assert recipe_ids.tolist() == rows['recipe_id'].tolist()
+        assert ratings.tolist() == rows['rating'].tolist()
+    assert len(index) == len(reviews)
+
+
+def test_from_reviews():
+    reviews = make_reviews()
+    index = RatingIndex.from_reviews(reviews)
+    assert_same_index(index, reviews)
+    assert index.rated_recipes(12345).tolist() == []
+    first = reviews.iloc[0]
+    assert index.has_rated(first['user_id'], first['recipe_id'])
+    assert not index.has_rated(first['user_id'], 1000)
+    assert not index.has_rated(12345, first['recipe_id'])
+
+
+def test_pairs():
+    reviews = make_reviews()
+    index = RatingIndex.from_reviews(reviews)
+    user_ids = np.array([31, 12345, 5, 31])
+    owners, recipe_ids, ratings = index.pairs(user_ids)
+    for position, user_id in enumerate(user_ids.tolist()):
+        mine = owners == position
+        expected_ids, expected_ratings = index.user_ratings(user_id)
+        assert recipe_ids[mine].tolist() == expected_ids.tolist()
+        assert ratings[mine].tolist() == expected_ratings.tolist()
+
+
+def test_with_rating_matches_rebuild():
+    reviews = make_reviews()
+    index = RatingIndex.from_reviews(reviews)
+    # new pairs of known users, a new user below, between and above the known ids, and a replaced rating
+    existing = reviews.iloc[3]
+    updates = [(5, 79, 3), (2000, 0, 5), (1, 10, 4), (50, 10, 2), (10 ** 6, 3, 1),
+               (int(existing['user_id']), int(existing['recipe_id']), 0)]
+    for user_id, recipe_id, rating in updates:
+        index = index.with_rating(user_id, recipe_id, rating)
+        reviews = pd.concat([reviews[(reviews['user_id'] != user_id) | (reviews['recipe_id'] != recipe_id)],
+                             pd.DataFrame({'user_id': [user_id], 'recipe_id': [recipe_id], 'rating': [rating]})])
+        assert_same_index(index, reviews)
+    assert_same_index(RatingIndex.from_reviews(reviews), reviews)
+
+
+def test_with_rating_leaves_original_unchanged():
+    reviews = make_reviews()
+    index = RatingIndex.from_reviews(reviews)
+    existing = reviews.iloc[0]
+    index.with_rating(existing['user_id'], existing['recipe_id'], 5 - existing['rating'])
+    index.with_rating(7, 1, 5)
+    assert_same_index(index, reviews)
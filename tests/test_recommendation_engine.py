@@ -0,0 +1,93 @@
+import numpy as np
+import pandas as pd
+import pytest
+from benchmark import engine_recommendations, legacy_recommendations
+from id_map import IdMap
+from prediction_store import PredictionStore, save_predictions, top_k_from_scores
+from rating_index import RatingIndex
+from recommendation_engine import constraint_mask, exclusion_mask, recommend, recommend_block, top_n_positions
+
+
+@pytest.fixture
+def store(tmp_path):
+    rng = np.random.default_rng(0)
+    recipe_ids = rng.choice(100000, 300, replace=False)
+    save_predictions(tmp_path / "pred", rng.standard_normal((40, 300)), np.arange(100, 140), recipe_ids)
+    return PredictionStore(tmp_path / "pred")
+
+
+@pytest.mark.parametrize("top_n", [1, 10, 295, 500])
+def test_parity_with_drop_and_sort(store, top_n):
+    rng = np.random.default_rng(top_n)
+    for user_id in store.user_ids_of(slice(None)).tolist():
+        rated = rng.choice(store.recipe_ids, 5, replace=False).tolist()
+        legacy = legacy_recommendations(store, user_id, rated, top_n)
+        engine = engine_recommendations(store, user_id, rated, top_n)
+        assert list(engine) == list(legacy)
+        assert np.allclose(list(engine.values()), list(legacy.values()))
+
+
+def test_top_n_positions_nan_ranks_last():
+    scores = np.array([0.5, np.nan, 3.0, 1.0, np.nan])
+    assert top_n_positions(scores, 3).tolist() == [2, 3, 0]
+    assert top_n_positions(scores, 5)[:3].tolist() == [2, 3, 0]
+    assert top_n_positions(scores, 0).tolist() == []
+
+
+def test_top_n_positions_exclusion():
+    scores = np.array([5.0, 4.0, 3.0, 2.0, 1.0])
+    exclude = np.array([True, False, True, False, False])
+    assert top_n_positions(scores, 2, exclude).tolist() == [1, 3]
+    assert top_n_positions(scores, 10, exclude).tolist() == [1, 3, 4]
+    assert top_n_positions(scores, 3, np.ones(5, dtype=bool)).tolist() == []
+
+
+def test_masks_ignore_unknown_ids():
+    recipe_index = IdMap(np.array([30, 10, 20]))
+    assert exclusion_mask(recipe_index, [10, 99]).tolist() == [False, True, False]
+    assert exclusion_mask(recipe_index, []).tolist() == [False, False, False]
+    # outside the allowed ids or rated
+    assert constraint_mask(recipe_index, [10], allowed=[10, 20, 99]).tolist() == [True, True, False]
+
+
+def test_recommend_maps_ids():
+    scores = np.array([0.1, 0.9, 0.5])
+    assert recommend(scores, [7, 8, 9], 2) == {8: 0.9, 9: 0.5}
+    assert recommend(scores, [7, 8, 9], 2, np.array([False, True, False])) == {9: 0.5, 7: 0.1}
+
+
+def test_top_k_from_scores_matches_per_row(store):
+    rng = np.random.default_rng(1)
+    rows = rng.integers(0, len(store), 200)
+    cols = rng.integers(0, len(store.recipe_ids), 200)
+    ids, scores = top_k_from_scores(store.matrix, store.recipe_ids, rows, cols, 15)
+    for row in range(len(store)):
+        exclude = np.zeros(len(store.recipe_ids), dtype=bool)
+        exclude[cols[rows == row]] = True
+        expected = recommend(store.dequantize(row), store.recipe_ids, 15, exclude)
+        assert ids[row].tolist() == list(expected)
+        assert np.allclose(scores[row], list(expected.values()))
+
+
+def test_top_k_from_scores_pads_short_rows():
+    scores = np.array([[1.0, 2.0, 3.0], [3.0, np.nan, 1.0]])
+    ids, top_scores = top_k_from_scores(scores, [10, 20, 30], [0, 0], [2, 0], 3)
+    assert ids.tolist() == [[20, -1, -1], [10, 30, -1]]
+    assert np.isnan(top_scores[0, 1:]).all() and np.isnan(top_scores[1, 2])
+
+
+def test_recommend_block_matches_per_user(store):
+    rng = np.random.default_rng(2)
+    user_ids = store.user_ids_of(slice(None))
+    reviews = pd.DataFrame({
+        'user_id': rng.choice(user_ids, 120),
+        'recipe_id': rng.choice(store.recipe_ids, 120),
+        'rating': rng.integers(0, 6, 120),
+    }).drop_duplicates(['user_id', 'recipe_id'])
+    rating_index = RatingIndex.from_reviews(reviews)
+    block = recommend_block(store, rating_index, slice(5, 25), 10)
+    for user_id, rows in block.groupby('user_id'):
+        exclude = exclusion_mask(store.recipe_index, rating_index.rated_recipes(user_id))
+        expected = recommend(store.get_scores(user_id), store.recipe_ids, 10, exclude)
+        assert rows.sort_values('rank')['recipe_id'].tolist() == list(expected)
+    assert sorted(block['user_id'].unique().tolist()) == user_ids[5:25].tolist()